@@ -0,0 +1,362 @@
+"""\
+@file compression.py
+@author Donovan Preston
+
+Copyright (c) 2024, Donovan Preston
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import asyncio
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# Responses with smaller bodies are sent uncompressed
+COMPRESSION_MIN_SIZE = 1024
+
+COMPRESSION_LEVEL = 6
+
+# A streamed compressed body is flushed to the client once this much input
+# has been compressed since the last flush, or once compressed input has
+# waited COMPRESSION_FLUSH_DELAY seconds. Flushing ends a deflate block, so
+# flushing every small chunk would make the body larger than the input.
+COMPRESSION_FLUSH_SIZE = 16 * 1024
+COMPRESSION_FLUSH_DELAY = 0.05
+
+# Content types that are already compressed, or that are streamed to the
+# client as events and must not be held back by a compressor
+UNCOMPRESSIBLE_PREFIXES = ('image/', 'video/', 'audio/', 'font/woff')
+UNCOMPRESSIBLE_TYPES = frozenset([
+    'application/gzip',
+    'application/x-gzip',
+    'application/zip',
+    'application/zstd',
+    'application/x-brotli',
+    'application/pdf',
+    'application/octet-stream',
+    'text/event-stream',
+])
+COMPRESSIBLE_TYPES = frozenset(['image/svg+xml'])
+
+
+class Encoder(object):
+    """Incremental zlib compression for one response body."""
+
+    name: str = 'deflate'
+
+    wbits: int = zlib.MAX_WBITS
+
+    def __init__(self, level: int = COMPRESSION_LEVEL) -> None:
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, self.wbits)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress data, returning whatever output is ready. The rest is
+        held until the next flush."""
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Return the output for everything compressed so far, so the client
+        can decode what it has received."""
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b'') -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_FINISH)
+
+
+class GzipEncoder(Encoder):
+    name = 'gzip'
+    wbits = 16 + zlib.MAX_WBITS
+
+
+class BrotliEncoder(Encoder):
+    """brotli, if installed."""
+
+    name = 'br'
+
+    def __init__(self, level: int = COMPRESSION_LEVEL) -> None:
+        import brotli
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+    def finish(self, data: bytes = b'') -> bytes:
+        return self.compressor.process(data) + self.compressor.finish()
+
+
+ENCODERS: Dict[str, type[Encoder]] = {
+    'br': BrotliEncoder,
+    'gzip': GzipEncoder,
+    'deflate': Encoder,
+}
+
+# Encodings in order of preference when the client accepts several equally
+PREFERRED_ENCODINGS: List[str] = ['br', 'gzip', 'deflate']
+
+
+def available_encodings() -> List[str]:
+    """Return the names in PREFERRED_ENCODINGS whose encoder can be created."""
+    result = []
+    for name in PREFERRED_ENCODINGS:
+        try:
+            ENCODERS[name]()
+        except ImportError:
+            continue
+        result.append(name)
+    return result
+
+
+def negotiate_encoding(headers: List[Tuple[bytes, bytes]], available: List[str]) -> Optional[str]:
+    """Pick the content coding for a request from its Accept-Encoding header.
+
+    Returns the available encoding with the highest q-value, ties broken by
+    the order of `available`, or None to send the body as it is.
+    """
+    accept = None
+    for (key, value) in headers:
+        if key.lower() == b'accept-encoding':
+            accept = value.decode('latin-1')
+    if not accept:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            weights[name] = q
+    best = None
+    best_q = 0.0
+    for name in available:
+        q = weights.get(name, weights.get('*', 0.0))
+        if q > best_q:
+            best = name
+            best_q = q
+    return best
+
+
+def is_compressible(content_type: bytes) -> bool:
+    mime = content_type.split(b';')[0].strip().lower().decode('latin-1')
+    if mime in COMPRESSIBLE_TYPES:
+        return True
+    if mime in UNCOMPRESSIBLE_TYPES:
+        return False
+    return not mime.startswith(UNCOMPRESSIBLE_PREFIXES)
+
+
+class CompressingSend(object):
+    """An ASGI send callable that compresses response bodies.
+
+    The start message is held until COMPRESSION_MIN_SIZE bytes of body have
+    arrived or the body ends, so short responses go out unchanged. If
+    `flush_delay` is not None, a held body that has waited that many seconds
+    is sent uncompressed, so a slow stream is not held back. Responses
+    that are already encoded, are not compressible, are sent with pathsend
+    or zerocopysend, or have no body are passed through. Later body
+    messages are compressed as they arrive, and the output is flushed once
+    `flush_size` bytes of input are waiting in the compressor, or, if
+    `flush_delay` is not None, once input has waited that many seconds, so
+    slow streamed responses still reach the client. Strong ETags on
+    compressed responses are made weak.
+    """
+
+    def __init__(
+        self, send: Callable, encoding: str, min_size: int = COMPRESSION_MIN_SIZE,
+        flush_size: int = COMPRESSION_FLUSH_SIZE, flush_delay: Optional[float] = COMPRESSION_FLUSH_DELAY
+    ) -> None:
+        self.send = send
+        self.encoding = encoding
+        self.min_size = min_size
+        self.flush_size = flush_size
+        self.flush_delay = flush_delay
+        self.start: Optional[Dict[str, Any]] = None
+        self.pending: List[bytes] = []
+        self.pending_size = 0
+        self.encoder: Optional[Encoder] = None
+        self.passthrough = False
+        # Bytes compressed since the last flush
+        self.unflushed = 0
+        self.lock = asyncio.Lock()
+        self.timer: Optional[asyncio.Task[None]] = None
+
+    async def __call__(self, message: Dict[str, Any]) -> None:
+        if self.passthrough:
+            await self.send(message)
+            return
+        if self.encoder is None:
+            self._cancel_timer()
+            async with self.lock:
+                if not self.passthrough:
+                    await self.hold(message)
+                    return
+            # The held body was released while this message waited
+            await self.send(message)
+            return
+        if message['type'] != 'http.response.body':
+            await self.send(message)
+            return
+        if message.get('more_body', False):
+            await self.compress(message.get('body', b''))
+        else:
+            await self.finish(message.get('body', b''))
+
+    async def hold(self, message: Dict[str, Any]) -> None:
+        """Handle a message that arrives before compression has begun."""
+        if message['type'] == 'http.response.start':
+            if self.should_compress(message):
+                self.start = message
+            else:
+                self.passthrough = True
+                await self.send(message)
+            return
+        if message['type'] != 'http.response.body':
+            await self.release()
+            await self.send(message)
+            return
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        self.pending.append(body)
+        self.pending_size += len(body)
+        if self.pending_size >= self.min_size:
+            await self.begin(more_body)
+        elif not more_body:
+            await self.release(more_body=False)
+        elif self.pending_size and self.flush_delay is not None:
+            self.timer = asyncio.create_task(self._release_later(self.flush_delay))
+
+    def should_compress(self, start: Dict[str, Any]) -> bool:
+        status = start.get('status', 200)
+        if status < 200 or status in (204, 304):
+            return False
+        content_type = b''
+        for (key, value) in start.get('headers', []):
+            key = key.lower()
+            if key == b'content-encoding':
+                return False
+            if key == b'content-type':
+                content_type = value
+        return is_compressible(content_type)
+
+    async def begin(self, more_body: bool) -> None:
+        """Send the held start message with compression headers, and the
+        body received so far, compressed."""
+        assert self.start is not None
+        self.encoder = ENCODERS[self.encoding]()
+        headers = []
+        for (key, value) in self.start.get('headers', []):
+            key = key.lower()
+            if key == b'content-length':
+                continue
+            if key == b'etag' and not value.startswith(b'W/'):
+                # The compressed body is no longer byte-for-byte the one
+                # a strong ETag names
+                value = b'W/' + value
+            headers.append((key, value))
+        headers.append((b'content-encoding', self.encoding.encode('ascii')))
+        headers.append((b'vary', b'accept-encoding'))
+        await self.send(dict(self.start, headers=headers))
+        body = b''.join(self.pending)
+        self.pending = []
+        if more_body:
+            await self._compress(body)
+        else:
+            await self._finish(body)
+
+    async def compress(self, body: bytes) -> None:
+        """Compress a body message that is not the last, sending what the
+        encoder has ready, and flushing at the size or time boundaries."""
+        async with self.lock:
+            await self._compress(body)
+
+    async def finish(self, body: bytes) -> None:
+        async with self.lock:
+            await self._finish(body)
+
+    async def _compress(self, body: bytes) -> None:
+        assert self.encoder is not None
+        data = self.encoder.compress(body)
+        self.unflushed += len(body)
+        if self.unflushed >= self.flush_size:
+            self._cancel_timer()
+            data += self.encoder.flush()
+            self.unflushed = 0
+        elif self.unflushed and self.timer is None and self.flush_delay is not None:
+            self.timer = asyncio.create_task(self._flush_later(self.flush_delay))
+        if data:
+            await self._send_body(data, True)
+
+    async def _finish(self, body: bytes) -> None:
+        assert self.encoder is not None
+        self._cancel_timer()
+        await self._send_body(self.encoder.finish(body), False)
+
+    async def _release_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        async with self.lock:
+            # Cleared before sending, so the send is never cancelled halfway
+            self.timer = None
+            await self.release()
+
+    async def _flush_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        assert self.encoder is not None
+        async with self.lock:
+            # Cleared before sending, so the send is never cancelled halfway
+            self.timer = None
+            self.unflushed = 0
+            await self._send_body(self.encoder.flush(), True)
+
+    def _cancel_timer(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    async def _send_body(self, body: bytes, more_body: bool) -> None:
+        await self.send({
+            'type': 'http.response.body',
+            'body': body,
+            'more_body': more_body,
+        })
+
+    async def release(self, more_body: bool = True) -> None:
+        """Send the held start message and body unchanged, and stop
+        compressing this response."""
+        if self.start is not None:
+            await self.send(self.start)
+            if self.pending or not more_body:
+                await self.send({
+                    'type': 'http.response.body',
+                    'body': b''.join(self.pending),
+                    'more_body': more_body,
+                })
+            self.pending = []
+        # Set last, so later messages wait for the lock rather than overtake
+        # the held ones
+        self.passthrough = True
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any, Callable
+
+COMPRESSION_MIN_SIZE: int
+COMPRESSION_LEVEL: int
+COMPRESSION_FLUSH_SIZE: int
+COMPRESSION_FLUSH_DELAY: float
+UNCOMPRESSIBLE_PREFIXES: tuple[str, ...]
+UNCOMPRESSIBLE_TYPES: frozenset[str]
+COMPRESSIBLE_TYPES: frozenset[str]
+
+class Encoder:
+    name: str
+    wbits: int
+    compressor: Any
+    def __init__(self, level: int = ...) -> None: ...
+    def compress(self, data: bytes) -> bytes: ...
+    def flush(self) -> bytes: ...
+    def finish(self, data: bytes = b'') -> bytes: ...
+
+class GzipEncoder(Encoder):
+    name: str
+    wbits: int
+
+class BrotliEncoder(Encoder):
+    name: str
+    compressor: Any
+    def __init__(self, level: int = ...) -> None: ...
+    def compress(self, data: bytes) -> bytes: ...
+    def flush(self) -> bytes: ...
+    def finish(self, data: bytes = b'') -> bytes: ...
+
+ENCODERS: dict[str, type[Encoder]]
+PREFERRED_ENCODINGS: list[str]
+
+def available_encodings() -> list[str]: ...
+def negotiate_encoding(headers: list[tuple[bytes, bytes]], available: list[str]) -> str | None: ...
+def is_compressible(content_type: bytes) -> bool: ...
+
+class CompressingSend:
+    send: Callable
+    encoding: str
+    min_size: int
+    flush_size: int
+    flush_delay: float | None
+    start: dict[str, Any] | None
+    pending: list[bytes]
+    pending_size: int
+    encoder: Encoder | None
+    passthrough: bool
+    unflushed: int
+    lock: asyncio.Lock
+    timer: asyncio.Task[None] | None
+    def __init__(
+        self, send: Callable, encoding: str, min_size: int = ..., flush_size: int = ...,
+        flush_delay: float | None = ...) -> None: ...
+    async def __call__(self, message: dict[str, Any]) -> None: ...
+    def should_compress(self, start: dict[str, Any]) -> bool: ...
+    async def hold(self, message: dict[str, Any]) -> None: ...
+    async def begin(self, more_body: bool) -> None: ...
+    async def compress(self, body: bytes) -> None: ...
+    async def finish(self, body: bytes) -> None: ...
+    async def release(self, more_body: bool = True) -> None: ...
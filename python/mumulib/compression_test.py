@@ -0,0 +1,314 @@
+import coverage  # pragma: no cover
+
+cov = coverage.Coverage(branch=True)  # pragma: no cover
+cov.start()  # pragma: no cover
+
+import asyncio  # pragma: no cover
+import gzip  # pragma: no cover
+import json  # pragma: no cover
+import unittest  # pragma: no cover
+import zlib  # pragma: no cover
+
+from mumulib import compression  # pragma: no cover
+from mumulib.compression import (  # pragma: no cover
+    available_encodings,
+    CompressingSend,
+    ENCODERS,
+    Encoder,
+    is_compressible,
+    negotiate_encoding,
+)
+from mumulib.server import consumers_app, EventSource  # pragma: no cover
+
+
+def start_message(content_type=b'application/json', headers=()):  # pragma: no cover
+    return {
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', content_type)] + list(headers),
+    }
+
+
+def body_message(body, more_body=True):  # pragma: no cover
+    return {'type': 'http.response.body', 'body': body, 'more_body': more_body}
+
+
+class TestNegotiateEncoding(unittest.TestCase):
+    """Test negotiate_encoding function"""
+
+    def test_preference_order(self):
+        headers = [(b'Accept-Encoding', b'deflate, gzip')]
+        self.assertEqual(negotiate_encoding(headers, ['gzip', 'deflate']), 'gzip')
+        self.assertEqual(negotiate_encoding(headers, ['deflate']), 'deflate')
+
+    def test_q_values(self):
+        headers = [(b'accept-encoding', b'gzip;q=0.5, deflate;q=0.8, br;q=bad')]
+        self.assertEqual(negotiate_encoding(headers, ['br', 'gzip', 'deflate']), 'deflate')
+        headers = [(b'accept-encoding', b'*;q=0.1, gzip;q=0')]
+        self.assertEqual(negotiate_encoding(headers, ['gzip', 'deflate']), 'deflate')
+
+    def test_none(self):
+        self.assertIsNone(negotiate_encoding([], ['gzip']))
+        self.assertIsNone(negotiate_encoding([(b'accept-encoding', b'identity')], ['gzip']))
+        self.assertIsNone(negotiate_encoding([(b'accept-encoding', b'gzip, ,')], []))
+
+    def test_available(self):
+        class MissingEncoder(Encoder):
+            def __init__(self):
+                raise ImportError("not installed")
+
+        original = list(compression.PREFERRED_ENCODINGS)
+        ENCODERS['missing'] = MissingEncoder
+        compression.PREFERRED_ENCODINGS[:] = ['missing', 'gzip']
+        try:
+            self.assertEqual(available_encodings(), ['gzip'])
+        finally:
+            compression.PREFERRED_ENCODINGS[:] = original
+            del ENCODERS['missing']
+
+    def test_is_compressible(self):
+        self.assertTrue(is_compressible(b'text/html; charset=UTF-8'))
+        self.assertTrue(is_compressible(b'image/svg+xml'))
+        self.assertFalse(is_compressible(b'image/png'))
+        self.assertFalse(is_compressible(b'text/event-stream; charset=UTF-8'))
+
+
+class TestCompressingSend(unittest.TestCase):
+    """Test CompressingSend against recorded messages"""
+
+    async def run_messages(self, messages, encoding='gzip', min_size=16, **kwargs):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        compressing = CompressingSend(send, encoding, min_size, **kwargs)
+        for message in messages:
+            await compressing(message)
+        return sent
+
+    async def async_test_streamed(self):
+        """Test that the output is flushed at size boundaries and the whole body decodes"""
+        chunks = [b'{"a": ' + b'1' * 40, b', "b": ' + b'2' * 40, b', "c": 3', b'}']
+        start = start_message(headers=[(b'etag', b'"x"'), (b'content-length', b'99')])
+        sent = await self.run_messages(
+            [start, *[body_message(c) for c in chunks], body_message(b'', False)], flush_size=80)
+        headers = dict(sent[0]['headers'])
+        self.assertEqual(headers[b'content-encoding'], b'gzip')
+        self.assertEqual(headers[b'vary'], b'accept-encoding')
+        self.assertEqual(headers[b'etag'], b'W/"x"')
+        self.assertNotIn(b'content-length', headers)
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # The first two chunks reach the flush size, and decode before the end
+        flushed = b''.join(m['body'] for m in sent[1:-1])
+        self.assertEqual(decompressor.decompress(flushed), chunks[0] + chunks[1])
+        self.assertFalse(sent[-1]['more_body'])
+        body = b''.join(m['body'] for m in sent[1:])
+        self.assertEqual(gzip.decompress(body), b''.join(chunks))
+
+    def test_streamed(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_streamed())
+
+    async def async_test_small_chunks(self):
+        """Test that many small chunks compress about as well as one body"""
+        body = b''.join(b'{"id": %d, "name": "item %d"}, ' % (i, i) for i in range(2000))
+        chunks = [body[i:i + 20] for i in range(0, len(body), 20)]
+        sent = await self.run_messages(
+            [start_message(), *[body_message(c) for c in chunks], body_message(b'', False)], flush_delay=None)
+        streamed = b''.join(m['body'] for m in sent[1:])
+        self.assertEqual(gzip.decompress(streamed), body)
+        self.assertLess(len(sent), len(chunks) // 10)
+        self.assertLess(len(streamed), len(gzip.compress(body)) * 1.1)
+
+    def test_small_chunks(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_small_chunks())
+
+    async def async_test_flush_delay(self):
+        """Test that compressed input is flushed after the delay"""
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        compressing = CompressingSend(send, 'deflate', 16, flush_delay=0.01)
+        await compressing(start_message())
+        await compressing(body_message(b'x' * 100))
+        await asyncio.sleep(0.1)
+        self.assertEqual(zlib.decompressobj().decompress(b''.join(m['body'] for m in sent[1:])), b'x' * 100)
+        self.assertIsNone(compressing.timer)
+        await compressing(body_message(b'y' * 100))
+        await compressing(body_message(b'', False))
+        self.assertIsNone(compressing.timer)
+        self.assertEqual(zlib.decompress(b''.join(m['body'] for m in sent[1:])), b'x' * 100 + b'y' * 100)
+
+    def test_flush_delay(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_flush_delay())
+
+    async def async_test_held_body_delay(self):
+        """Test that a small streamed body is sent uncompressed after the
+        delay, rather than held until more arrives"""
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        compressing = CompressingSend(send, 'gzip', flush_delay=0.01)
+        start = start_message()
+        await compressing(start)
+        await compressing(body_message(b'data: 19 bytes here'))
+        await asyncio.sleep(0.1)
+        self.assertEqual(sent, [start, body_message(b'data: 19 bytes here')])
+        self.assertIsNone(compressing.timer)
+        await compressing(body_message(b'x' * 2000))
+        await compressing(body_message(b'', False))
+        self.assertEqual(sent[2:], [body_message(b'x' * 2000), body_message(b'', False)])
+
+        sent.clear()
+        compressing = CompressingSend(send, 'gzip', 16, flush_delay=0.01)
+        await compressing(start)
+        await compressing(body_message(b'small'))
+        await compressing(body_message(b'x' * 100))
+        await asyncio.sleep(0.1)
+        await compressing(body_message(b'', False))
+        trailers = {'type': 'http.response.trailers', 'headers': [], 'more_trailers': False}
+        await compressing(trailers)
+        self.assertEqual(dict(sent[0]['headers'])[b'content-encoding'], b'gzip')
+        self.assertIs(sent[-1], trailers)
+        self.assertEqual(gzip.decompress(b''.join(m['body'] for m in sent[1:-1])), b'small' + b'x' * 100)
+
+        sent.clear()
+
+        async def slow_send(message):
+            await asyncio.sleep(0.1)
+            sent.append(message)
+
+        compressing = CompressingSend(slow_send, 'gzip', flush_delay=0.01)
+        await compressing(start)
+        await compressing(body_message(b'first'))
+        # The delay has passed, and the held messages are being sent
+        await asyncio.sleep(0.05)
+        await compressing(body_message(b'second', False))
+        self.assertIs(sent[0], start)
+        self.assertEqual(b''.join(m['body'] for m in sent[1:]), b'firstsecond')
+        self.assertFalse(sent[-1]['more_body'])
+
+    def test_held_body_delay(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_held_body_delay())
+
+    async def async_test_small_and_skipped(self):
+        """Test that small, compressed and bodiless responses are unchanged"""
+        small = [start_message(), body_message(b'{}', False)]
+        self.assertEqual(await self.run_messages(small), small)
+
+        png = [start_message(b'image/png'), body_message(b'x' * 100, False)]
+        self.assertEqual(await self.run_messages(png), png)
+
+        encoded = [start_message(headers=[(b'content-encoding', b'br')]), body_message(b'x' * 100, False)]
+        self.assertEqual(await self.run_messages(encoded), encoded)
+
+        not_modified = [dict(start_message(), status=304), body_message(b'', False)]
+        self.assertEqual(await self.run_messages(not_modified), not_modified)
+
+    def test_small_and_skipped(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_small_and_skipped())
+
+    async def async_test_pathsend(self):
+        """Test that pathsend releases the held start message"""
+        pathsend = {'type': 'http.response.pathsend', 'path': '/tmp/x'}
+        messages = [start_message(b'text/plain'), pathsend]
+        self.assertEqual(await self.run_messages(messages), messages)
+
+    def test_pathsend(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_pathsend())
+
+    async def async_test_single_message(self):
+        """Test a body large enough to compress that ends in one message"""
+        body = b'hello ' * 100
+        sent = await self.run_messages([start_message(b'text/html'), body_message(body, False)], 'deflate')
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(zlib.decompress(sent[1]['body']), body)
+
+    def test_single_message(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_single_message())
+
+
+class TestConsumersAppCompression(unittest.TestCase):
+    """Test compression in consumers_app"""
+
+    async def request(self, app, path, headers):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}  # pragma: no cover
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': headers, 'state': {}}
+        await app(scope, receive, send)
+        return sent
+
+    async def async_test_json(self):
+        data = {"items": list(range(2000))}
+        app = consumers_app({"data.json": data}, compression=True)
+        sent = await self.request(app, '/data.json', [(b'accept-encoding', b'gzip')])
+        self.assertEqual(dict(sent[0]['headers'])[b'content-encoding'], b'gzip')
+        body = b''.join(m['body'] for m in sent[1:])
+        self.assertEqual(json.loads(gzip.decompress(body)), data)
+        self.assertLess(len(body), len(json.dumps(data)) // 2)
+
+        plain = await self.request(app, '/data.json', [])
+        self.assertNotIn(b'content-encoding', dict(plain[0]['headers']))
+
+        uncompressed = consumers_app({"data.json": data})
+        sent = await self.request(uncompressed, '/data.json', [(b'accept-encoding', b'gzip')])
+        self.assertNotIn(b'content-encoding', dict(sent[0]['headers']))
+
+    def test_json(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_json())
+
+    async def async_test_eventsource(self):
+        """Test that EventSource streams are not held back"""
+        queue = asyncio.Queue()
+        app = consumers_app({"events": EventSource(queue)}, compression=True, compression_min_size=1)
+        sent = []
+        disconnect = asyncio.Event()
+
+        async def send(message):
+            sent.append(message)
+            if len(sent) == 3:
+                disconnect.set()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        await queue.put("hello")
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/events',
+            'headers': [(b'accept-encoding', b'gzip')], 'state': {}}
+        await asyncio.wait_for(app(scope, receive, send), 5)
+        self.assertNotIn(b'content-encoding', dict(sent[0]['headers']))
+        self.assertEqual(sent[2]['body'], b'data: hello\n\n')
+
+    def test_eventsource(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_eventsource())
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main(exit=False)  # pragma: no cover
+    cov.stop()  # pragma: no cover
+    cov.save()  # pragma: no cover
+
+    # Print coverage report to the terminal
+    cov.report(show_missing=True)  # pragma: no cover
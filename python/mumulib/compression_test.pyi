@@ -0,0 +1,41 @@
+import unittest
+from _typeshed import Incomplete
+from mumulib import compression as compression
+from mumulib.compression import CompressingSend as CompressingSend, ENCODERS as ENCODERS, Encoder as Encoder, available_encodings as available_encodings, is_compressible as is_compressible, negotiate_encoding as negotiate_encoding
+from mumulib.server import EventSource as EventSource, consumers_app as consumers_app
+
+cov: Incomplete
+
+def start_message(content_type=b'application/json', headers=()): ...
+def body_message(body, more_body: bool = True): ...
+
+class TestNegotiateEncoding(unittest.TestCase):
+    def test_preference_order(self) -> None: ...
+    def test_q_values(self) -> None: ...
+    def test_none(self) -> None: ...
+    def test_available(self): ...
+    def test_is_compressible(self) -> None: ...
+
+class TestCompressingSend(unittest.TestCase):
+    async def run_messages(self, messages, encoding: str = 'gzip', min_size: int = 16, **kwargs): ...
+    async def async_test_streamed(self) -> None: ...
+    def test_streamed(self) -> None: ...
+    async def async_test_small_chunks(self) -> None: ...
+    def test_small_chunks(self) -> None: ...
+    async def async_test_flush_delay(self) -> None: ...
+    def test_flush_delay(self) -> None: ...
+    async def async_test_held_body_delay(self) -> None: ...
+    def test_held_body_delay(self) -> None: ...
+    async def async_test_small_and_skipped(self) -> None: ...
+    def test_small_and_skipped(self) -> None: ...
+    async def async_test_pathsend(self) -> None: ...
+    def test_pathsend(self) -> None: ...
+    async def async_test_single_message(self) -> None: ...
+    def test_single_message(self) -> None: ...
+
+class TestConsumersAppCompression(unittest.TestCase):
+    async def request(self, app, path, headers): ...
+    async def async_test_json(self) -> None: ...
+    def test_json(self) -> None: ...
+    async def async_test_eventsource(self): ...
+    def test_eventsource(self) -> None: ...
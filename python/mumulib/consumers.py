@@ -26,9 +26,10 @@ THE SOFTWARE.
 
 
 from mumulib.mumutypes import SpecialResponse
+from mumulib.shaped import compile_shape
 
 from types import MappingProxyType
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
 import sys
 
 
@@ -39,6 +40,13 @@ MAX_LIST_INDEX = sys.maxsize // 2  # Reasonable upper bound for list indices
 MIN_LIST_INDEX = -(sys.maxsize // 2)  # Reasonable lower bound for list indices
 MAX_KEY_LENGTH = 1000  # Maximum length for dictionary keys to prevent DoS
 
+# Returned by PathIndex.lookup for paths that are not indexed
+MISSING = object()
+
+# The shape below a path that the root shape has no place for, which no
+# write matches
+_OUTSIDE_SHAPE = compile_shape(None)
+
 
 def sanitize_dict_key(key: str) -> str:
     """Sanitize a dictionary key for security.
@@ -103,6 +111,20 @@ async def consume(parent: Any, segments: List[str], state: Dict[str, Any], send:
     an appropriate consumer for the current parent's type and delegates traversal
     to it. If no matching consumer is found, returns None.
 
+    The builtin dict, list, tuple and MappingProxyType consumers are resolved
+    synchronously in a loop, one segment per iteration; only consumers
+    registered for other types are awaited. As with a consumer per segment,
+    state["remaining"] is left holding the segments from the last one that
+    was consumed.
+
+    If state has a "shape", a CompiledShape for `parent`, the builtin
+    consumers move it down the path with each segment, and the list and
+    dict consumers answer a PUT whose body would not retain it with 400
+    before changing anything. Only the shapes on the path and the body
+    are checked, not the rest of the tree. The shape is dropped when
+    traversal reaches a consumer registered for another type, so writes
+    below those are not checked.
+
     Args:
         parent (any): The current data structure node to be traversed.
         segments (list[str]): The remaining path segments to follow.
@@ -112,85 +134,104 @@ async def consume(parent: Any, segments: List[str], state: Dict[str, Any], send:
     Returns:
         any or None: The object found at the end of the traversal, or None if not found.
     """
-    if not segments:
-        return parent
-    state["remaining"] = segments
-
-    parent_type = type(parent)
-    if parent_type in _consumer_adapters:
-        return await _consumer_adapters[parent_type](
-            parent, segments, state, send)
-
-    return None
-
-
-async def consume_tuple(parent: Tuple, segments: List[str], state: Dict[str, Any], send: Callable) -> Optional[Any]:
-    """Traverse a tuple using the first segment as an integer index.
-
-    If the only segment is empty, returns the tuple itself. Otherwise, attempts
-    to interpret the segment as an integer and return the corresponding element.
-    Returns None if the index is invalid.
-
-    Args:
-        parent (tuple): The current tuple.
-        segments (list[str]): Path segments, where segments[0] should be an integer index or empty.
-        state (dict): Request-specific state.
-        send (coroutine): ASGI send function.
-
-    Returns:
-        any or None: The resolved object or None if invalid.
+    count = len(segments)
+    i = 0
+    while i < count:
+        adapter = _consumer_adapters.get(type(parent))
+        if adapter is None:
+            state["remaining"] = segments[i:]
+            return None
+        step = _builtin_steps.get(adapter)
+        if step is None:
+            state.pop("shape", None)
+            remaining = segments[i:]
+            state["remaining"] = remaining
+            return await adapter(parent, remaining, state, send)
+        proceed, parent = step(parent, segments[i], i == count - 1, state)
+        if not proceed:
+            state["remaining"] = segments[i:]
+            return parent
+        i += 1
+    if count:
+        state["remaining"] = segments[count - 1:]
+    return parent
+
+
+def _method_not_allowed() -> SpecialResponse:
+    return SpecialResponse({
+        'type': 'http.response.start',
+        'status': 405,
+        'headers': [
+            (b'content-type', b'text/plain')
+        ],
+    }, b'Method not allowed')
+
+
+def _shape_mismatch() -> SpecialResponse:
+    return SpecialResponse({
+        'type': 'http.response.start',
+        'status': 400,
+        'headers': [
+            (b'content-type', b'text/plain')
+        ],
+    }, b'Body does not match the shape of the resource')
+
+
+def _step_shape(parent: Any, segment: str, state: Dict[str, Any]) -> None:
+    """Move state["shape"], if any, from `parent` to its child at `segment`."""
+    shape = state.get("shape")
+    if shape is not None:
+        stepped = shape.step(parent, segment)
+        state["shape"] = _OUTSIDE_SHAPE if stepped is None else stepped[0]
+
+
+def _retains_shape(parent: Any, segment: str, state: Dict[str, Any]) -> bool:
+    """Whether putting the parsed body at `segment` of `parent` keeps
+    state["shape"], if any. The segment 'last' of a list appends."""
+    shape = state.get("shape")
+    if shape is None:
+        return True
+    body = state.get("parsed_body", None)
+    if segment == 'last' and type(parent) is list:
+        return shape.validate_item is not None and len(shape.shape) == 1 and shape.validate_item(body)
+    return shape.would_retain(parent, [segment], body)
+
+
+def _step_tuple(parent: Sequence[Any], segment: str, last: bool, state: Dict[str, Any]) -> Tuple[bool, Any]:
+    """Resolve one segment of a tuple or list.
+
+    Returns (True, child) to continue traversal into child, or (False, result)
+    when traversal ends with result.
     """
-    if len(segments) == 1 and state["method"] != "GET":
-        return SpecialResponse({
-            'type': 'http.response.start',
-            'status': 405,
-            'headers': [
-                (b'content-type', b'text/plain')
-            ]
-        }, b'Method not allowed')
+    if last and state["method"] != "GET":
+        return False, _method_not_allowed()
     try:
-        if len(segments) == 1 and not len(segments[0]):
-            child = parent
+        if last and not len(segment):
+            # A list is only copied when it is the result, so the caller
+            # cannot change it. tuple() returns a tuple as it is.
+            child = tuple(parent)
         else:
-            index = validate_list_index(segments[0])
+            index = validate_list_index(segment)
             child = parent[index]
+            _step_shape(parent, segment, state)
     except (IndexError, ValueError):
-        return None
-    return await consume(child, segments[1:], state, send)
-add_consumer(tuple, consume_tuple)
+        return False, None
+    return True, child
 
 
-async def consume_list(parent: List[Any], segments: List[str], state: Dict[str, Any], send: Callable) -> Any:
-    """Traverse a list using the first segment as an integer index or 'last' for appending.
-    Supports GET, PUT, and DELETE methods:
-      - GET: Return the requested element (if index is valid).
-      - PUT: Replace an existing element at the given index, or append a new element
-        if 'last' is used, returning a 201 Created response. If the index doesn't exist
-        and isn't 'last', return 403.
-      - DELETE: Remove the element at the given index if it exists, returning 200 OK.
-
-    Args:
-        parent (list): The current list.
-        segments (list[str]): Path segments, where segments[0] is an index or 'last', or empty for the list itself.
-        state (dict): Request-specific state, expected to have at least:
-            - "method" (str): The HTTP method (e.g., GET, PUT, DELETE)
-            - "parsed_body" (optional): The body to be used for PUT
-            - "url" (optional): The base URL of the request, for forming the Location header
-        send (coroutine): ASGI send function for sending responses if needed.
-
-    Returns:
-        any or None: The resolved object on GET or traversal, or None if not found.
-    """
-    if len(segments) == 1:
+def _step_list(parent: List[Any], segment: str, last: bool, state: Dict[str, Any]) -> Tuple[bool, Any]:
+    if last:
         method = state.get("method", "GET").upper()
-        index_str = segments[0]
 
         if method == 'PUT':
-            if index_str == 'last':
+            if segment == 'last':
+                if not _retains_shape(parent, segment, state):
+                    return False, _shape_mismatch()
                 # Append new element
                 parent.append(state.get("parsed_body", None))
+                invalidate_path_index(state)
                 location = f"{state.get("url", "")}/{len(parent) - 1}"
-                return SpecialResponse({
+                return False, SpecialResponse({
                     'type': 'http.response.start',
                     'status': 201,
                     'headers': [
@@ -200,15 +241,18 @@ async def consume_list(parent: List[Any], segments: List[str], state: Dict[str,
             else:
                 # Replace existing element
                 try:
-                    segnum = validate_list_index(index_str)
+                    segnum = validate_list_index(segment)
                     if segnum >= len(parent) or segnum < 0:
-                        return SpecialResponse({
+                        return False, SpecialResponse({
                             'type': 'http.response.start',
                             'status': 403,
                             'headers': [(b'content-type', b'text/plain')],
                         }, b'Not allowed to put to nonexistant list element.  Use last.')
+                    if not _retains_shape(parent, segment, state):
+                        return False, _shape_mismatch()
                     parent[segnum] = state.get("parsed_body", None)
-                    return SpecialResponse({
+                    invalidate_path_index(state)
+                    return False, SpecialResponse({
                         'type': 'http.response.start',
                         'status': 201,
                         'headers': [(b'content-type', b'text/plain')],
@@ -218,18 +262,131 @@ async def consume_list(parent: List[Any], segments: List[str], state: Dict[str,
         elif method == 'DELETE':
             # Delete an element
             try:
-                segnum = validate_list_index(index_str)
+                segnum = validate_list_index(segment)
                 del parent[segnum]
+                invalidate_path_index(state)
             except (ValueError, IndexError):
                 # If invalid index, just return OK anyway
                 pass
-            return SpecialResponse({
+            return False, SpecialResponse({
                 'type': 'http.response.start',
                 'status': 200,
                 'headers': [(b'content-type', b'text/plain')],
             }, b'')
     # If we get here, we either haven't done PUT/DELETE, or the path continues.
-    return await consume_tuple(tuple(parent), segments, state, send)
+    return _step_tuple(parent, segment, last, state)
+
+
+def _step_immutabledict(
+    parent: Mapping[str, Any], segment: str, last: bool, state: Dict[str, Any]
+) -> Tuple[bool, Any]:
+    if last and state["method"] != "GET" and state["method"] != "POST":
+        return False, _method_not_allowed()
+    try:
+        if last and not len(segment):
+            if "index" in parent:
+                child = parent["index"]
+            else:
+                child = parent
+        else:
+            key = sanitize_dict_key(segment)
+            child = parent[key]
+            _step_shape(parent, key, state)
+    except (KeyError, ValueError):
+        return False, None
+    return True, child
+
+
+def _step_dict(parent: Dict[str, Any], segment: str, last: bool, state: Dict[str, Any]) -> Tuple[bool, Any]:
+    if last:
+        method = state.get("method", "GET").upper()
+
+        try:
+            key = sanitize_dict_key(segment)
+        except ValueError:
+            return False, None
+
+        if method == 'PUT':
+            if not _retains_shape(parent, key, state):
+                return False, _shape_mismatch()
+            parent[key] = state.get("parsed_body", None)
+            invalidate_path_index(state)
+            return False, SpecialResponse({
+                'type': 'http.response.start',
+                'status': 201,
+                'headers': [(b'content-type', b'text/plain')],
+            }, b'')
+
+        elif method == 'DELETE':
+
+            if key in parent:
+                del parent[key]
+            invalidate_path_index(state)
+
+            return False, SpecialResponse({  # pragma: no cover
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'text/plain')],
+            }, b'')
+
+        if not len(segment) and "index" not in parent:
+            return _step_immutabledict(MappingProxyType(parent), segment, last, state)
+    # If we get here, we either are doing a GET or traversing deeper.
+    return _step_immutabledict(parent, segment, last, state)
+
+
+async def consume_tuple(
+    parent: Sequence[Any], segments: List[str], state: Dict[str, Any], send: Callable
+) -> Optional[Any]:
+    """Traverse a tuple using the first segment as an integer index.
+
+    If the only segment is empty, returns the tuple itself, or a tuple copy of
+    a list. Otherwise, attempts to interpret the segment as an integer and
+    return the corresponding element. Returns None if the index is invalid.
+    Lists are indexed in place through this function too, so traversal never
+    copies the sequence.
+
+    Args:
+        parent (tuple or list): The current sequence.
+        segments (list[str]): Path segments, where segments[0] should be an integer index or empty.
+        state (dict): Request-specific state.
+        send (coroutine): ASGI send function.
+
+    Returns:
+        any or None: The resolved object or None if invalid.
+    """
+    proceed, child = _step_tuple(parent, segments[0], len(segments) == 1, state)
+    if not proceed:
+        return child
+    return await consume(child, segments[1:], state, send)
+add_consumer(tuple, consume_tuple)
+
+
+async def consume_list(parent: List[Any], segments: List[str], state: Dict[str, Any], send: Callable) -> Any:
+    """Traverse a list using the first segment as an integer index or 'last' for appending.
+    Supports GET, PUT, and DELETE methods:
+      - GET: Return the requested element (if index is valid).
+      - PUT: Replace an existing element at the given index, or append a new element
+        if 'last' is used, returning a 201 Created response. If the index doesn't exist
+        and isn't 'last', return 403.
+      - DELETE: Remove the element at the given index if it exists, returning 200 OK.
+
+    Args:
+        parent (list): The current list.
+        segments (list[str]): Path segments, where segments[0] is an index or 'last', or empty for the list itself.
+        state (dict): Request-specific state, expected to have at least:
+            - "method" (str): The HTTP method (e.g., GET, PUT, DELETE)
+            - "parsed_body" (optional): The body to be used for PUT
+            - "url" (optional): The base URL of the request, for forming the Location header
+        send (coroutine): ASGI send function for sending responses if needed.
+
+    Returns:
+        any or None: The resolved object on GET or traversal, or None if not found.
+    """
+    proceed, child = _step_list(parent, segments[0], len(segments) == 1, state)
+    if not proceed:
+        return child
+    return await consume(child, segments[1:], state, send)
 add_consumer(list, consume_list)
 
 
@@ -250,25 +407,9 @@ async def _consume_immutabledict(
     Returns:
         any or None: The resolved object or None if the key does not exist.
     """
-    if len(segments) == 1 and state["method"] != "GET" and state["method"] != "POST":
-        return SpecialResponse({
-            'type': 'http.response.start',
-            'status': 405,
-            'headers': [
-                (b'content-type', b'text/plain')
-            ],
-        }, b'Method not allowed')
-    try:
-        if len(segments) == 1 and not len(segments[0]):
-            if "index" in parent:
-                child = parent["index"]
-            else:
-                child = parent
-        else:
-            key = sanitize_dict_key(segments[0])
-            child = parent[key]
-    except (KeyError, ValueError):
-        return None
+    proceed, child = _step_immutabledict(parent, segments[0], len(segments) == 1, state)
+    if not proceed:
+        return child
     return await consume(child, segments[1:], state, send)
 add_consumer(MappingProxyType, _consume_immutabledict)
 
@@ -291,33 +432,116 @@ async def consume_dict(parent: Dict[str, Any], segments: List[str], state: Dict[
     Returns:
         any or None: The resolved object on GET or traversal, or None if the key does not exist.
     """
-    if len(segments) == 1:
-        method = state.get("method", "GET").upper()
+    proceed, child = _step_dict(parent, segments[0], len(segments) == 1, state)
+    if not proceed:
+        return child
+    return await consume(child, segments[1:], state, send)
+add_consumer(dict, consume_dict)
 
-        try:
-            key = sanitize_dict_key(segments[0])
-        except ValueError:
-            return None
 
-        if method == 'PUT':
-            parent[key] = state.get("parsed_body", None)
-            return SpecialResponse({
-                'type': 'http.response.start',
-                'status': 201,
-                'headers': [(b'content-type', b'text/plain')],
-            }, b'')
+# Synchronous single-segment steps for the builtin consumers, used by
+# consume() to walk builtin containers without awaiting each level.
+_builtin_steps: Dict[Callable, Callable[[Any, str, bool, Dict[str, Any]], Tuple[bool, Any]]] = {
+    consume_tuple: _step_tuple,
+    consume_list: _step_list,
+    _consume_immutabledict: _step_immutabledict,
+    consume_dict: _step_dict,
+}
 
-        elif method == 'DELETE':
 
-            if key in parent:
-                del parent[key]
+# Ends the PathIndex key of a path with a trailing slash. A final empty
+# segment always means the trailing slash to consume, never a '' key, so it
+# is kept apart from the paths through '' keys.
+_TRAILING_SLASH = object()
 
-            return SpecialResponse({  # pragma: no cover
-                'type': 'http.response.start',
-                'status': 200,
-                'headers': [(b'content-type', b'text/plain')],
-            }, b'')
 
-    # If we get here, we either are doing a GET or traversing deeper.
-    return await _consume_immutabledict(MappingProxyType(parent), segments, state, send)
-add_consumer(dict, consume_dict)
+class PathIndex(object):
+    """A flat map from full path tuples to the objects `consume` would return.
+
+    The index covers every path that `consume` resolves through the builtin
+    dict, list, tuple and MappingProxyType consumers. It is built lazily on
+    the first lookup and dropped by `invalidate`, which the builtin list and
+    dict consumers call after a PUT or DELETE. Code that mutates the root
+    directly must call `invalidate` itself.
+    """
+
+    def __init__(self, root: Any) -> None:
+        self.root: Any = root
+        self.paths: Optional[Dict[Tuple[Any, ...], Any]] = None
+
+    def invalidate(self) -> None:
+        self.paths = None
+
+    def lookup(self, segments: List[str]) -> Any:
+        """Return the indexed object for `segments`, or MISSING."""
+        if self.paths is None:
+            self.paths = self.build()
+        key: Tuple[Any, ...] = tuple(segments)
+        if key and key[-1] == '':
+            key = key[:-1] + (_TRAILING_SLASH,)
+        found = self.paths.get(key, MISSING)
+        if type(found) is list and key[-1] is _TRAILING_SLASH and self.paths[key[:-1]] is found:
+            # The list itself, which consume returns as a tuple
+            return tuple(found)
+        return found
+
+    def build(self) -> Dict[Tuple[Any, ...], Any]:
+        paths: Dict[Tuple[Any, ...], Any] = {}
+        stack: List[Tuple[Tuple[Any, ...], Any]] = [((), self.root)]
+        while stack:
+            path, node = stack.pop()
+            paths[path] = node
+            node_type = type(node)
+            adapter = _consumer_adapters.get(node_type)
+            if node_type is dict and adapter is consume_dict:
+                node = MappingProxyType(node)
+                node_type = MappingProxyType
+                adapter = _consumer_adapters.get(node_type)
+            if node_type is MappingProxyType and adapter is _consume_immutabledict:
+                paths[path + (_TRAILING_SLASH,)] = node["index"] if "index" in node else node
+                for key, value in node.items():
+                    if type(key) is str and _is_safe_dict_key(key):
+                        stack.append((path + (key,), value))
+            elif (node_type is list and adapter is consume_list) or (
+                    node_type is tuple and adapter is consume_tuple):
+                paths[path + (_TRAILING_SLASH,)] = node
+                for i, value in enumerate(node):
+                    stack.append((path + (str(i),), value))
+        return paths
+
+
+def _is_safe_dict_key(key: str) -> bool:
+    try:
+        sanitize_dict_key(key)
+    except ValueError:
+        return False
+    return True
+
+
+def invalidate_path_index(state: Dict[str, Any]) -> None:
+    """Drop the request's PathIndex, if any, after the tree was mutated."""
+    index = state.get("path_index")
+    if index is not None:
+        index.invalidate()
+
+
+async def consume_indexed(
+    index: PathIndex, segments: List[str], state: Dict[str, Any], send: Callable
+) -> Optional[Any]:
+    """Resolve a GET with a single PathIndex lookup, falling back to `consume`.
+
+    Args:
+        index (PathIndex): The index for the root object.
+        segments (list[str]): The path segments to follow.
+        state (dict): Request-specific state.
+        send (coroutine): ASGI send function.
+
+    Returns:
+        any or None: The object found at the end of the traversal, or None if not found.
+    """
+    state["path_index"] = index
+    if state["method"] == "GET":
+        found = index.lookup(segments)
+        if found is not MISSING:
+            return found
+    return await consume(index.root, segments, state, send)
@@ -1,15 +1,27 @@
 from _typeshed import Incomplete
 from mumulib.mumutypes import SpecialResponse as SpecialResponse
-from typing import Any, Callable
+from typing import Any, Callable, Sequence
 
 MAX_LIST_INDEX: Incomplete
 MIN_LIST_INDEX: Incomplete
 MAX_KEY_LENGTH: int
+MISSING: Incomplete
 
 def sanitize_dict_key(key: str) -> str: ...
 def validate_list_index(index_str: str) -> int: ...
 def add_consumer(adapter_for_type: type, conv: Callable) -> None: ...
 async def consume(parent: Any, segments: list[str], state: dict[str, Any], send: Callable) -> Any | None: ...
-async def consume_tuple(parent: tuple, segments: list[str], state: dict[str, Any], send: Callable) -> Any | None: ...
+async def consume_tuple(parent: Sequence[Any], segments: list[str], state: dict[str, Any], send: Callable) -> Any | None: ...
 async def consume_list(parent: list[Any], segments: list[str], state: dict[str, Any], send: Callable) -> Any: ...
 async def consume_dict(parent: dict[str, Any], segments: list[str], state: dict[str, Any], send: Callable) -> Any: ...
+
+class PathIndex:
+    root: Any
+    paths: dict[tuple[Any, ...], Any] | None
+    def __init__(self, root: Any) -> None: ...
+    def invalidate(self) -> None: ...
+    def lookup(self, segments: list[str]) -> Any: ...
+    def build(self) -> dict[tuple[Any, ...], Any]: ...
+
+def invalidate_path_index(state: dict[str, Any]) -> None: ...
+async def consume_indexed(index: PathIndex, segments: list[str], state: dict[str, Any], send: Callable) -> Any | None: ...
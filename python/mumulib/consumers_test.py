@@ -6,9 +6,12 @@ cov.start()  # pragma: no cover
 
 from types import MappingProxyType  # pragma: no cover
 import json  # pragma: no cover
+import tracemalloc  # pragma: no cover
 import unittest  # pragma: no cover
 
+from mumulib.consumers import add_consumer, consume, MISSING, PathIndex  # pragma: no cover
 from mumulib.server import consumers_app  # pragma: no cover
+from mumulib.shaped import compile_shape, is_shaped  # pragma: no cover
 
 
 async def request(asgi_app, method, path, body):  # pragma: no cover
@@ -335,6 +338,270 @@ class TestSecurityValidation(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(response['status'], 404)
 
 
+NOT_FOUND = Foo()  # pragma: no cover
+
+
+def make_root():  # pragma: no cover
+    return {
+        "hello": "world",
+        "tuple": ("this", "is", "a", "tuple"),
+        "list": ["this", "is", "a", "list"],
+        "immutable": MappingProxyType({"cannot": "touch this"}),
+        "immutable_with_index": MappingProxyType({"index": "index_value", "other": "other_value"}),
+        "not_found": NOT_FOUND,
+        'nested_list': [["asdf"], ["qwer"]],
+        'nested_dict': {'nested': {'again': 'string'}}
+    }
+
+
+class TestPathIndex(unittest.IsolatedAsyncioTestCase):
+    async def test_same_responses(self):
+        plain_app = consumers_app(make_root())
+        indexed_app = consumers_app(make_root(), path_index=True)
+        paths = [
+            "/", "/hello", "/hello/x", "/tuple/", "/tuple/2", "/tuple/01",
+            "/list/", "/list/-1", "/list/9", "/immutable/", "/immutable/cannot",
+            "/immutable_with_index/", "/not_found", "/not_found/x",
+            "/nested_list/1/0", "/nested_dict/nested/", "/nested_dict/nested/again",
+            "/missing",
+        ]
+        for path in paths:
+            self.assertEqual(
+                await request(indexed_app, "GET", path, None),
+                await request(plain_app, "GET", path, None),
+                path)
+
+    async def test_empty_keys(self):
+        def make_empty_key_root():
+            return {"": {"c": "empty"}, "d": {"": "inner", "e": "f"}}
+        plain_app = consumers_app(make_empty_key_root())
+        indexed_app = consumers_app(make_empty_key_root(), path_index=True)
+        for path in ["/", "//", "//c", "/d/", "/d//", "/d/e"]:
+            self.assertEqual(
+                await request(indexed_app, "GET", path, None),
+                await request(plain_app, "GET", path, None),
+                path)
+
+    async def test_invalidated_on_write(self):
+        app = consumers_app(make_root(), path_index=True)
+        response = await request(app, "GET", "/nested_dict/nested/again", None)
+        self.assertEqual(response['body'], 'string')
+
+        response = await request(app, "PUT", "/nested_dict/nested/again", "changed")
+        self.assertEqual(response['status'], 201)
+        response = await request(app, "GET", "/nested_dict/nested/again", None)
+        self.assertEqual(response['body'], 'changed')
+
+        response = await request(app, "PUT", "/list/last", "appended")
+        self.assertEqual(response['status'], 201)
+        response = await request(app, "GET", "/list/4", None)
+        self.assertEqual(response['body'], 'appended')
+
+        response = await request(app, "PUT", "/list/0", "that")
+        response = await request(app, "DELETE", "/list/1", None)
+        response = await request(app, "GET", "/list/", None)
+        self.assertEqual(response['body'], ['that', 'a', 'list', 'appended'])
+
+        response = await request(app, "DELETE", "/hello", None)
+        response = await request(app, "GET", "/hello", None)
+        self.assertEqual(response['status'], 404)
+
+    def test_lookup(self):
+        root = {"a": [1, {"b": 2}], "x" * 1001: 3, 4: 5}
+        index = PathIndex(root)
+        self.assertIs(index.lookup([]), root)
+        self.assertEqual(index.lookup(["a", "1", "b"]), 2)
+        self.assertEqual(index.lookup(["a", ""]), tuple(root["a"]))
+        root[""] = {"c": 7}
+        index.invalidate()
+        self.assertEqual(dict(index.lookup([""])), root)
+        self.assertEqual(index.lookup(["", "c"]), 7)
+        self.assertEqual(dict(index.lookup(["", ""])), {"c": 7})
+        self.assertIs(index.lookup(["x" * 1001]), MISSING)
+        self.assertIs(index.lookup(["4"]), MISSING)
+        root["a"].append(6)
+        self.assertIs(index.lookup(["a", "2"]), MISSING)
+        index.invalidate()
+        self.assertEqual(index.lookup(["a", "2"]), 6)
+
+
+class Custom(object):
+    pass
+
+
+class TestTraversalEngine(unittest.IsolatedAsyncioTestCase):
+    async def test_deep_nesting(self):
+        async def send(event):
+            pass  # pragma: no cover
+
+        root = leaf = {}
+        for _ in range(5000):
+            leaf["d"] = [{}]
+            leaf = leaf["d"][0]
+        leaf["d"] = "bottom"
+        segments = ["d", "0"] * 5000 + ["d"]
+        result = await consume(root, segments, {"method": "GET"}, send)
+        self.assertEqual(result, "bottom")
+
+    async def test_remaining(self):
+        async def send(event):
+            pass  # pragma: no cover
+
+        root = {"a": [{"b": "leaf"}], "t": ("x",)}
+        state = {"method": "GET", "remaining": ["stale"]}
+        self.assertEqual(await consume(root, ["a", "0", "b"], state, send), "leaf")
+        self.assertEqual(state["remaining"], ["b"])
+        self.assertIsNone(await consume(root, ["a", "0", "b", "c"], state, send))
+        self.assertEqual(state["remaining"], ["c"])
+        self.assertIsNone(await consume(root, ["t", "5", "c"], state, send))
+        self.assertEqual(state["remaining"], ["5", "c"])
+        state = {"method": "GET"}
+        self.assertIs(await consume(root, [], state, send), root)
+        self.assertNotIn("remaining", state)
+
+    async def test_custom_adapter_after_builtins(self):
+        async def send(event):
+            pass  # pragma: no cover
+
+        async def consume_custom(parent, segments, state, send):
+            return ("custom", list(segments), list(state["remaining"]))
+
+        add_consumer(Custom, consume_custom)
+        root = {"a": [MappingProxyType({"b": Custom()})]}
+        state = {"method": "GET"}
+        result = await consume(root, ["a", "0", "b", "x", "y"], state, send)
+        self.assertEqual(result, ("custom", ["x", "y"], ["x", "y"]))
+
+        state = {"method": "PUT"}
+        result = await consume(root, ["a", "0", "b"], state, send)
+        self.assertEqual(result.asgi_send_dict['status'], 405)
+        result = await consume(root, ["a", "0", "c", "d"], state, send)
+        self.assertIsNone(result)
+
+
+class TestListTraversal(unittest.IsolatedAsyncioTestCase):
+    async def test_element_access_does_not_copy(self):
+        async def send(event):
+            pass  # pragma: no cover
+
+        items = [{"id": i} for i in range(200000)]
+        root = {"items": items}
+        tracemalloc.start()
+        try:
+            result = await consume(root, ["items", "199999"], {"method": "GET"}, send)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertIs(result, items[-1])
+        # A tuple copy of the list would take 8 bytes per item
+        self.assertLess(peak, len(items))
+
+    async def test_trailing_slash_is_read_only(self):
+        async def send(event):
+            pass  # pragma: no cover
+
+        items = [1, 2, 3]
+        for root in ({"items": items}, MappingProxyType({"items": items})):
+            result = await consume(root, ["items", ""], {"method": "GET"}, send)
+            self.assertEqual(result, (1, 2, 3))
+            index = PathIndex(root)
+            self.assertEqual(index.lookup(["items", ""]), (1, 2, 3))
+        items.append(4)
+        self.assertEqual(result, (1, 2, 3))
+        root = {"items": ("a", "b")}
+        self.assertIs(await consume(root, ["items", ""], {"method": "GET"}, send), root["items"])
+        self.assertIs(PathIndex({"index": items}).lookup([""]), items)
+
+
+SHAPE = {  # pragma: no cover
+    "title": str,
+    "points": [{"x": float, "y": float}],
+    "users": {str: {"name": str, "age": int}},
+}
+
+
+def make_shaped_root(count=1):  # pragma: no cover
+    return {
+        "title": "points",
+        "points": [{"x": float(i), "y": 2.0} for i in range(count)],
+        "users": {"ann": {"name": "Ann", "age": 3}},
+    }
+
+
+class TestShapedWrites(unittest.IsolatedAsyncioTestCase):
+    async def test_put(self):
+        root = make_shaped_root()
+        app = consumers_app(root, shape=SHAPE)
+        accepted = [
+            ("/title", "new"), ("/points/last", {"x": 3.0, "y": 4.0}), ("/points/0", {"x": 0.5, "y": 0.5}),
+            ("/users/bob", {"name": "Bob", "age": 4}), ("/users/ann/age", 5)]
+        rejected = [
+            ("/title", 5), ("/points/last", {"x": 1.0}), ("/points/0", {"x": "a", "y": 1.0}),
+            ("/users/bob", {"name": "Bob"}), ("/users/ann/age", "5"), ("/extra", "x")]
+        for path, body in rejected:
+            before = json.dumps(root)
+            response = await request(app, "PUT", path, body)
+            self.assertEqual(response['status'], 400, path)
+            self.assertEqual(json.dumps(root), before)
+        for path, body in accepted:
+            response = await request(app, "PUT", path, body)
+            self.assertEqual(response['status'], 201, path)
+        self.assertTrue(is_shaped(root["points"], SHAPE["points"]))
+        self.assertEqual(root["points"][1], {"x": 3.0, "y": 4.0})
+        self.assertEqual(root["users"]["ann"]["age"], 5)
+
+        # Out of range is still refused before the body is looked at
+        response = await request(app, "PUT", "/points/9", {"x": 1.0})
+        self.assertEqual(response['status'], 403)
+        response = await request(app, "GET", "/points/0/x", None)
+        self.assertEqual(response['body'], 0.5)
+
+        unshaped = consumers_app(make_shaped_root())
+        response = await request(unshaped, "PUT", "/title", 5)
+        self.assertEqual(response['status'], 201)
+
+    async def test_put_immutable_root(self):
+        items = {"a": {"x": 1}}
+        root = MappingProxyType({"items": items, "pairs": (["p", 1],)})
+        shape = {"items": {str: {"x": int}}, "pairs": [(str, int)]}
+        app = consumers_app(root, shape=shape)
+        response = await request(app, "PUT", "/items/c", {"x": 2})
+        self.assertEqual(response['status'], 201)
+        self.assertEqual(items["c"], {"x": 2})
+        response = await request(app, "PUT", "/items/c", {"x": "2"})
+        self.assertEqual(response['status'], 400)
+        response = await request(app, "PUT", "/pairs/0/1", 2)
+        self.assertEqual(response['status'], 201)
+        response = await request(app, "PUT", "/pairs/0/1", "2")
+        self.assertEqual(response['status'], 400)
+        self.assertEqual(root["pairs"], (["p", 2],))
+
+    async def test_custom_adapter_drops_shape(self):
+        async def send(event):
+            pass  # pragma: no cover
+
+        async def consume_custom(parent, segments, state, send):
+            return "shape" in state
+
+        add_consumer(Custom, consume_custom)
+        state = {"method": "PUT", "shape": compile_shape({"c": int}), "parsed_body": "x"}
+        self.assertFalse(await consume({"c": Custom()}, ["c", "d"], state, send))
+
+    async def test_checks_only_the_written_path(self):
+        async def send(event):
+            pass  # pragma: no cover
+
+        root = make_shaped_root(1000)
+        # Points that do not match, which checking the whole tree would find
+        for point in root["points"][1:]:
+            point["x"] = "not a float"
+        state = {"method": "PUT", "parsed_body": 1.5, "shape": compile_shape(SHAPE)}
+        result = await consume(root, ["points", "0", "x"], state, send)
+        self.assertEqual(result.asgi_send_dict['status'], 201)
+        self.assertEqual(root["points"][0]["x"], 1.5)
+        self.assertFalse(is_shaped(root["points"], SHAPE["points"]))
+
+
 if __name__ == "__main__":  # pragma: no cover
     unittest.main(exit=False)  # pragma: no cover
     cov.stop()  # pragma: no cover
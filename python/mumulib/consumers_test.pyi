@@ -1,6 +1,8 @@
 import unittest
 from _typeshed import Incomplete
+from mumulib.consumers import MISSING as MISSING, add_consumer as add_consumer, consume as consume, PathIndex as PathIndex
 from mumulib.server import consumers_app as consumers_app
+from mumulib.shaped import compile_shape as compile_shape, is_shaped as is_shaped
 
 cov: Incomplete
 
@@ -29,3 +31,34 @@ class TestSecurityValidation(unittest.IsolatedAsyncioTestCase):
     async def test_dict_put_key_too_long(self) -> None: ...
     async def test_dict_put_key_with_null_byte(self) -> None: ...
     async def test_tuple_index_out_of_bounds(self) -> None: ...
+
+NOT_FOUND: Incomplete
+
+def make_root(): ...
+
+class TestPathIndex(unittest.IsolatedAsyncioTestCase):
+    async def test_same_responses(self) -> None: ...
+    async def test_empty_keys(self) -> None: ...
+    async def test_invalidated_on_write(self) -> None: ...
+    def test_lookup(self) -> None: ...
+
+class Custom: ...
+
+class TestTraversalEngine(unittest.IsolatedAsyncioTestCase):
+    async def test_deep_nesting(self) -> None: ...
+    async def test_remaining(self) -> None: ...
+    async def test_custom_adapter_after_builtins(self) -> None: ...
+
+class TestListTraversal(unittest.IsolatedAsyncioTestCase):
+    async def test_element_access_does_not_copy(self) -> None: ...
+    async def test_trailing_slash_is_read_only(self) -> None: ...
+
+SHAPE: Incomplete
+
+def make_shaped_root(count: int = 1): ...
+
+class TestShapedWrites(unittest.IsolatedAsyncioTestCase):
+    async def test_put(self) -> None: ...
+    async def test_put_immutable_root(self) -> None: ...
+    async def test_custom_adapter_drops_shape(self) -> None: ...
+    async def test_checks_only_the_written_path(self) -> None: ...
@@ -0,0 +1,94 @@
+"""\
+@file jsonbackend.py
+@author Donovan Preston
+
+Copyright (c) 2024, Donovan Preston
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+from typing import Any, Dict
+
+from mumulib.producers import custom_serializer
+
+
+class JSONBackend(object):
+    """Stdlib json. Decodes from bytes and encodes to bytes."""
+
+    name: str = 'json'
+
+    # Whether produce_json should stream large values through iter_json
+    streaming: bool = True
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+    def dumps(self, thing: Any) -> bytes:
+        return json.dumps(thing, default=custom_serializer).encode('utf-8')
+
+
+class OrjsonBackend(JSONBackend):
+    """orjson, if installed. Output is compact, without spaces after separators."""
+
+    name = 'orjson'
+    streaming = False
+
+    def __init__(self) -> None:
+        import orjson
+        self.orjson = orjson
+        self.option = orjson.OPT_NON_STR_KEYS
+
+    def loads(self, data: bytes) -> Any:
+        return self.orjson.loads(data)
+
+    def dumps(self, thing: Any) -> bytes:
+        return self.orjson.dumps(thing, default=custom_serializer, option=self.option)
+
+
+JSON_BACKENDS: Dict[str, type[JSONBackend]] = {
+    'json': JSONBackend,
+    'orjson': OrjsonBackend,
+}
+
+# Backends tried in order by get_backend('auto')
+FAST_BACKENDS: list[str] = ['orjson']
+
+DEFAULT_BACKEND = JSONBackend()
+
+
+def get_backend(name: str = 'json') -> JSONBackend:
+    """Return a JSON backend by name.
+
+    'auto' picks the first of FAST_BACKENDS that can be imported and falls
+    back to the stdlib. Naming a backend that is not installed raises
+    ImportError.
+    """
+    if name == 'json':
+        return DEFAULT_BACKEND
+    if name == 'auto':
+        for fast in FAST_BACKENDS:
+            try:
+                return JSON_BACKENDS[fast]()
+            except ImportError:
+                continue
+        return DEFAULT_BACKEND
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON backend: {name}")
+    return JSON_BACKENDS[name]()
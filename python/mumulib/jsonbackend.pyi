@@ -0,0 +1,21 @@
+from mumulib.producers import custom_serializer as custom_serializer
+from typing import Any
+
+class JSONBackend:
+    name: str
+    streaming: bool
+    def loads(self, data: bytes) -> Any: ...
+    def dumps(self, thing: Any) -> bytes: ...
+
+class OrjsonBackend(JSONBackend):
+    orjson: Any
+    option: int
+    def __init__(self) -> None: ...
+    def loads(self, data: bytes) -> Any: ...
+    def dumps(self, thing: Any) -> bytes: ...
+
+JSON_BACKENDS: dict[str, type[JSONBackend]]
+FAST_BACKENDS: list[str]
+DEFAULT_BACKEND: JSONBackend
+
+def get_backend(name: str = 'json') -> JSONBackend: ...
@@ -0,0 +1,134 @@
+import coverage  # pragma: no cover
+
+cov = coverage.Coverage(branch=True)  # pragma: no cover
+cov.start()  # pragma: no cover
+
+import asyncio  # pragma: no cover
+import importlib.util  # pragma: no cover
+import json  # pragma: no cover
+import unittest  # pragma: no cover
+from types import MappingProxyType  # pragma: no cover
+
+from mumulib import jsonbackend  # pragma: no cover
+from mumulib.jsonbackend import (  # pragma: no cover
+    DEFAULT_BACKEND,
+    get_backend,
+    JSON_BACKENDS,
+    JSONBackend,
+)
+from mumulib.server import consumers_app, parse_json  # pragma: no cover
+
+
+HAS_ORJSON = importlib.util.find_spec('orjson') is not None  # pragma: no cover
+
+
+PAYLOADS = {  # pragma: no cover
+    'records': [
+        {"id": i, "name": f"record {i}", "score": i * 0.5, "tags": ["a", "b"], "active": i % 2 == 0}
+        for i in range(5000)],
+    'nested': {"level": {str(i): {"values": list(range(20))} for i in range(200)}},
+    'strings': ["x" * 100 + str(i) for i in range(5000)],
+}
+
+
+class Foo(object):  # pragma: no cover
+    pass
+
+
+class TestGetBackend(unittest.TestCase):
+    """Test get_backend function"""
+
+    def test_default(self):
+        self.assertIs(get_backend(), DEFAULT_BACKEND)
+        self.assertIs(get_backend('json'), DEFAULT_BACKEND)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            get_backend('nope')
+
+    def test_auto_falls_back_to_stdlib(self):
+        class MissingBackend(JSONBackend):
+            def __init__(self):
+                raise ImportError("not installed")
+
+        original = list(jsonbackend.FAST_BACKENDS)
+        JSON_BACKENDS['missing'] = MissingBackend
+        jsonbackend.FAST_BACKENDS[:] = ['missing']
+        try:
+            self.assertIs(get_backend('auto'), DEFAULT_BACKEND)
+        finally:
+            jsonbackend.FAST_BACKENDS[:] = original
+            del JSON_BACKENDS['missing']
+
+    @unittest.skipUnless(HAS_ORJSON, "orjson is not installed")
+    def test_auto_uses_orjson(self):
+        self.assertEqual(get_backend('auto').name, 'orjson')
+
+
+class TestBackends(unittest.TestCase):
+    """Test that every available backend round-trips the same values"""
+
+    def backends(self):
+        result = [DEFAULT_BACKEND]
+        if HAS_ORJSON:
+            result.append(get_backend('orjson'))
+        return result
+
+    def test_stdlib_matches_json_dumps(self):
+        obj = {"a": MappingProxyType({"b": 1}), "c": Foo(), 1: (2, 3)}
+        self.assertEqual(
+            DEFAULT_BACKEND.dumps(obj),
+            json.dumps(obj, default=jsonbackend.custom_serializer).encode('utf-8'))
+
+    def test_round_trip(self):
+        obj = {"a": MappingProxyType({"b": 1}), "c": Foo(), 1: (2, 3), "d": "é"}
+        expected = {"a": {"b": 1}, "c": None, "1": [2, 3], "d": "é"}
+        for backend in self.backends():
+            encoded = backend.dumps(obj)
+            self.assertIsInstance(encoded, bytes)
+            self.assertEqual(backend.loads(encoded), expected, backend.name)
+
+    def test_payloads(self):
+        for name, payload in PAYLOADS.items():
+            expected = json.loads(json.dumps(payload))
+            for backend in self.backends():
+                self.assertEqual(backend.loads(backend.dumps(payload)), expected, f"{name} {backend.name}")
+
+    async def async_test_parse_json_with_backend(self):
+        for backend in self.backends():
+            async def receive():
+                return {'type': 'http.request', 'body': b'{"key": [1, 2]}', 'more_body': False}
+
+            self.assertEqual(await parse_json(receive, backend=backend), {"key": [1, 2]})
+
+    def test_parse_json_with_backend(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_parse_json_with_backend())
+
+    async def async_test_consumers_app_with_backend(self):
+        app = consumers_app({"data.json": {"x": [1, 2]}}, json_backend='auto')
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}  # pragma: no cover
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/data.json', 'headers': [], 'state': {}}
+        await app(scope, receive, send)
+        body = b''.join(m['body'] for m in sent if m['type'] == 'http.response.body')
+        self.assertEqual(json.loads(body), {"x": [1, 2]})
+
+    def test_consumers_app_with_backend(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_consumers_app_with_backend())
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main(exit=False)  # pragma: no cover
+    cov.stop()  # pragma: no cover
+    cov.save()  # pragma: no cover
+
+    # Print coverage report to the terminal
+    cov.report(show_missing=True)  # pragma: no cover
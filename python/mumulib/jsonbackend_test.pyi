@@ -0,0 +1,27 @@
+import unittest
+from _typeshed import Incomplete
+from mumulib import jsonbackend as jsonbackend
+from mumulib.jsonbackend import DEFAULT_BACKEND as DEFAULT_BACKEND, JSONBackend as JSONBackend, JSON_BACKENDS as JSON_BACKENDS, get_backend as get_backend
+from mumulib.server import consumers_app as consumers_app, parse_json as parse_json
+
+cov: Incomplete
+HAS_ORJSON: Incomplete
+PAYLOADS: Incomplete
+
+class Foo: ...
+
+class TestGetBackend(unittest.TestCase):
+    def test_default(self) -> None: ...
+    def test_unknown(self) -> None: ...
+    def test_auto_falls_back_to_stdlib(self): ...
+    def test_auto_uses_orjson(self) -> None: ...
+
+class TestBackends(unittest.TestCase):
+    def backends(self): ...
+    def test_stdlib_matches_json_dumps(self) -> None: ...
+    def test_round_trip(self) -> None: ...
+    def test_payloads(self) -> None: ...
+    async def async_test_parse_json_with_backend(self) -> None: ...
+    def test_parse_json_with_backend(self) -> None: ...
+    async def async_test_consumers_app_with_backend(self): ...
+    def test_consumers_app_with_backend(self) -> None: ...
@@ -11,6 +11,15 @@ class SpecialResponse(Exception):
         self.writer: Optional[Callable[..., Any]] = writer
 
 
+class FileResponse(SpecialResponse):
+    def __init__(
+        self, asgi_send_dict: dict[str, Any], path: str,
+        writer: Optional[Callable[..., Any]] = None
+    ) -> None:
+        SpecialResponse.__init__(self, asgi_send_dict, b'', writer)
+        self.path: str = path
+
+
 class HTTPResponse(SpecialResponse):
     def __init__(self, code: int, body: str) -> None:
         SpecialResponse.__init__(
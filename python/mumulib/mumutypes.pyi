@@ -6,6 +6,10 @@ class SpecialResponse(Exception):
     writer: Callable[..., Any] | None
     def __init__(self, asgi_send_dict: dict[str, Any], leaf_object: Any, writer: Callable[..., Any] | None = None) -> None: ...
 
+class FileResponse(SpecialResponse):
+    path: str
+    def __init__(self, asgi_send_dict: dict[str, Any], path: str, writer: Callable[..., Any] | None = None) -> None: ...
+
 class HTTPResponse(SpecialResponse):
     def __init__(self, code: int, body: str) -> None: ...
 
@@ -8,6 +8,7 @@ import unittest  # pragma: no cover
 
 from mumulib.mumutypes import (  # pragma: no cover
     SpecialResponse,
+    FileResponse,
     HTTPResponse,
     BadRequestResponse,
     NotFoundResponse,
@@ -51,6 +52,25 @@ class TestSpecialResponse(unittest.TestCase):
         self.assertIsInstance(response, Exception)
 
 
+class TestFileResponse(unittest.TestCase):
+    """Test FileResponse class"""
+
+    def test_init(self):
+        """Test FileResponse keeps the path and has an empty leaf"""
+        asgi_dict = {'type': 'http.response.start', 'status': 200}
+
+        def writer(send, receive):
+            return None  # pragma: no cover
+
+        response = FileResponse(asgi_dict, '/tmp/file.bin', writer)
+
+        self.assertIsInstance(response, SpecialResponse)
+        self.assertEqual(response.asgi_send_dict, asgi_dict)
+        self.assertEqual(response.path, '/tmp/file.bin')
+        self.assertEqual(response.leaf_object, b'')
+        self.assertIs(response.writer, writer)
+
+
 class TestHTTPResponse(unittest.TestCase):
     """Test HTTPResponse class"""
 
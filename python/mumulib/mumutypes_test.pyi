@@ -1,6 +1,6 @@
 import unittest
 from _typeshed import Incomplete
-from mumulib.mumutypes import BadRequestResponse as BadRequestResponse, CreatedResponse as CreatedResponse, HTTPResponse as HTTPResponse, MethodNotAllowedResponse as MethodNotAllowedResponse, NotFoundResponse as NotFoundResponse, SeeOtherResponse as SeeOtherResponse, SpecialResponse as SpecialResponse
+from mumulib.mumutypes import BadRequestResponse as BadRequestResponse, CreatedResponse as CreatedResponse, FileResponse as FileResponse, HTTPResponse as HTTPResponse, MethodNotAllowedResponse as MethodNotAllowedResponse, NotFoundResponse as NotFoundResponse, SeeOtherResponse as SeeOtherResponse, SpecialResponse as SpecialResponse
 
 cov: Incomplete
 
@@ -9,6 +9,9 @@ class TestSpecialResponse(unittest.TestCase):
     def test_init_with_writer(self): ...
     def test_is_exception(self) -> None: ...
 
+class TestFileResponse(unittest.TestCase):
+    def test_init(self) -> None: ...
+
 class TestHTTPResponse(unittest.TestCase):
     def test_init(self) -> None: ...
     def test_custom_status_code(self) -> None: ...
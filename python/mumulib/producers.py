@@ -25,11 +25,14 @@ THE SOFTWARE.
 """
 
 from io import TextIOWrapper, BufferedReader
-import aiofiles
+import asyncio
+import hashlib
 import json
 import mimetypes
+import os
+import time
 from types import FunctionType, MappingProxyType
-from typing import Any, AsyncGenerator, Callable, Dict, Optional
+from typing import Any, AsyncGenerator, Callable, Dict, Iterator, Optional, Tuple
 
 from mumulib import mumutypes
 
@@ -64,30 +67,252 @@ async def produce(thing: Any, state: Dict[str, Any]) -> AsyncGenerator[str, None
     yield str(thing)
 
 
-async def produce_file(thing: TextIOWrapper, state: Dict[str, Any]) -> AsyncGenerator[mumutypes.SpecialResponse, None]:
+_validator_adapters: Dict[str, Dict[type, Callable]] = {}
+
+
+def add_validator(adapter_for_type: type, validator: Callable, mime_type: str = '*/*') -> None:
+    """Register a function returning (etag, last_modified) for a type, or
+    None when it cannot tell. It must not produce the object."""
+    if mime_type not in _validator_adapters:
+        _validator_adapters[mime_type] = {}
+    _validator_adapters[mime_type][adapter_for_type] = validator
+
+
+def validate(thing: Any, state: Dict[str, Any]) -> Optional[Tuple[str, Optional[float]]]:
+    """Return (etag, last_modified) for the response `produce` would make
+    for `thing`, or None if there are no validators for it.
+
+    The validator is looked up for the same content type as the producer,
+    so a validator only ever describes the output of its own producer.
+    """
+    thing_type = type(thing)
+    for content_type in state['accept']:
+        if thing_type in _producer_adapters.get(content_type, {}):
+            validator = _validator_adapters.get(content_type, {}).get(thing_type)
+            if validator is None:
+                return None
+            return validator(thing, state)
+    return None
+
+
+class ValidatorCache(object):
+    """Validators for in-memory leaves, valid until the next `invalidate`.
+
+    consumers_app invalidates the cache after every request that is not a
+    GET. Code that mutates the root directly must call `invalidate` itself.
+    """
+
+    def __init__(self) -> None:
+        # Keeps version ETags from one process apart from another's
+        self.token: str = os.urandom(4).hex()
+        self.version: int = 0
+        self.modified: float = time.time()
+
+    def invalidate(self) -> None:
+        self.version += 1
+        self.modified = time.time()
+
+    def version_tag(self) -> str:
+        return f'W/"{self.token}-{self.version}"'
+
+
+def validate_version(thing: Any, state: Dict[str, Any]) -> Optional[Tuple[str, Optional[float]]]:
+    """Validators from the request's ValidatorCache version counter."""
+    cache = state.get("validator_cache")
+    if cache is None:
+        return None
+    return cache.version_tag(), cache.modified
+
+
+# Size of each body message when streaming a file
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def file_writer(filename: str, chunk_size: int = FILE_CHUNK_SIZE) -> Callable:
+    """Return a SpecialResponse writer that streams a file as binary chunks."""
+    async def writer(send: Callable, receive: Callable) -> None:
+        # Imported here so services that never send files do not load it
+        import aiofiles
+        async with aiofiles.open(filename, 'rb') as newthing:
+            while True:
+                chunk = await newthing.read(chunk_size)
+                if not chunk:
+                    break
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+    return writer
+
+
+async def produce_file(thing: TextIOWrapper, state: Dict[str, Any]) -> AsyncGenerator[mumutypes.FileResponse, None]:
     filename = str(thing.name)
     content_type = mimetypes.guess_type(filename)
 
-    content: str | bytes
     if content_type[0] == "font/ttf":
-        async with aiofiles.open(filename, 'rb') as newthing:
-            content = await newthing.read()
         charset = b''
     else:
-        async with aiofiles.open(filename, 'r') as newthing:
-            content = await newthing.read()
         charset = b'; charset=UTF-8'
-    yield mumutypes.SpecialResponse({
+    yield mumutypes.FileResponse({
         'type': 'http.response.start',
         'status': 200,
         'headers': [(b'content-type', (content_type[0] or 'application/octet-stream').encode("utf8") + charset)],
-    }, content)
+    }, filename, file_writer(filename))
 add_producer(TextIOWrapper, produce_file)
 add_producer(BufferedReader, produce_file)
 
 
-async def produce_json(thing: Any, state: Dict[str, Any]) -> AsyncGenerator[str, None]:
-    yield json.dumps(thing, default=custom_serializer)
+def validate_file(thing: TextIOWrapper, state: Dict[str, Any]) -> Optional[Tuple[str, Optional[float]]]:
+    """Validators from the file's modification time and size."""
+    try:
+        st = os.stat(thing.name)
+    except OSError:
+        return None
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"', st.st_mtime
+
+
+add_validator(TextIOWrapper, validate_file)
+add_validator(BufferedReader, validate_file)
+
+
+# Approximate size of each chunk yielded by produce_json, in characters
+JSON_CHUNK_SIZE = 64 * 1024
+
+# Containers with fewer items than this are encoded with a single json call
+JSON_STREAM_MIN_ITEMS = 256
+
+# Nesting depth down to which small containers are searched for large ones
+JSON_SCAN_DEPTH = 2
+
+
+_json_encoder = json.JSONEncoder(default=custom_serializer)
+
+_JSON_MAPPINGS = frozenset([dict, MappingProxyType])
+_JSON_CONTAINERS = frozenset([dict, MappingProxyType, list, tuple])
+
+
+def _has_large_container(thing: Any, seen: set[int]) -> bool:
+    if len(thing) >= JSON_STREAM_MIN_ITEMS:
+        return True
+    marker = id(thing)
+    if marker in seen:
+        # Circular; leave it to the encoder to report
+        return False
+    seen.add(marker)
+    values = thing.values() if type(thing) in _JSON_MAPPINGS else thing
+    for value in values:
+        if type(value) in _JSON_CONTAINERS and _has_large_container(value, seen):
+            return True
+    seen.discard(marker)
+    return False
+
+
+def _is_large(thing: Any, depth: int) -> bool:
+    # Near the root, look through small wrapper containers for large ones;
+    # deeper down only the container's own length is checked, so lists of
+    # many small records are not scanned twice.
+    if depth < JSON_SCAN_DEPTH:
+        return _has_large_container(thing, set())
+    return len(thing) >= JSON_STREAM_MIN_ITEMS
+
+
+def iter_json(thing: Any, markers: Optional[Dict[int, Any]] = None, depth: int = 0) -> Iterator[str]:
+    """Encode `thing` as JSON, one piece at a time.
+
+    Dicts, lists, tuples and MappingProxyTypes that have at least
+    JSON_STREAM_MIN_ITEMS items, or within the first JSON_SCAN_DEPTH levels
+    contain such a container, are walked item by item so the whole document
+    is never built in memory. Everything else is encoded in batches by the
+    C encoder. The concatenated output is the same as
+    json.dumps(thing, default=custom_serializer).
+    """
+    thing_type = type(thing)
+    if thing_type not in _JSON_CONTAINERS or not _is_large(thing, depth):
+        yield _json_encoder.encode(thing)
+        return
+
+    if markers is None:
+        markers = {}
+    marker = id(thing)
+    if marker in markers:
+        raise ValueError("Circular reference detected")
+    markers[marker] = thing
+
+    depth += 1
+    # Runs of items without large containers are encoded together, as a
+    # sub-dict or sub-list with its brackets stripped. The items are copied
+    # first, because the container can change between the chunks of a
+    # response, when produce_json lets other tasks run.
+    if thing_type in _JSON_MAPPINGS:
+        yield '{'
+        separator = ''
+        batch: Dict[Any, Any] = {}
+        for key, value in list(thing.items()):
+            if type(value) in _JSON_CONTAINERS and _is_large(value, depth):
+                if batch:
+                    yield separator + _json_encoder.encode(batch)[1:-1]
+                    separator = ', '
+                    batch = {}
+                yield separator + _json_encoder.encode({key: 0})[1:-4] + ': '
+                yield from iter_json(value, markers, depth)
+                separator = ', '
+            else:
+                batch[key] = value
+                if len(batch) >= JSON_STREAM_MIN_ITEMS:
+                    yield separator + _json_encoder.encode(batch)[1:-1]
+                    separator = ', '
+                    batch = {}
+        if batch:
+            yield separator + _json_encoder.encode(batch)[1:-1]
+        yield '}'
+    else:
+        yield '['
+        separator = ''
+        items: list[Any] = []
+        for value in list(thing):
+            if type(value) in _JSON_CONTAINERS and _is_large(value, depth):
+                if items:
+                    yield separator + _json_encoder.encode(items)[1:-1]
+                    separator = ', '
+                    items = []
+                yield separator
+                yield from iter_json(value, markers, depth)
+                separator = ', '
+            else:
+                items.append(value)
+                if len(items) >= JSON_STREAM_MIN_ITEMS:
+                    yield separator + _json_encoder.encode(items)[1:-1]
+                    separator = ', '
+                    items = []
+        if items:
+            yield separator + _json_encoder.encode(items)[1:-1]
+        yield ']'
+    del markers[marker]
+
+
+async def produce_json(thing: Any, state: Dict[str, Any]) -> AsyncGenerator[str | bytes, None]:
+    """Stream `thing` as JSON in chunks of about JSON_CHUNK_SIZE characters,
+    giving other tasks a chance to run between chunks.
+
+    If state has a non-streaming "json_backend", its encoded bytes are
+    yielded in one chunk instead."""
+    backend = state.get("json_backend")
+    if backend is not None and not backend.streaming:
+        yield backend.dumps(thing)
+        return
+    buffer = []
+    size = 0
+    for piece in iter_json(thing):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= JSON_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+            await asyncio.sleep(0)
+    if buffer:
+        yield ''.join(buffer)
 
 
 async def produce_bytes(thing: bytes, state: Dict[str, Any]) -> AsyncGenerator[bytes, None]:
@@ -100,8 +325,25 @@ JSON_TYPES = [
     bool, MappingProxyType, type(None)]
 
 
+def validate_json(thing: Any, state: Dict[str, Any]) -> Optional[Tuple[str, Optional[float]]]:
+    """Validators from the request's ValidatorCache version counter when
+    there is one, so the JSON is not encoded just to be hashed. Otherwise
+    a strong ETag from a hash of the encoded JSON."""
+    if state.get("validator_cache") is not None:
+        return validate_version(thing, state)
+    backend = state.get("json_backend")
+    encode = backend.dumps if backend is not None else _encode_json
+    digest = hashlib.blake2b(encode(thing), digest_size=16).hexdigest()
+    return f'"{digest}"', None
+
+
+def _encode_json(thing: Any) -> bytes:
+    return _json_encoder.encode(thing).encode('utf-8')
+
+
 for typ in JSON_TYPES:
     add_producer(typ, produce_json, 'application/json')
+    add_validator(typ, validate_json, 'application/json')
 
 # Add bytes producer for binary data (using */* to match all content types)
 add_producer(bytes, produce_bytes)
@@ -1,13 +1,36 @@
 from _typeshed import Incomplete
 from io import TextIOWrapper
 from mumulib import mumutypes as mumutypes
-from typing import Any, AsyncGenerator, Callable
+from typing import Any, AsyncGenerator, Callable, Iterator
 
 def custom_serializer(obj: Any) -> dict[str, Any] | None: ...
 def add_producer(adapter_for_type: type, conv: Callable, mime_type: str = '*/*') -> None: ...
 async def produce(thing: Any, state: dict[str, Any]) -> AsyncGenerator[str, None]: ...
-async def produce_file(thing: TextIOWrapper, state: dict[str, Any]) -> AsyncGenerator[mumutypes.SpecialResponse, None]: ...
-async def produce_json(thing: Any, state: dict[str, Any]) -> AsyncGenerator[str, None]: ...
+def add_validator(adapter_for_type: type, validator: Callable, mime_type: str = '*/*') -> None: ...
+def validate(thing: Any, state: dict[str, Any]) -> tuple[str, float | None] | None: ...
+
+class ValidatorCache:
+    token: str
+    version: int
+    modified: float
+    def __init__(self) -> None: ...
+    def invalidate(self) -> None: ...
+    def version_tag(self) -> str: ...
+
+def validate_version(thing: Any, state: dict[str, Any]) -> tuple[str, float | None] | None: ...
+FILE_CHUNK_SIZE: int
+
+def file_writer(filename: str, chunk_size: int = ...) -> Callable: ...
+async def produce_file(thing: TextIOWrapper, state: dict[str, Any]) -> AsyncGenerator[mumutypes.FileResponse, None]: ...
+def validate_file(thing: TextIOWrapper, state: dict[str, Any]) -> tuple[str, float | None] | None: ...
+JSON_CHUNK_SIZE: int
+JSON_STREAM_MIN_ITEMS: int
+
+JSON_SCAN_DEPTH: int
+
+def iter_json(thing: Any, markers: dict[int, Any] | None = None, depth: int = 0) -> Iterator[str]: ...
+async def produce_json(thing: Any, state: dict[str, Any]) -> AsyncGenerator[str | bytes, None]: ...
 async def produce_bytes(thing: bytes, state: dict[str, Any]) -> AsyncGenerator[bytes, None]: ...
+def validate_json(thing: Any, state: dict[str, Any]) -> tuple[str, float | None] | None: ...
 
 JSON_TYPES: Incomplete
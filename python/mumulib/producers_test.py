@@ -12,7 +12,13 @@ from mumulib.producers import (  # pragma: no cover
     produce,
     custom_serializer,
     produce_json,
-    produce_file
+    produce_file,
+    file_writer,
+    iter_json,
+    validate,
+    validate_file,
+    validate_version,
+    ValidatorCache
 )
 from types import MappingProxyType  # pragma: no cover
 from mumulib import mumutypes  # pragma: no cover
@@ -279,6 +285,71 @@ class TestProduceJson(unittest.TestCase):
         """Wrapper to run async test"""
         asyncio.run(self.async_test_produce_json_with_mapping_proxy())
 
+    async def async_test_produce_json_large(self):
+        """Test that large containers are streamed in several chunks"""
+        obj = {
+            "rows": [{"id": i, "name": f"row {i}"} for i in range(20000)],
+            "proxy": MappingProxyType({str(i): i for i in range(300)}),
+            "keys": {1: "a", 2.5: "b", False: "c", None: "d"},
+            "tuple": tuple(range(300)),
+        }
+        obj["keys"].update({f"k{i}": i for i in range(300)})
+        chunks = []
+        async for chunk in produce_json(obj, {}):
+            chunks.append(chunk)
+
+        import json
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), json.dumps(obj, default=custom_serializer))
+
+    def test_produce_json_large(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_produce_json_large())
+
+    async def async_test_produce_json_changed_while_streaming(self):
+        """Test that containers changed between chunks are streamed as they were"""
+        import json
+        rows = {str(i): [{"id": i, "name": f"row {i}"}] * 50 for i in range(300)}
+        items = list(range(20000))
+        expected = json.dumps(rows)
+        chunks = []
+        async for chunk in produce_json({"rows": rows, "items": items}, {}):
+            chunks.append(chunk)
+            rows.pop(str(len(chunks)), None)
+            rows[f"new {len(chunks)}"] = []
+            items.append(len(chunks))
+        self.assertGreater(len(chunks), 2)
+        # Each container is copied when it is reached
+        produced = json.loads(''.join(chunks))
+        self.assertEqual(json.dumps(produced["rows"]), expected)
+        self.assertEqual(produced["items"][:20000], list(range(20000)))
+
+    def test_produce_json_changed_while_streaming(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_produce_json_changed_while_streaming())
+
+    def test_iter_json_circular(self):
+        """Test that circular references in streamed containers are rejected"""
+        obj = list(range(300))
+        obj.append(obj)
+        with self.assertRaises(ValueError):
+            list(iter_json(obj))
+
+        small = [1]
+        small.append(small)
+        with self.assertRaises(ValueError):
+            list(iter_json({"small": small}))
+
+
+async def collect_writer(writer):  # pragma: no cover
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await writer(send, None)
+    return b''.join(message['body'] for message in messages)
+
 
 class TestProduceFile(unittest.TestCase):
     """Test produce_file function with actual files"""
@@ -314,9 +385,12 @@ class TestProduceFile(unittest.TestCase):
             # Text file should have charset
             self.assertIn(b'charset=UTF-8', headers[0][1])
 
-            # Verify body contains file content
-            self.assertIsInstance(response.leaf_object, str)
-            self.assertIn('mumulib', response.leaf_object)
+            # The body is streamed as bytes by the writer
+            self.assertIsInstance(response, mumutypes.FileResponse)
+            self.assertEqual(response.path, test_file_path)
+            self.assertEqual(response.leaf_object, b'')
+            body = await collect_writer(response.writer)
+            self.assertIn(b'mumulib', body)
 
     def test_produce_text_file(self):
         """Wrapper to run async test"""
@@ -402,16 +476,90 @@ class TestProduceFile(unittest.TestCase):
             self.assertIn(b'font/ttf', content_type)
             self.assertNotIn(b'charset', content_type)
 
-            # Verify body is bytes (binary content)
-            self.assertIsInstance(response.leaf_object, bytes)
-            # TTF files start with specific magic bytes
-            self.assertTrue(len(response.leaf_object) > 0)
+            # Verify body is streamed as the exact binary content
+            body = await collect_writer(response.writer)
+            with open(test_file_path, 'rb') as expected:
+                self.assertEqual(body, expected.read())
+
+    async def async_test_file_writer_chunks(self):
+        """Test that file_writer sends fixed-size binary chunks"""
+        test_file_path = 'test_fixtures/Lexington-Gothic.ttf'
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await file_writer(test_file_path, 1000)(send, None)
+        with open(test_file_path, 'rb') as expected:
+            content = expected.read()
+        self.assertEqual(len(messages), -(-len(content) // 1000))
+        self.assertTrue(all(len(m['body']) == 1000 for m in messages[:-1]))
+        self.assertTrue(all(m['more_body'] for m in messages))
+        self.assertEqual(b''.join(m['body'] for m in messages), content)
+
+    def test_file_writer_chunks(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_file_writer_chunks())
 
     def test_produce_ttf_file(self):
         """Wrapper to run async test"""
         asyncio.run(self.async_test_produce_ttf_file())
 
 
+class TestValidators(unittest.TestCase):
+    """Test validate and ValidatorCache"""
+
+    def test_json_hash(self):
+        """Test that JSON validators hash the encoding without a cache"""
+        state = {'accept': ['application/json', '*/*']}
+        data = {'key': [1, 2]}
+        etag, last_modified = validate(data, state)
+        self.assertIsNone(last_modified)
+        self.assertEqual(validate({'key': [1, 2]}, state)[0], etag)
+        self.assertNotEqual(validate({'key': [1, 3]}, state)[0], etag)
+
+    def test_json_version(self):
+        """Test that JSON validators follow the cache's version, without encoding"""
+        cache = ValidatorCache()
+        state = {'accept': ['application/json', '*/*'], 'validator_cache': cache}
+        data = {'key': [1, 2]}
+        etag, last_modified = validate(data, state)
+        self.assertEqual((etag, last_modified), (cache.version_tag(), cache.modified))
+        data['key'].append(3)
+        self.assertEqual(validate(MappingProxyType(data), state)[0], etag)
+        self.assertEqual(validate({'key': object()}, state)[0], etag)
+        cache.invalidate()
+        self.assertNotEqual(validate(data, state)[0], etag)
+
+    def test_follows_producer(self):
+        """Test that validators are only used for the content type that produces"""
+        self.assertIsNone(validate({'key': 1}, {'accept': ['*/*']}))
+        self.assertIsNone(validate(Exception(), {'accept': ['application/json', '*/*']}))
+
+    def test_version(self):
+        """Test version validators"""
+        self.assertIsNone(validate_version(None, {}))
+        cache = ValidatorCache()
+        state = {'validator_cache': cache}
+        etag, modified = validate_version(None, state)
+        self.assertTrue(etag.startswith('W/"'))
+        cache.invalidate()
+        self.assertNotEqual(validate_version(None, state)[0], etag)
+        self.assertGreaterEqual(cache.modified, modified)
+
+    def test_file(self):
+        """Test that files are validated by stat and missing files are not"""
+        with open('test_fixtures/Lexington-Gothic.ttf', 'rb') as f:
+            etag, last_modified = validate(f, {'accept': ['*/*']})
+        self.assertTrue(etag.startswith('"'))
+        self.assertIsInstance(last_modified, float)
+
+        class Gone(object):
+            name = 'test_fixtures/does-not-exist'
+
+        self.assertIsNone(validate_file(Gone(), {}))
+
+
 if __name__ == "__main__":  # pragma: no cover
     unittest.main(exit=False)  # pragma: no cover
     cov.stop()  # pragma: no cover
@@ -1,7 +1,7 @@
 import unittest
 from _typeshed import Incomplete
 from mumulib import mumutypes as mumutypes
-from mumulib.producers import add_producer as add_producer, custom_serializer as custom_serializer, produce as produce, produce_file as produce_file, produce_json as produce_json
+from mumulib.producers import add_producer as add_producer, custom_serializer as custom_serializer, file_writer as file_writer, produce as produce, iter_json as iter_json, produce_file as produce_file, produce_json as produce_json, validate as validate, validate_file as validate_file, validate_version as validate_version, ValidatorCache as ValidatorCache
 
 cov: Incomplete
 
@@ -35,6 +35,13 @@ class TestProduceJson(unittest.TestCase):
     def test_produce_json_dict(self) -> None: ...
     async def async_test_produce_json_with_mapping_proxy(self) -> None: ...
     def test_produce_json_with_mapping_proxy(self) -> None: ...
+    async def async_test_produce_json_large(self) -> None: ...
+    def test_produce_json_large(self) -> None: ...
+    async def async_test_produce_json_changed_while_streaming(self) -> None: ...
+    def test_produce_json_changed_while_streaming(self) -> None: ...
+    def test_iter_json_circular(self) -> None: ...
+
+async def collect_writer(writer): ...
 
 class TestProduceFile(unittest.TestCase):
     async def async_test_produce_text_file(self) -> None: ...
@@ -45,3 +52,12 @@ class TestProduceFile(unittest.TestCase):
     def test_produce_file_with_unknown_type(self) -> None: ...
     async def async_test_produce_ttf_file(self) -> None: ...
     def test_produce_ttf_file(self) -> None: ...
+    async def async_test_file_writer_chunks(self) -> None: ...
+    def test_file_writer_chunks(self) -> None: ...
+
+class TestValidators(unittest.TestCase):
+    def test_json_hash(self) -> None: ...
+    def test_json_version(self) -> None: ...
+    def test_follows_producer(self) -> None: ...
+    def test_version(self) -> None: ...
+    def test_file(self) -> None: ...
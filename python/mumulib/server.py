@@ -1,17 +1,29 @@
 
 import asyncio
+import email.utils
 import json
+import os
+import tempfile
 import traceback
-from typing import Any, Callable, Dict, Optional
+from typing import Any, AsyncIterator, Callable, Dict, IO, List, Optional, Tuple
 from urllib import parse
 
-from mumulib.consumers import consume
-from mumulib.mumutypes import SpecialResponse
-from mumulib.producers import produce
+from mumulib.compression import available_encodings, COMPRESSION_MIN_SIZE, CompressingSend, negotiate_encoding
+from mumulib.consumers import consume, consume_indexed, PathIndex
+from mumulib.jsonbackend import DEFAULT_BACKEND, get_backend, JSONBackend
+from mumulib.mumutypes import FileResponse, SpecialResponse
+from mumulib.producers import produce, validate, ValidatorCache
+from mumulib.shaped import compile_shape
 
 # Default max request body size: 10MB
 DEFAULT_MAX_BODY_SIZE = 10 * 1024 * 1024
 
+# Suggested consumers_app write_buffer_size: body bytes to collect per send
+WRITE_BUFFER_SIZE = 16 * 1024
+
+# Longest time, in seconds, a buffered chunk waits before it is sent
+WRITE_BUFFER_DELAY = 0.05
+
 
 async def send_error_response(send: Callable, status: int, error_type: str, message: str) -> None:
     """
@@ -35,8 +47,18 @@ async def send_error_response(send: Callable, status: int, error_type: str, mess
     })
 
 
-async def parse_json(receive: Callable, max_size: int = DEFAULT_MAX_BODY_SIZE) -> Optional[Any]:
-    body = b''
+async def iter_body(receive: Callable, max_size: int = DEFAULT_MAX_BODY_SIZE) -> AsyncIterator[bytes]:
+    """
+    Yield request body chunks as they arrive, enforcing the size limit.
+
+    Args:
+        receive: ASGI receive callable
+        max_size: Maximum total body size in bytes
+
+    Raises:
+        ValueError: If the body grows beyond max_size
+    """
+    size = 0
 
     # Receive request body chunks
     while True:
@@ -45,44 +67,42 @@ async def parse_json(receive: Callable, max_size: int = DEFAULT_MAX_BODY_SIZE) -
         # Check if we've reached the end of the body
         # ASGI servers should only send http.request during body reading
         if message['type'] == 'http.request':  # pragma: no branch
-            # Accumulate body chunks
-            body += message.get('body', b'')
+            chunk = message.get('body', b'')
+            size += len(chunk)
 
             # Check if body size exceeds limit
-            if len(body) > max_size:
-                raise ValueError(f"Request body too large: {len(body)} bytes exceeds limit of {max_size} bytes")
+            if size > max_size:
+                raise ValueError(f"Request body too large: {size} bytes exceeds limit of {max_size} bytes")
+
+            if chunk:
+                yield chunk
 
             # Check if this is the last body chunk
             if not message.get('more_body', False):
                 break
 
-    # Process the full body
-    body_text = body.decode('utf-8')
-    if len(body_text):
-        return json.loads(body_text)
+
+async def read_body(receive: Callable, max_size: int = DEFAULT_MAX_BODY_SIZE) -> bytes:
+    """
+    Read the whole request body, joining the received chunks once at the end.
+    """
+    chunks = []
+    async for chunk in iter_body(receive, max_size):
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+async def parse_json(
+    receive: Callable, max_size: int = DEFAULT_MAX_BODY_SIZE, backend: JSONBackend = DEFAULT_BACKEND
+) -> Optional[Any]:
+    body = await read_body(receive, max_size)
+    if len(body):
+        return backend.loads(body)
     return None
 
 
 async def parse_urlencoded(receive: Callable, max_size: int = DEFAULT_MAX_BODY_SIZE) -> Dict[str, Any]:
-    body = b''
-
-    # Receive request body chunks
-    while True:
-        message = await receive()
-
-        # Check if we've reached the end of the body
-        # ASGI servers should only send http.request during body reading
-        if message['type'] == 'http.request':  # pragma: no branch
-            # Accumulate body chunks
-            body += message.get('body', b'')
-
-            # Check if body size exceeds limit
-            if len(body) > max_size:
-                raise ValueError(f"Request body too large: {len(body)} bytes exceeds limit of {max_size} bytes")
-
-            # Check if this is the last body chunk
-            if not message.get('more_body', False):
-                break
+    body = await read_body(receive, max_size)
     result: Dict[str, Any] = {}
     for (k, v) in parse.parse_qsl(body.decode('utf-8')):
         k = parse.unquote(k)
@@ -96,48 +116,306 @@ async def parse_urlencoded(receive: Callable, max_size: int = DEFAULT_MAX_BODY_S
     return result
 
 
-async def parse_multipart(receive: Callable, boundary: bytes, max_size: int = DEFAULT_MAX_BODY_SIZE) -> Dict[str, Any]:
-    body = b''
-    # Receive request body chunks
-    while True:
-        message = await receive()
+# Characters stripped from the end of each part's content
+MULTIPART_TRAILER = b'\r\n-'
 
-        # Check if we've reached the end of the body
-        # ASGI servers should only send http.request during body reading
-        if message['type'] == 'http.request':  # pragma: no branch
-            # Accumulate body chunks
-            body += message.get('body', b'')
 
-            # Check if body size exceeds limit
-            if len(body) > max_size:
-                raise ValueError(f"Request body too large: {len(body)} bytes exceeds limit of {max_size} bytes")
+class MultipartParser(object):
+    """
+    Incremental multipart/form-data parser.
 
-            # Check if this is the last body chunk
-            if not message.get('more_body', False):
-                break
-    result: Dict[str, Any] = {}
-    for part in body.split(boundary):
+    Data is fed in as it arrives and each part is stored in `result` as soon
+    as the boundary that ends it is seen. Fields without a Content-Type are
+    decoded to str; file parts are bytes, or a SpooledTemporaryFile rewound
+    to the start when spool_size is given, so large uploads roll over to
+    disk instead of being held in memory.
+    """
+
+    def __init__(self, boundary: bytes, spool_size: Optional[int] = None) -> None:
+        self.boundary: bytes = boundary
+        self.spool_size: Optional[int] = spool_size
+        self.result: Dict[str, Any] = {}
+        self.buffer: bytearray = bytearray()
+        self.in_body: bool = False
+        self.name: Optional[str] = None
+        self.is_file: bool = False
+        self.chunks: list[bytes] = []
+        self.spool: Optional[IO[bytes]] = None
+
+    def feed(self, data: bytes) -> None:
+        self.buffer += data
+        while True:
+            end = self.buffer.find(self.boundary)
+            if not self.in_body:
+                header_end = self.buffer.find(b"\r\n\r\n")
+                if header_end == -1 or (end != -1 and end < header_end):
+                    if end == -1:
+                        return
+                    self._skip_part(bytes(self.buffer[:end]))
+                    del self.buffer[:end + len(self.boundary)]
+                    continue
+                self._start_part(bytes(self.buffer[:header_end]))
+                del self.buffer[:header_end + 4]
+                continue
+            if end == -1:
+                self._flush()
+                return
+            self._finish_part(bytes(self.buffer[:end]))
+            del self.buffer[:end + len(self.boundary)]
+
+    def close(self) -> Dict[str, Any]:
+        if self.in_body:
+            self._finish_part(bytes(self.buffer))
+        else:
+            self._skip_part(bytes(self.buffer))
+        self.buffer.clear()
+        return self.result
+
+    def _skip_part(self, part: bytes) -> None:
         if not part or part.strip() == b'--':
-            continue
-        headers_bytes, content = part.split(b"\r\n\r\n", 1)
-        headers = headers_bytes.split(b"\r\n")
+            return
+        raise ValueError("Malformed multipart part: missing header terminator")
+
+    def _start_part(self, headers_bytes: bytes) -> None:
         name: Optional[bytes] = None
-        for header in headers:
+        self.is_file = False
+        for header in headers_bytes.split(b"\r\n"):
             if header.startswith(b"Content-Disposition:"):
                 name = header.split(b";")[1].split(b"=")[1][1:-1]
-        if name:
-            # Strip trailing \r\n-- or \r\n from content
-            stripped_content = content.rstrip(b'-').rstrip(b'\r\n')
-            for x in headers:
-                if b'Content-Type' in x:
-                    result[name.decode("utf-8")] = stripped_content
-                    break
+            if b'Content-Type' in header:
+                self.is_file = True
+        self.name = name.decode("utf-8") if name else None
+        self.in_body = True
+        self.chunks = []
+        if self.name is not None and self.is_file and self.spool_size is not None:
+            self.spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+
+    def _write(self, data: bytes) -> None:
+        if self.name is None or not data:
+            return
+        if self.spool is not None:
+            self.spool.write(data)
+        else:
+            self.chunks.append(data)
+
+    def _flush(self) -> None:
+        # Hold back enough to contain a partial boundary, plus any trailing
+        # characters that may still be stripped when the part ends.
+        safe = len(self.buffer) - len(self.boundary) + 1
+        while safe > 0 and self.buffer[safe - 1] in MULTIPART_TRAILER:
+            safe -= 1
+        if safe > 0:
+            self._write(bytes(self.buffer[:safe]))
+            del self.buffer[:safe]
+
+    def _finish_part(self, tail: bytes) -> None:
+        # Strip trailing \r\n-- or \r\n from content
+        self._write(tail.rstrip(b'-').rstrip(b'\r\n'))
+        if self.name is not None:
+            if self.spool is not None:
+                self.spool.seek(0)
+                self.result[self.name] = self.spool
+            elif self.is_file:
+                self.result[self.name] = b''.join(self.chunks)
             else:
-                result[name.decode("utf-8")] = stripped_content.decode("utf-8")
-    return result
+                self.result[self.name] = b''.join(self.chunks).decode("utf-8")
+        self.in_body = False
+        self.name = None
+        self.chunks = []
+        self.spool = None
+
 
+async def parse_multipart(
+    receive: Callable, boundary: bytes, max_size: int = DEFAULT_MAX_BODY_SIZE,
+    spool_size: Optional[int] = None
+) -> Dict[str, Any]:
+    parser = MultipartParser(boundary, spool_size)
+    async for chunk in iter_body(receive, max_size):
+        parser.feed(chunk)
+    return parser.close()
+
+
+async def send_file_response(response: FileResponse, scope: Dict[str, Any], send: Callable, receive: Callable) -> None:
+    """
+    Send a complete file response.
+
+    Uses the ASGI http.response.pathsend or http.response.zerocopysend
+    extension when the server advertises it, and otherwise streams the
+    file through the response's writer.
+    """
+    await send(response.asgi_send_dict)
+    extensions = scope.get("extensions") or {}
+    if "http.response.pathsend" in extensions:
+        # The extension requires an absolute path
+        await send({
+            'type': 'http.response.pathsend',
+            'path': os.path.abspath(response.path),
+        })
+        return
+    if "http.response.zerocopysend" in extensions:
+        with open(response.path, 'rb') as file:
+            await send({
+                'type': 'http.response.zerocopysend',
+                'file': file,
+                'more_body': False,
+            })
+        return
+    if response.writer is not None:
+        await response.writer(send, receive)
+    await send({
+        'type': 'http.response.body',
+        'body': b'',
+        'more_body': False,
+    })
+
+
+class BufferedWriter(object):
+    """Coalesces response body chunks into fewer http.response.body messages.
+
+    Chunks are collected until `size` bytes are buffered. If `delay` is not
+    None, buffered chunks are also sent once they have waited `delay`
+    seconds, so slow streaming producers still reach the client. A size of
+    0 sends every chunk as it is written.
+    """
+
+    def __init__(
+        self, send: Callable, size: int = WRITE_BUFFER_SIZE, delay: Optional[float] = WRITE_BUFFER_DELAY
+    ) -> None:
+        self.send = send
+        self.size = size
+        self.delay = delay
+        self.chunks: List[bytes] = []
+        self.buffered = 0
+        self.lock = asyncio.Lock()
+        self.timer: Optional[asyncio.Task[None]] = None
+
+    async def write(self, data: bytes) -> None:
+        self.chunks.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.size:
+            await self.flush()
+        elif self.timer is None and self.delay is not None:
+            self.timer = asyncio.create_task(self._flush_later(self.delay))
+
+    async def flush(self) -> None:
+        """Send everything buffered so far, if anything."""
+        self._cancel_timer()
+        await self._send(True)
+
+    async def close(self, data: bytes = b'') -> None:
+        """Send everything buffered and `data` as the last body message."""
+        self.chunks.append(data)
+        self._cancel_timer()
+        await self._send(False)
+
+    async def _flush_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        # Cleared before sending, so the send is never cancelled halfway
+        self.timer = None
+        await self._send(True)
+
+    def _cancel_timer(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    async def _send(self, more_body: bool) -> None:
+        async with self.lock:
+            if more_body and not self.chunks:
+                return
+            body = b''.join(self.chunks)
+            self.chunks = []
+            self.buffered = 0
+            await self.send({
+                'type': 'http.response.body',
+                'body': body,
+                'more_body': more_body,
+            })
+
+
+def validator_headers(etag: str, last_modified: Optional[float]) -> List[Tuple[bytes, bytes]]:
+    headers = [(b'etag', etag.encode('ascii'))]
+    if last_modified is not None:
+        headers.append((b'last-modified', email.utils.formatdate(last_modified, usegmt=True).encode('ascii')))
+    return headers
+
+
+def _strip_weak(etag: str) -> str:
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def is_not_modified(headers: List[Tuple[bytes, bytes]], etag: str, last_modified: Optional[float]) -> bool:
+    """Whether a GET with these request headers should be answered with 304.
+
+    If-None-Match is compared weakly, and If-Modified-Since is only
+    consulted when there is no If-None-Match.
+    """
+    if_none_match = None
+    if_modified_since = None
+    for (key, value) in headers:
+        key = key.lower()
+        if key == b'if-none-match':
+            if_none_match = value.decode('latin-1')
+        elif key == b'if-modified-since':
+            if_modified_since = value.decode('latin-1')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        wanted = _strip_weak(etag)
+        return any(_strip_weak(tag.strip()) == wanted for tag in if_none_match.split(','))
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since.timestamp()
+    return False
+
+
+def _with_headers(start: Dict[str, Any], headers: List[Tuple[bytes, bytes]]) -> Dict[str, Any]:
+    if not headers:
+        return start
+    return dict(start, headers=list(start.get('headers', [])) + headers)
+
+
+def consumers_app(
+    root: Any, spool_size: Optional[int] = None, path_index: bool = False, json_backend: str = 'json',
+    etags: bool = False, compression: bool = False, compression_min_size: int = COMPRESSION_MIN_SIZE,
+    write_buffer_size: int = 0, write_buffer_delay: Optional[float] = WRITE_BUFFER_DELAY,
+    compact_html: bool = False, shape: Any = None
+) -> Callable:
+    """Return an ASGI app serving `root`.
+
+    With etags=True, responses for files, JSON and HTML leaves carry ETag
+    and Last-Modified headers, and a GET whose If-None-Match or
+    If-Modified-Since still matches gets a 304 without the leaf being
+    produced. Files are validated by modification time and size, and JSON
+    and HTML by a version counter, which is bumped after every request that
+    is not a GET.
+
+    With compression=True, response bodies of at least compression_min_size
+    bytes are compressed with the best encoding the client accepts among
+    br (if brotli is installed), gzip and deflate.
+
+    With write_buffer_size set, for example to WRITE_BUFFER_SIZE, produced
+    chunks are sent through a BufferedWriter, so the number of sends
+    follows the size of the response rather than the number of chunks.
+
+    With compact_html=True, HTML is rendered without indentation or the
+    newlines around tags, unless the request's state already sets
+    "compact_html" itself.
+
+    With a shape, for example one from shaped.make_shape(root), a PUT
+    whose body would leave `root` no longer matching it gets a 400 and
+    changes nothing. Only the shapes on the written path and the body are
+    checked.
+    """
+    index = PathIndex(root) if path_index else None
+    backend = get_backend(json_backend)
+    validators = ValidatorCache() if etags else None
+    encodings = available_encodings() if compression else []
+    compiled_shape = compile_shape(shape) if shape is not None else None
 
-def consumers_app(root: Any) -> Callable:
     async def app(scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
         if scope['type'] == 'lifespan':
             while True:
@@ -150,9 +428,21 @@ def consumers_app(root: Any) -> Callable:
 
         assert scope['type'] == 'http'
 
+        if encodings:
+            encoding = negotiate_encoding(scope["headers"], encodings)
+            if encoding is not None:
+                send = CompressingSend(send, encoding, compression_min_size)
+
         state = scope["state"]
         state["url"] = scope["path"]
         state["method"] = scope["method"]
+        state["json_backend"] = backend
+        if compact_html:
+            state.setdefault("compact_html", True)
+        if compiled_shape is not None and state["method"] == "PUT":
+            state["shape"] = compiled_shape
+        if validators is not None:
+            state["validator_cache"] = validators
         content_type = None
         if scope["path"].endswith(".json"):
             state["accept"] = ["application/json", "*/*"]
@@ -169,7 +459,7 @@ def consumers_app(root: Any) -> Callable:
                 if key.lower() == b"content-type":
                     lowervalue = value.lower().split(b";")[0]
                     if lowervalue == b'application/json':
-                        state["parsed_body"] = await parse_json(receive)
+                        state["parsed_body"] = await parse_json(receive, backend=backend)
                         state["accept"] = ["application/json", "*/*"]
                         content_type = "application/json; charset=UTF-8"
                     elif lowervalue == b'application/x-www-form-urlencoded':
@@ -177,7 +467,7 @@ def consumers_app(root: Any) -> Callable:
                     elif lowervalue == b'multipart/form-data':
                         boundary = b'--' + value[len(lowervalue) + 11:]
                         state["parsed_body"] = await parse_multipart(
-                            receive, boundary)
+                            receive, boundary, spool_size=spool_size)
                     else:
                         print("Unknown content type: %s" % value)
         except ValueError as exc:
@@ -186,16 +476,42 @@ def consumers_app(root: Any) -> Callable:
             return
 
         try:
-            result = await consume(root, scope["path"].split("/")[1:], state, send)
+            segments = scope["path"].split("/")[1:]
+            if index is not None:
+                result = await consume_indexed(index, segments, state, send)
+            else:
+                result = await consume(root, segments, state, send)
         except Exception as exc:
             # Handle errors during request consumption/routing
             traceback.print_exc()
             await send_error_response(send, 500, "Internal Server Error", str(exc))
             return
+        finally:
+            if validators is not None and state["method"] != "GET":
+                validators.invalidate()
         if result is None:
             await send_error_response(send, 404, "Not Found", f"Resource not found: {scope['path']}")
             return
 
+        extra_headers: List[Tuple[bytes, bytes]] = []
+        if validators is not None and state["method"] == "GET" and not isinstance(result, SpecialResponse):
+            validated = validate(result, state)
+            if validated is not None:
+                extra_headers = validator_headers(*validated)
+                if is_not_modified(scope["headers"], *validated):
+                    await send({
+                        'type': 'http.response.start',
+                        'status': 304,
+                        'headers': extra_headers,
+                    })
+                    await send({
+                        'type': 'http.response.body',
+                        'body': b'',
+                        'more_body': False,
+                    })
+                    return
+
+        body_writer = BufferedWriter(send, write_buffer_size, write_buffer_delay)
         if isinstance(result, SpecialResponse):
             await send(result.asgi_send_dict)
             result = result.leaf_object
@@ -204,37 +520,29 @@ def consumers_app(root: Any) -> Callable:
             try:
                 async for chunk in produce(result, state):
                     if first_chunk:
+                        if isinstance(chunk, FileResponse):
+                            chunk.asgi_send_dict = _with_headers(chunk.asgi_send_dict, extra_headers)
+                            await send_file_response(chunk, scope, send, receive)
+                            return
                         if isinstance(chunk, SpecialResponse):
-                            await send(chunk.asgi_send_dict)
-                            await send({
-                                'type': 'http.response.body',
-                                'body': str(chunk.leaf_object).encode('utf8'),
-                                'more_body': True,
-                            })
+                            await send(_with_headers(chunk.asgi_send_dict, extra_headers))
+                            leaf = chunk.leaf_object
+                            await body_writer.write(leaf if isinstance(leaf, bytes) else str(leaf).encode('utf8'))
                             if chunk.writer is not None:
+                                await body_writer.flush()
                                 await chunk.writer(send, receive)
                         else:
                             await send({
                                 'type': 'http.response.start',
                                 'status': 200,
-                                'headers': [(b'content-type', content_type.encode('utf8'))],
+                                'headers': [(b'content-type', content_type.encode('utf8'))] + extra_headers,
                             })
                             # Handle both str and bytes chunks
-                            chunk_bytes = chunk if isinstance(chunk, bytes) else str(chunk).encode('utf8')
-                            await send({
-                                'type': 'http.response.body',
-                                'body': chunk_bytes,
-                                'more_body': True,
-                            })
+                            await body_writer.write(chunk if isinstance(chunk, bytes) else str(chunk).encode('utf8'))
                         first_chunk = False
                     else:
                         # Handle both str and bytes chunks
-                        chunk_bytes = chunk if isinstance(chunk, bytes) else str(chunk).encode('utf8')
-                        await send({
-                            'type': 'http.response.body',
-                            'body': chunk_bytes,
-                            'more_body': True,
-                        })
+                        await body_writer.write(chunk if isinstance(chunk, bytes) else str(chunk).encode('utf8'))
                 result = "\n"
             except SpecialResponse as special:
                 if first_chunk:
@@ -260,11 +568,7 @@ def consumers_app(root: Any) -> Callable:
         else:
             result_bytes = str(result).encode('utf8')
 
-        await send({
-            'type': 'http.response.body',
-            'body': result_bytes,
-            'more_body': False,
-        })
+        await body_writer.close(result_bytes)
 
     return app
 
@@ -1,14 +1,54 @@
+import asyncio
 from _typeshed import Incomplete
-from mumulib.consumers import consume as consume
-from mumulib.mumutypes import SpecialResponse as SpecialResponse
-from mumulib.producers import produce as produce
-from typing import Any, Callable
+from mumulib.compression import COMPRESSION_MIN_SIZE as COMPRESSION_MIN_SIZE, CompressingSend as CompressingSend, available_encodings as available_encodings, negotiate_encoding as negotiate_encoding
+from mumulib.consumers import PathIndex as PathIndex, consume as consume, consume_indexed as consume_indexed
+from mumulib.jsonbackend import DEFAULT_BACKEND as DEFAULT_BACKEND, JSONBackend as JSONBackend, get_backend as get_backend
+from mumulib.mumutypes import FileResponse as FileResponse, SpecialResponse as SpecialResponse
+from mumulib.producers import ValidatorCache as ValidatorCache, produce as produce, validate as validate
+from typing import Any, AsyncIterator, Callable, IO
 
 DEFAULT_MAX_BODY_SIZE: Incomplete
+WRITE_BUFFER_SIZE: int
+WRITE_BUFFER_DELAY: float
 
 async def send_error_response(send: Callable, status: int, error_type: str, message: str) -> None: ...
-async def parse_json(receive: Callable, max_size: int = ...) -> Any | None: ...
+async def iter_body(receive: Callable, max_size: int = ...) -> AsyncIterator[bytes]: ...
+async def read_body(receive: Callable, max_size: int = ...) -> bytes: ...
+async def parse_json(receive: Callable, max_size: int = ..., backend: JSONBackend = ...) -> Any | None: ...
 async def parse_urlencoded(receive: Callable, max_size: int = ...) -> dict[str, Any]: ...
-async def parse_multipart(receive: Callable, boundary: bytes, max_size: int = ...) -> dict[str, Any]: ...
-def consumers_app(root: Any) -> Callable: ...
+
+MULTIPART_TRAILER: bytes
+
+class MultipartParser:
+    boundary: bytes
+    spool_size: int | None
+    result: dict[str, Any]
+    buffer: bytearray
+    in_body: bool
+    name: str | None
+    is_file: bool
+    chunks: list[bytes]
+    spool: IO[bytes] | None
+    def __init__(self, boundary: bytes, spool_size: int | None = None) -> None: ...
+    def feed(self, data: bytes) -> None: ...
+    def close(self) -> dict[str, Any]: ...
+
+async def parse_multipart(receive: Callable, boundary: bytes, max_size: int = ..., spool_size: int | None = None) -> dict[str, Any]: ...
+async def send_file_response(response: FileResponse, scope: dict[str, Any], send: Callable, receive: Callable) -> None: ...
+class BufferedWriter:
+    send: Callable
+    size: int
+    delay: float | None
+    chunks: list[bytes]
+    buffered: int
+    lock: asyncio.Lock
+    timer: asyncio.Task[None] | None
+    def __init__(self, send: Callable, size: int = ..., delay: float | None = ...) -> None: ...
+    async def write(self, data: bytes) -> None: ...
+    async def flush(self) -> None: ...
+    async def close(self, data: bytes = b'') -> None: ...
+
+def validator_headers(etag: str, last_modified: float | None) -> list[tuple[bytes, bytes]]: ...
+def is_not_modified(headers: list[tuple[bytes, bytes]], etag: str, last_modified: float | None) -> bool: ...
+def consumers_app(root: Any, spool_size: int | None = None, path_index: bool = False, json_backend: str = 'json', etags: bool = False, compression: bool = False, compression_min_size: int = ..., write_buffer_size: int = 0, write_buffer_delay: float | None = ..., compact_html: bool = False, shape: Any = None) -> Callable: ...
 def EventSource(output_queue): ...
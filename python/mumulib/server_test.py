@@ -7,12 +7,19 @@ cov.start()  # pragma: no cover
 import unittest  # pragma: no cover
 import asyncio  # pragma: no cover
 import json  # pragma: no cover
+import os  # pragma: no cover
+import subprocess  # pragma: no cover
+import sys  # pragma: no cover
 
 from mumulib.server import (  # pragma: no cover
     parse_json,
     parse_urlencoded,
     parse_multipart,
+    read_body,
+    BufferedWriter,
     consumers_app,
+    is_not_modified,
+    MultipartParser,
     DEFAULT_MAX_BODY_SIZE
 )
 
@@ -491,6 +498,113 @@ class TestParseMultipart(unittest.TestCase):
         """Wrapper to run async test"""
         asyncio.run(self.async_test_parse_multipart_malformed_part())
 
+    async def async_test_parse_multipart_byte_at_a_time(self):
+        """Test that parts are found when boundaries straddle chunks"""
+        boundary = b'------WebKitFormBoundary7MA4YWxkTrZu0gW'
+        body = (
+            b'------WebKitFormBoundary7MA4YWxkTrZu0gW\r\n'
+            b'Content-Disposition: form-data; name="field1"\r\n'
+            b'\r\n'
+            b'value-1\r\n'
+            b'------WebKitFormBoundary7MA4YWxkTrZu0gW\r\n'
+            b'Content-Disposition: form-data; name="file"; filename="test.bin"\r\n'
+            b'Content-Type: application/octet-stream\r\n'
+            b'\r\n'
+            b'binary\r\ncontent\r\n'
+            b'------WebKitFormBoundary7MA4YWxkTrZu0gW--\r\n'
+        )
+        chunks = [body[i:i + 1] for i in range(len(body))]
+
+        async def receive():
+            chunk = chunks.pop(0)
+            return {
+                'type': 'http.request',
+                'body': chunk,
+                'more_body': bool(chunks)
+            }
+
+        result = await parse_multipart(receive, boundary)
+        self.assertEqual(result, {'field1': 'value-1', 'file': b'binary\r\ncontent'})
+
+    def test_parse_multipart_byte_at_a_time(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_parse_multipart_byte_at_a_time())
+
+    async def async_test_parse_multipart_spool(self):
+        """Test that file parts are spooled to a temporary file"""
+        boundary = b'------WebKitFormBoundary7MA4YWxkTrZu0gW'
+        content = b'x' * 5000
+        body = (
+            b'------WebKitFormBoundary7MA4YWxkTrZu0gW\r\n'
+            b'Content-Disposition: form-data; name="file"; filename="test.bin"\r\n'
+            b'Content-Type: application/octet-stream\r\n'
+            b'\r\n' + content + b'\r\n'
+            b'------WebKitFormBoundary7MA4YWxkTrZu0gW\r\n'
+            b'Content-Disposition: form-data; name="field1"\r\n'
+            b'\r\n'
+            b'value1\r\n'
+            b'------WebKitFormBoundary7MA4YWxkTrZu0gW--'
+        )
+        chunks = [body[i:i + 1000] for i in range(0, len(body), 1000)]
+
+        async def receive():
+            chunk = chunks.pop(0)
+            return {
+                'type': 'http.request',
+                'body': chunk,
+                'more_body': bool(chunks)
+            }
+
+        result = await parse_multipart(receive, boundary, spool_size=1024)
+        self.assertEqual(result['field1'], 'value1')
+        spooled = result['file']
+        self.assertTrue(spooled._rolled)
+        self.assertEqual(spooled.read(), content)
+        spooled.close()
+
+    def test_parse_multipart_spool(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_parse_multipart_spool())
+
+    def test_parse_multipart_missing_header_terminator(self):
+        """Test that a part without a header terminator is rejected"""
+        parser = MultipartParser(b'--boundary')
+        parser.feed(b'--boundary\r\nContent-Disposition: form-data; name="a"\r\n')
+        self.assertEqual(parser.result, {})
+        with self.assertRaises(ValueError):
+            parser.feed(b'value\r\n--boundary--')
+
+    def test_parse_multipart_unnamed_part_discarded(self):
+        """Test that content of parts without a name is not kept"""
+        parser = MultipartParser(b'--boundary')
+        parser.feed(b'--boundary\r\nX-Other: 1\r\n\r\n' + b'y' * 100)
+        self.assertEqual(parser.chunks, [])
+        parser.feed(b'\r\n--boundary--')
+        self.assertEqual(parser.close(), {})
+
+
+class TestReadBody(unittest.TestCase):
+    """Test read_body function"""
+
+    async def async_test_read_body_many_chunks(self):
+        """Test that many small chunks are joined in order"""
+        chunks = [bytes([65 + i % 26]) * 10 for i in range(1000)]
+        expected = b''.join(chunks)
+
+        async def receive():
+            chunk = chunks.pop(0)
+            return {
+                'type': 'http.request',
+                'body': chunk,
+                'more_body': bool(chunks)
+            }
+
+        self.assertEqual(await read_body(receive), expected)
+
+    def test_read_body_many_chunks(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_read_body_many_chunks())
+
 
 class TestBytesResultHandling(unittest.TestCase):
     """Test handling of bytes results"""
@@ -1471,6 +1585,307 @@ class TestEventSource(unittest.TestCase):
         asyncio.run(self.async_test_eventsource_client_disconnect())
 
 
+class TestFileResponses(unittest.TestCase):
+    """Test serving files through consumers_app"""
+
+    FONT = 'test_fixtures/Lexington-Gothic.ttf'
+
+    async def serve(self, extensions=None):
+        with open(self.FONT, 'rb') as font:
+            app = consumers_app({'font.ttf': font})
+            sent_messages = []
+
+            async def send(message):
+                sent_messages.append(message)
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}  # pragma: no cover
+
+            scope = {
+                'type': 'http',
+                'method': 'GET',
+                'path': '/font.ttf',
+                'headers': [],
+                'state': {}
+            }
+            if extensions is not None:
+                scope['extensions'] = extensions
+            await app(scope, receive, send)
+        return sent_messages
+
+    async def async_test_streamed(self):
+        """Test that files are streamed as exact bytes"""
+        sent_messages = await self.serve()
+        self.assertEqual(sent_messages[0]['status'], 200)
+        bodies = sent_messages[1:]
+        self.assertTrue(all(m['type'] == 'http.response.body' for m in bodies))
+        self.assertFalse(bodies[-1]['more_body'])
+        with open(self.FONT, 'rb') as expected:
+            self.assertEqual(b''.join(m['body'] for m in bodies), expected.read())
+
+    def test_streamed(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_streamed())
+
+    async def async_test_pathsend(self):
+        """Test that the pathsend extension is used when advertised"""
+        sent_messages = await self.serve({'http.response.pathsend': {}})
+        self.assertEqual(len(sent_messages), 2)
+        self.assertEqual(sent_messages[1], {'type': 'http.response.pathsend', 'path': os.path.abspath(self.FONT)})
+        self.assertTrue(os.path.isabs(sent_messages[1]['path']))
+
+    def test_pathsend(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_pathsend())
+
+    async def async_test_zerocopysend(self):
+        """Test that the zerocopysend extension is used when advertised"""
+        sent_messages = await self.serve({'http.response.zerocopysend': {}})
+        self.assertEqual(len(sent_messages), 2)
+        self.assertEqual(sent_messages[1]['type'], 'http.response.zerocopysend')
+        self.assertEqual(sent_messages[1]['file'].name, self.FONT)
+        self.assertFalse(sent_messages[1]['more_body'])
+
+    def test_zerocopysend(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_zerocopysend())
+
+
+class TestConditionalGet(unittest.TestCase):
+    """Test ETag and Last-Modified handling in consumers_app"""
+
+    FONT = 'test_fixtures/Lexington-Gothic.ttf'
+
+    async def request(self, app, method, path, headers=(), body=b''):
+        sent_messages = []
+
+        async def send(message):
+            sent_messages.append(message)
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'headers': list(headers),
+            'state': {}
+        }
+        await app(scope, receive, send)
+        return sent_messages
+
+    def header(self, messages, name):
+        return dict(messages[0]['headers']).get(name)
+
+    async def async_test_json_etag(self):
+        """Test that JSON leaves get a version ETag that changes after a PUT"""
+        app = consumers_app({"data.json": {"x": [1, 2]}}, etags=True)
+        first = await self.request(app, 'GET', '/data.json')
+        etag = self.header(first, b'etag')
+        self.assertTrue(etag.startswith(b'W/"'))
+        self.assertIsNotNone(self.header(first, b'last-modified'))
+
+        again = await self.request(app, 'GET', '/data.json', [(b'If-None-Match', etag)])
+        self.assertEqual(again[0]['status'], 304)
+        self.assertEqual(self.header(again, b'etag'), etag)
+        self.assertEqual(again[1], {'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+        weak = await self.request(app, 'GET', '/data.json', [(b'if-none-match', b'"other", ' + etag[2:])])
+        self.assertEqual(weak[0]['status'], 304)
+
+        await self.request(
+            app, 'PUT', '/data.json/y', [(b'content-type', b'application/json')], b'3')
+        changed = await self.request(app, 'GET', '/data.json', [(b'if-none-match', etag)])
+        self.assertEqual(changed[0]['status'], 200)
+        self.assertNotEqual(self.header(changed, b'etag'), etag)
+
+    def test_json_etag(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_json_etag())
+
+    async def async_test_producer_not_run(self):
+        """Test that a 304 is sent without producing the leaf"""
+        from mumulib import producers
+
+        app = consumers_app({"data.json": [1, 2]}, etags=True)
+        etag = self.header(await self.request(app, 'GET', '/data.json'), b'etag')
+        original = producers._producer_adapters['application/json'][list]
+
+        async def fail(thing, state):  # pragma: no cover
+            raise AssertionError("producer ran")
+            yield
+
+        producers._producer_adapters['application/json'][list] = fail
+        try:
+            again = await self.request(app, 'GET', '/data.json', [(b'if-none-match', etag)])
+        finally:
+            producers._producer_adapters['application/json'][list] = original
+        self.assertEqual(again[0]['status'], 304)
+
+    def test_producer_not_run(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_producer_not_run())
+
+    async def async_test_file_validators(self):
+        """Test that files get ETag and Last-Modified from stat"""
+        with open(self.FONT, 'rb') as font:
+            app = consumers_app({'font.ttf': font}, etags=True)
+            first = await self.request(app, 'GET', '/font.ttf')
+            etag = self.header(first, b'etag')
+            last_modified = self.header(first, b'last-modified')
+            self.assertIsNotNone(etag)
+            self.assertIsNotNone(last_modified)
+
+            by_etag = await self.request(app, 'GET', '/font.ttf', [(b'if-none-match', etag)])
+            self.assertEqual(by_etag[0]['status'], 304)
+            by_date = await self.request(app, 'GET', '/font.ttf', [(b'if-modified-since', last_modified)])
+            self.assertEqual(by_date[0]['status'], 304)
+            stale = await self.request(
+                app, 'GET', '/font.ttf', [(b'if-modified-since', b'Mon, 01 Jan 2001 00:00:00 GMT')])
+            self.assertEqual(stale[0]['status'], 200)
+
+    def test_file_validators(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_file_validators())
+
+    async def async_test_disabled_and_unvalidated(self):
+        """Test that validators are opt-in and skipped for unknown leaves"""
+        app = consumers_app({"data.json": [1, 2]})
+        messages = await self.request(app, 'GET', '/data.json')
+        self.assertIsNone(self.header(messages, b'etag'))
+
+        app = consumers_app({"data": "text"}, etags=True)
+        messages = await self.request(app, 'GET', '/data', [(b'if-none-match', b'*')])
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIsNone(self.header(messages, b'etag'))
+
+    def test_disabled_and_unvalidated(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_disabled_and_unvalidated())
+
+    def test_is_not_modified(self):
+        self.assertTrue(is_not_modified([(b'if-none-match', b'*')], '"a"', None))
+        self.assertFalse(is_not_modified([(b'if-none-match', b'"b"')], '"a"', None))
+        self.assertFalse(is_not_modified([], '"a"', 0.0))
+        self.assertFalse(is_not_modified([(b'if-modified-since', b'garbage')], '"a"', 0.0))
+        self.assertFalse(is_not_modified([(b'if-modified-since', b'Mon, 01 Jan 2001 00:00:00 GMT')], '"a"', None))
+        # If-None-Match takes precedence over If-Modified-Since
+        self.assertFalse(is_not_modified(
+            [(b'if-none-match', b'"b"'), (b'if-modified-since', b'Mon, 01 Jan 2001 00:00:00 GMT')],
+            '"a"', 0.0))
+
+
+class TestBufferedWriter(unittest.TestCase):
+    """Test BufferedWriter and write buffering in consumers_app"""
+
+    async def async_test_threshold(self):
+        """Test that chunks are sent once the threshold is reached"""
+        sent_messages = []
+
+        async def send(message):
+            sent_messages.append(message)
+
+        writer = BufferedWriter(send, 10, None)
+        await writer.write(b'12345')
+        await writer.write(b'678')
+        self.assertEqual(sent_messages, [])
+        await writer.write(b'90')
+        self.assertEqual(sent_messages, [{'type': 'http.response.body', 'body': b'1234567890', 'more_body': True}])
+        await writer.flush()
+        self.assertEqual(len(sent_messages), 1)
+        await writer.write(b'ab')
+        await writer.close(b'cd')
+        self.assertEqual(sent_messages[-1], {'type': 'http.response.body', 'body': b'abcd', 'more_body': False})
+
+    def test_threshold(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_threshold())
+
+    async def async_test_delay(self):
+        """Test that buffered chunks are sent after the delay"""
+        sent_messages = []
+
+        async def send(message):
+            sent_messages.append(message)
+
+        writer = BufferedWriter(send, 1024, 0.01)
+        await writer.write(b'event')
+        await asyncio.sleep(0.05)
+        self.assertEqual(sent_messages, [{'type': 'http.response.body', 'body': b'event', 'more_body': True}])
+        await writer.write(b'later')
+        await writer.close()
+        self.assertEqual(sent_messages[-1]['body'], b'later')
+        await asyncio.sleep(0.02)
+        self.assertEqual(len(sent_messages), 2)
+
+    def test_delay(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_delay())
+
+    async def async_test_consumers_app(self):
+        """Test that many small chunks become few sends with the same body"""
+        async def page(thing, state):
+            for i in range(5000):
+                yield f"<li>{i}</li>"
+
+        async def get(app):
+            sent_messages = []
+
+            async def send(message):
+                sent_messages.append(message)
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}  # pragma: no cover
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/page', 'headers': [], 'state': {}}
+            await app(scope, receive, send)
+            return sent_messages
+
+        unbuffered = await get(consumers_app({'page': page}))
+        buffered = await get(consumers_app({'page': page}, write_buffer_size=16 * 1024))
+        self.assertEqual(len(unbuffered), 5002)
+        self.assertLess(len(buffered), 10)
+        self.assertEqual(
+            b''.join(m['body'] for m in buffered[1:]),
+            b''.join(m['body'] for m in unbuffered[1:]))
+        self.assertFalse(buffered[-1]['more_body'])
+
+    def test_consumers_app(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_consumers_app())
+
+
+def imported_modules(module):  # pragma: no cover
+    """Import module in a fresh interpreter with -X importtime and return
+    the names of the modules it loaded."""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            modules.add(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+class TestImportTime(unittest.TestCase):
+    """Test that heavy optional dependencies are not loaded at import"""
+
+    def test_server(self):
+        modules = imported_modules("mumulib.server")
+        self.assertIn("mumulib.producers", modules)
+        self.assertNotIn("aiofiles", modules)
+        self.assertNotIn("lxml", modules)
+
+    def test_tags(self):
+        modules = imported_modules("mumulib.tags")
+        self.assertIn("mumulib.tags", modules)
+        self.assertNotIn("lxml", modules)
+        self.assertNotIn("lxml.etree", modules)
+
+
 if __name__ == "__main__":  # pragma: no cover
     unittest.main(exit=False)  # pragma: no cover
     cov.stop()  # pragma: no cover
@@ -1,9 +1,11 @@
 import unittest
 from _typeshed import Incomplete
-from mumulib.server import DEFAULT_MAX_BODY_SIZE as DEFAULT_MAX_BODY_SIZE, consumers_app as consumers_app, parse_json as parse_json, parse_multipart as parse_multipart, parse_urlencoded as parse_urlencoded
+from mumulib.server import BufferedWriter as BufferedWriter, DEFAULT_MAX_BODY_SIZE as DEFAULT_MAX_BODY_SIZE, MultipartParser as MultipartParser, consumers_app as consumers_app, is_not_modified as is_not_modified, parse_json as parse_json, parse_multipart as parse_multipart, parse_urlencoded as parse_urlencoded, read_body as read_body
 
 cov: Incomplete
 
+def imported_modules(module): ...
+
 class TestParseJson(unittest.TestCase):
     async def async_test_parse_json_basic(self): ...
     def test_parse_json_basic(self) -> None: ...
@@ -47,6 +49,16 @@ class TestParseMultipart(unittest.TestCase):
     def test_parse_multipart_multiple_chunks(self) -> None: ...
     async def async_test_parse_multipart_malformed_part(self): ...
     def test_parse_multipart_malformed_part(self) -> None: ...
+    async def async_test_parse_multipart_byte_at_a_time(self): ...
+    def test_parse_multipart_byte_at_a_time(self) -> None: ...
+    async def async_test_parse_multipart_spool(self) -> None: ...
+    def test_parse_multipart_spool(self) -> None: ...
+    def test_parse_multipart_missing_header_terminator(self) -> None: ...
+    def test_parse_multipart_unnamed_part_discarded(self) -> None: ...
+
+class TestReadBody(unittest.TestCase):
+    async def async_test_read_body_many_chunks(self): ...
+    def test_read_body_many_chunks(self) -> None: ...
 
 class TestBytesResultHandling(unittest.TestCase):
     async def async_test_bytes_result(self): ...
@@ -91,3 +103,39 @@ class TestEventSource(unittest.TestCase):
     def test_eventsource_streaming(self) -> None: ...
     async def async_test_eventsource_client_disconnect(self): ...
     def test_eventsource_client_disconnect(self) -> None: ...
+
+class TestFileResponses(unittest.TestCase):
+    FONT: str
+    async def serve(self, extensions=None): ...
+    async def async_test_streamed(self) -> None: ...
+    def test_streamed(self) -> None: ...
+    async def async_test_pathsend(self) -> None: ...
+    def test_pathsend(self) -> None: ...
+    async def async_test_zerocopysend(self) -> None: ...
+    def test_zerocopysend(self) -> None: ...
+
+class TestConditionalGet(unittest.TestCase):
+    FONT: str
+    async def request(self, app, method, path, headers=(), body=b''): ...
+    def header(self, messages, name): ...
+    async def async_test_json_etag(self) -> None: ...
+    def test_json_etag(self) -> None: ...
+    async def async_test_producer_not_run(self): ...
+    def test_producer_not_run(self) -> None: ...
+    async def async_test_file_validators(self) -> None: ...
+    def test_file_validators(self) -> None: ...
+    async def async_test_disabled_and_unvalidated(self) -> None: ...
+    def test_disabled_and_unvalidated(self) -> None: ...
+    def test_is_not_modified(self) -> None: ...
+
+class TestBufferedWriter(unittest.TestCase):
+    async def async_test_threshold(self) -> None: ...
+    def test_threshold(self) -> None: ...
+    async def async_test_delay(self) -> None: ...
+    def test_delay(self) -> None: ...
+    async def async_test_consumers_app(self): ...
+    def test_consumers_app(self) -> None: ...
+
+class TestImportTime(unittest.TestCase):
+    def test_server(self) -> None: ...
+    def test_tags(self) -> None: ...
@@ -25,8 +25,11 @@ THE SOFTWARE.
 """
 
 
+import json
 import traceback
-from typing import Any, Callable
+from collections.abc import Mapping, Sequence
+from operator import itemgetter
+from typing import Any, Callable, Iterable, Iterator
 
 
 CONTAINER_TYPES: list[type] = [dict, list, tuple]
@@ -60,9 +63,14 @@ def is_shaped(thing: Any, shape: Any) -> bool:
     by `shape`. If `thing` is shaped correctly, it returns True. If not, it
     returns False.
 
+    `shape` may also be a CompiledShape, which checks `thing` without
+    building an exception when it does not match.
+
     Returns:
         bool: True if `thing` conforms to `shape`, False otherwise.
     """
+    if type(shape) is CompiledShape:
+        return shape.validate(thing)
     try:
         _is_shaped_exc(thing, shape)
         return True
@@ -71,6 +79,9 @@ def is_shaped(thing: Any, shape: Any) -> bool:
 
 
 def _is_shaped_exc(thing: Any, shape: Any) -> None:
+    if type(shape) is CompiledShape:
+        shape.check(thing)
+        return
     if type(shape) in CONTAINER_TYPES:
         shape_type = type(shape)
 
@@ -111,6 +122,252 @@ def _is_shaped_exc(thing: Any, shape: Any) -> None:
             shape, thing))
 
 
+def _never(thing: Any) -> bool:
+    return False
+
+
+def _is_scalar_shape(shape: Any) -> bool:
+    return type(shape) not in CONTAINER_TYPES and shape in SCALAR_TYPES
+
+
+def _compile_fields(shape: dict[Any, Any]) -> tuple[tuple[Any, ...], tuple[Any, ...]]:
+    """Split a dict shape into (name, type) pairs for its scalar fields and
+    (name, validator) pairs for the rest."""
+    scalars = tuple(
+        (name, subshape) for name, subshape in shape.items() if _is_scalar_shape(subshape))
+    nested = tuple(
+        (name, _compile(subshape)) for name, subshape in shape.items() if not _is_scalar_shape(subshape))
+    return scalars, nested
+
+
+_DICTS_ONLY = {dict}
+
+
+def _compile_records(shape: dict[Any, Any], validate_list: Callable[[Any], bool]) -> Callable[[Any], bool]:
+    """Return a validator for a list of dicts shaped like `shape` that works
+    a field at a time over all of the records, rather than a record at a
+    time. The loops over the records run in map and set, in C. Lists that
+    hold anything but plain dicts are left to `validate_list`."""
+    scalars, nested = _compile_fields(shape)
+    columns = tuple((itemgetter(name), {scalar}) for name, scalar in scalars)
+    nested_columns = tuple((itemgetter(name), validate) for name, validate in nested)
+
+    def validate_records(thing: Any) -> bool:
+        if type(thing) is not list or set(map(type, thing)) != _DICTS_ONLY:
+            return validate_list(thing)
+        try:
+            for getter, only in columns:
+                if set(map(type, map(getter, thing))) != only:
+                    return False
+            for getter, validate in nested_columns:
+                if not all(map(validate, map(getter, thing))):
+                    return False
+        except KeyError:
+            return False
+        return True
+    return validate_records
+
+
+def _compile(shape: Any) -> Callable[[Any], bool]:
+    """Return a function that is true of the things _is_shaped_exc accepts
+    for `shape`, and false otherwise, without raising."""
+    shape_type = type(shape)
+    if shape_type is CompiledShape:
+        return shape.validate
+    if shape_type is dict:
+        # Scalar fields are checked inline, without a call per field
+        scalars, nested = _compile_fields(shape)
+
+        def validate_dict(thing: Any) -> bool:
+            try:
+                for name, scalar in scalars:
+                    if name not in thing or type(thing[name]) is not scalar:
+                        return False
+                for name, validate in nested:
+                    if name not in thing or not validate(thing[name]):
+                        return False
+            except TypeError:
+                return False
+            return True
+        return validate_dict
+    if shape_type is list:
+        subshape = shape[0]
+        if _is_scalar_shape(subshape):
+            only = {subshape}
+
+            def validate_scalar_list(thing: Any) -> bool:
+                try:
+                    kinds = set(map(type, thing))
+                except TypeError:
+                    return False
+                return not kinds or kinds == only
+            return validate_scalar_list
+        validate_item = _compile(subshape)
+
+        def validate_list(thing: Any) -> bool:
+            try:
+                for subitem in thing:
+                    if not validate_item(subitem):
+                        return False
+            except TypeError:
+                return False
+            return True
+        if type(subshape) is dict:
+            return _compile_records(subshape, validate_list)
+        return validate_list
+    if shape_type is tuple:
+        validators = tuple(_compile(subshape) for subshape in shape)
+        size = len(shape)
+
+        def validate_tuple(thing: Any) -> bool:
+            try:
+                if len(thing) != size:
+                    return False
+                for validate, subitem in zip(validators, thing):
+                    if not validate(subitem):
+                        return False
+            except TypeError:
+                return False
+            return True
+        return validate_tuple
+    if shape in SCALAR_TYPES:
+        def validate_scalar(thing: Any) -> bool:
+            return type(thing) is shape
+        return validate_scalar
+    return _never
+
+
+def _is_sequence(data: Any) -> bool:
+    """Whether a list or tuple shape can index into `data`. Strings are
+    sequences too, but not ones a shape describes."""
+    return isinstance(data, Sequence) and not isinstance(data, (str, bytes))
+
+
+def _step(shape: Any, data: Any, segment: Any) -> tuple[Any, Any] | None:
+    """Follow one path segment of would_retain_shape without raising.
+
+    Returns the key of the subshape in `shape` and the child of `data`, or
+    None where _would_retain_shape_exc would raise.
+    """
+    if isinstance(shape, dict):
+        if segment in shape:
+            key = segment
+        elif str in shape:
+            key = str
+        else:
+            return None
+        if not isinstance(data, Mapping):
+            return None
+        return key, data.get(segment, '')
+    if isinstance(shape, (list, tuple)):
+        if isinstance(shape, list) and len(shape) != 1:
+            return None
+        try:
+            index = int(segment)
+        except (TypeError, ValueError):
+            return None
+        if not _is_sequence(data):
+            return None
+        if isinstance(shape, list):
+            if len(data) <= index or -index > len(data):
+                return None
+            return 0, data[index]
+        if len(data) != len(shape) or not 0 <= index < len(data):
+            return None
+        return index, data[index]
+    return None
+
+
+class CompiledShape(object):
+    """A shape turned into a validator once, for checking many things.
+
+    Calling it returns whether a thing is shaped like `shape`, as is_shaped
+    does, but without interpreting the shape or building an exception on a
+    mismatch. check raises the same ShapeMismatch as the uncompiled
+    shape does, for when the reason is wanted. The shape must not be
+    changed after it is compiled.
+    """
+
+    def __init__(self, shape: Any) -> None:
+        self.shape = shape
+        self.validate = _compile(shape)
+        self.validate_item: Callable[[Any], bool] | None = None
+        if type(shape) is list:
+            self.validate_item = _compile(shape[0])
+        # Compiled subshapes, by key, for step
+        self.children: dict[Any, 'CompiledShape'] = {}
+
+    def __call__(self, thing: Any) -> bool:
+        return self.validate(thing)
+
+    def first_mismatch(self, thing: Any) -> int | None:
+        """Return the index of the first item of `thing` that does not
+        match a list shape, or None if they all do."""
+        if self.validate_item is None:
+            raise MalformedShape("first_mismatch needs a list shape, not %s" % (self.shape,))
+        if self.validate(thing):
+            return None
+        for index, subitem in enumerate(thing):
+            if not self.validate_item(subitem):
+                return index
+        return None  # pragma: no cover
+
+    def child(self, key: Any) -> 'CompiledShape':
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = compile_shape(self.shape[key])
+        return child
+
+    def step(self, data: Any, segment: Any) -> 'tuple[CompiledShape, Any] | None':
+        """Follow one path segment into `data`, as would_retain_shape does.
+
+        Returns the compiled shape of the child and the child itself, or
+        None if the shape has no place for the segment or `data` is not
+        shaped to have it.
+        """
+        stepped = _step(self.shape, data, segment)
+        if stepped is None:
+            return None
+        return self.child(stepped[0]), stepped[1]
+
+    def would_retain(self, data: Any, segs: list[str], leaf: Any) -> bool:
+        """The compiled form of would_retain_shape. Only the shapes on the
+        path are visited, and each is compiled the first time it is."""
+        shape = self
+        for segment in segs:
+            stepped = shape.step(data, segment)
+            if stepped is None:
+                return False
+            shape, data = stepped
+        return shape.validate(leaf)
+
+    def check(self, thing: Any) -> None:
+        """Raise a ShapeMismatch describing why `thing` does not match."""
+        if self.validate(thing):
+            return
+        try:
+            _is_shaped_exc(thing, self.shape)
+        except TypeError:
+            pass
+        # Things that are not containers at all, where the shape wants one
+        raise TypeMismatch(
+            "wrong type for shape %s: %s" % (
+                self.shape, thing))
+
+
+def compile_shape(shape: Any) -> CompiledShape:
+    """Compile `shape` into a CompiledShape.
+
+    Compiling costs a few is_shaped calls on a small thing. It pays for
+    itself when the same shape checks many things, such as every request
+    to an endpoint or a long list. A list of dicts is checked a field at a
+    time across all of its dicts.
+    """
+    if type(shape) is CompiledShape:
+        return shape
+    return CompiledShape(shape)
+
+
 class MalformedShape(Exception):
     pass
 
@@ -169,7 +426,149 @@ def anything(item: Any) -> None:
     raise NotImplementedError  # pragma: no cover
 
 
+# The item shape of a list for which no items have been seen yet
+_UNKNOWN = object()
+
+
+def _merge_shape(shape: Any, what: Any) -> Any:
+    """Return `shape` widened so that `what` matches it too. The result is
+    `shape` itself, not a copy, when `what` already matches it."""
+    what_type = type(what)
+    if shape is _UNKNOWN:
+        if what_type is dict:
+            return {key: _merge_shape(_UNKNOWN, value) for key, value in what.items()}
+        if what_type is list:
+            item = _UNKNOWN
+            for subitem in what:
+                item = _merge_shape(item, subitem)
+            return [item]
+        if what_type is tuple:
+            return tuple(_merge_shape(_UNKNOWN, subitem) for subitem in what)
+        return what_type
+    shape_type = type(shape)
+    if shape_type is dict:
+        if what_type is not dict:
+            raise HeterogenousList("List items must be of homogenous type.")
+        merged = None
+        for key, subshape in shape.items():
+            if key not in what:
+                # Keys missing from any sample are dropped, so that every
+                # sample has the keys the shape asks for
+                if merged is None:
+                    merged = dict(shape)
+                del merged[key]
+                continue
+            merged_subshape = _merge_shape(subshape, what[key])
+            if merged_subshape is not subshape:
+                if merged is None:
+                    merged = dict(shape)
+                merged[key] = merged_subshape
+        return shape if merged is None else merged
+    if shape_type is list:
+        if what_type is not list:
+            raise HeterogenousList("List items must be of homogenous type.")
+        item = shape[0]
+        for subitem in what:
+            item = _merge_shape(item, subitem)
+        return shape if item is shape[0] else [item]
+    if shape_type is tuple:
+        if what_type is not tuple or len(what) != len(shape):
+            raise HeterogenousList("List items must be of homogenous type.")
+        items = tuple(map(_merge_shape, shape, what))
+        for item, subshape in zip(items, shape):
+            if item is not subshape:
+                return items
+        return shape
+    if what_type is not shape:
+        raise HeterogenousList("List items must be of homogenous type.")
+    return shape
+
+
+def _finish_shape(shape: Any) -> Any:
+    shape_type = type(shape)
+    if shape_type is dict:
+        return {key: _finish_shape(subshape) for key, subshape in shape.items()}
+    if shape_type is list:
+        if shape[0] is _UNKNOWN:
+            raise AmbiguousShape(
+                "Shape of item with list of zero elements "
+                "cannot be determined")
+        return [_finish_shape(shape[0])]
+    if shape_type is tuple:
+        return tuple(map(_finish_shape, shape))
+    return shape
+
+
+class ShapeBuilder(object):
+    """Infer the shape of a stream of samples, one sample at a time.
+
+    Each sample is merged into the shape seen so far and then dropped, so
+    memory follows the size of the shape, not of the samples. Unlike
+    make_shape, every item of every list is looked at, and a dict key
+    that some sample lacks is left out of the shape, so that every sample
+    matches the result. Samples, or list items, of different types raise
+    HeterogenousList.
+    """
+
+    def __init__(self) -> None:
+        self.current: Any = _UNKNOWN
+        self.samples = 0
+        # Samples since the shape last changed
+        self.unchanged = 0
+
+    def add(self, what: Any) -> bool:
+        """Merge `what` into the shape. Returns whether the shape changed."""
+        merged = _merge_shape(self.current, what)
+        self.samples += 1
+        if merged is self.current:
+            self.unchanged += 1
+            return False
+        self.current = merged
+        self.unchanged = 0
+        return True
+
+    def shape(self) -> Any:
+        """Return the shape of the samples added so far. Raises
+        AmbiguousShape if there were none, or if a list was empty in every
+        sample."""
+        if self.current is _UNKNOWN:
+            raise AmbiguousShape("Shape of zero samples cannot be determined")
+        return _finish_shape(self.current)
+
+
+def infer_shape(samples: Iterable[Any], stable_after: int | None = None, max_samples: int | None = None) -> Any:
+    """Infer the shape that every one of `samples` matches.
+
+    `samples` is consumed lazily, so it can be a generator over a file far
+    larger than memory, such as iter_ndjson(open(filename)). With
+    `stable_after`, reading stops once that many samples in a row have not
+    changed the shape; with `max_samples`, after that many samples.
+
+    Returns the shape of one sample. [infer_shape(samples)] is the shape
+    of a list of them.
+    """
+    builder = ShapeBuilder()
+    for what in samples:
+        builder.add(what)
+        if stable_after is not None and builder.unchanged >= stable_after:
+            break
+        if max_samples is not None and builder.samples >= max_samples:
+            break
+    return builder.shape()
+
+
+def iter_ndjson(lines: Iterable[str | bytes]) -> Iterator[Any]:
+    """Decode newline-delimited JSON one line at a time, skipping blank
+    lines."""
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
 def _would_retain_shape_exc(shape: Any, data: Any, segs: list[str], leaf: Any) -> None:
+    if type(shape) is CompiledShape:
+        shape = shape.shape
+
     # If no more segments, we should validate leaf against shape
     if not segs:
         _is_shaped_exc(leaf, shape)
@@ -189,7 +588,7 @@ def _would_retain_shape_exc(shape: Any, data: Any, segs: list[str], leaf: Any) -
             raise KeyMismatch(f"Segment '{seg}' not found in shape and no fallback available.")
 
         # Navigate data as a dict
-        if isinstance(data, dict):
+        if isinstance(data, Mapping):
             subdata = data.get(seg, '')
         else:
             # The shape expects a dict-like structure, but data is not a dict
@@ -209,13 +608,13 @@ def _would_retain_shape_exc(shape: Any, data: Any, segs: list[str], leaf: Any) -
         except ValueError:
             raise ShapeMismatch(f"Segment '{seg}' is not a valid list index.")
 
-        if isinstance(data, list):
+        if _is_sequence(data):
             if len(data) > index:
                 subdata = data[index]
             else:
                 raise ShapeMismatch(f"List index out of range: {index} ({data})")
         else:
-            raise ShapeMismatch(f"Subdata is not a list: {data}")
+            raise ShapeMismatch(f"Subdata is not a sequence: {data}")
 
         _would_retain_shape_exc(subshape, subdata, segs[1:], leaf)
 
@@ -226,13 +625,15 @@ def _would_retain_shape_exc(shape: Any, data: Any, segs: list[str], leaf: Any) -
         except ValueError:
             raise ShapeMismatch(f"Segment '{seg}' is not a valid tuple index.")
 
-        if isinstance(data, tuple):
+        if _is_sequence(data):
+            if len(data) != len(shape):
+                raise SizeMismatch(f"Expected {len(shape)} items, got {len(data)} ({data})")
             if len(data) > index and index >= 0:
                 subdata = data[index]
             else:
                 raise SizeMismatch(f"Tuple index out of range: {index} ({data})")
         else:
-            raise ShapeMismatch(f"Data is not a tuple: {data}")
+            raise ShapeMismatch(f"Data is not a sequence: {data}")
 
         # The shape should have a corresponding subtype
         subshape = shape[index]
@@ -244,6 +645,41 @@ def _would_retain_shape_exc(shape: Any, data: Any, segs: list[str], leaf: Any) -
         raise ShapeMismatch(f"Extra segments {segs} not supported by shape {shape}")  # TODO
 
 
+def _retain_shape_failure(shape: Any, data: Any, segs: list[str], leaf: Any) -> int:
+    """Return where putting `leaf` at `segs` in `data` stops matching
+    `shape`: the index of the segment that cannot be followed, len(segs) if
+    it is the leaf that does not match, or -1 if the shape is retained.
+    Nothing is raised and no message is built."""
+    for depth, segment in enumerate(segs):
+        if type(shape) is CompiledShape:
+            shape = shape.shape
+        stepped = _step(shape, data, segment)
+        if stepped is None:
+            return depth
+        key, data = stepped
+        shape = shape[key]
+    if shape in SCALAR_TYPES:
+        retained = type(leaf) is shape
+    else:
+        retained = _compile(shape)(leaf)
+    return -1 if retained else len(segs)
+
+
+def retain_shape_error(shape: Any, data: Any, segs: list[str], leaf: Any) -> Exception | None:
+    """Return the exception describing why putting `leaf` at `segs` in `data`
+    would not retain `shape`, or None if it would.
+
+    This is the diagnostic path of would_retain_shape. The messages name
+    the data involved, so building them costs time in the size of that
+    data; would_retain_shape only builds one when `debug` is True.
+    """
+    try:
+        _would_retain_shape_exc(shape, data, segs, leaf)
+    except Exception as error:
+        return error
+    return None
+
+
 def would_retain_shape(shape: Any, data: Any, segs: list[str], leaf: Any, debug: bool = False) -> bool:
     """
     Check if inserting `leaf` at the path described by `segs` in `data` would still
@@ -252,22 +688,24 @@ def would_retain_shape(shape: Any, data: Any, segs: list[str], leaf: Any, debug:
     This function navigates `data` following the path segments in `segs`. If `shape`
     is a dict, `str` keys in `shape` act as a wildcard fallback if the exact segment
     key is not found. If any mismatch occurs, it returns False. If `debug` is True,
-    it prints a traceback before returning.
+    it prints the traceback of the error retain_shape_error returns before returning.
 
     Args:
         shape: The shape definition to validate against.
         data: The data structure to inspect.
         segs (list[str]): The path segments to navigate into `data`.
         leaf: The value to hypothetically insert at the end of that path.
-        debug (bool): If True, prints a traceback on exception.
+        debug (bool): If True, prints a traceback on a mismatch.
 
     Returns:
         bool: True if substituting `leaf` would preserve `shape`, False otherwise.
     """
-    try:
-        _would_retain_shape_exc(shape, data, segs, leaf)
-    except Exception:
-        if debug:
-            traceback.print_exc()  # pragma: no cover
-        return False
-    return True
+    if type(shape) is CompiledShape:
+        retained = shape.would_retain(data, segs, leaf)
+    else:
+        retained = _retain_shape_failure(shape, data, segs, leaf) < 0
+    if not retained and debug:
+        error = retain_shape_error(shape, data, segs, leaf)
+        assert error is not None
+        traceback.print_exception(error)
+    return retained
@@ -1,4 +1,4 @@
-from typing import Any, Callable
+from typing import Any, Callable, Iterable, Iterator
 
 CONTAINER_TYPES: list[type]
 SCALAR_TYPES: list[type]
@@ -11,10 +11,37 @@ class PredicateMismatch(ShapeMismatch): ...
 
 def is_shaped(thing: Any, shape: Any) -> bool: ...
 
+class CompiledShape:
+    shape: Any
+    validate: Callable[[Any], bool]
+    validate_item: Callable[[Any], bool] | None
+    children: dict[Any, CompiledShape]
+    def __init__(self, shape: Any) -> None: ...
+    def __call__(self, thing: Any) -> bool: ...
+    def first_mismatch(self, thing: Any) -> int | None: ...
+    def child(self, key: Any) -> CompiledShape: ...
+    def step(self, data: Any, segment: Any) -> tuple[CompiledShape, Any] | None: ...
+    def would_retain(self, data: Any, segs: list[str], leaf: Any) -> bool: ...
+    def check(self, thing: Any) -> None: ...
+
+def compile_shape(shape: Any) -> CompiledShape: ...
+
 class MalformedShape(Exception): ...
 class AmbiguousShape(MalformedShape): ...
 class HeterogenousList(MalformedShape): ...
 
 def make_shape(what: Any) -> dict[str, Any] | list[Any] | tuple[Any, ...] | type | Callable[[Any], None]: ...
 def anything(item: Any) -> None: ...
+
+class ShapeBuilder:
+    current: Any
+    samples: int
+    unchanged: int
+    def __init__(self) -> None: ...
+    def add(self, what: Any) -> bool: ...
+    def shape(self) -> Any: ...
+
+def infer_shape(samples: Iterable[Any], stable_after: int | None = None, max_samples: int | None = None) -> Any: ...
+def iter_ndjson(lines: Iterable[str | bytes]) -> Iterator[Any]: ...
+def retain_shape_error(shape: Any, data: Any, segs: list[str], leaf: Any) -> Exception | None: ...
 def would_retain_shape(shape: Any, data: Any, segs: list[str], leaf: Any, debug: bool = False) -> bool: ...
@@ -1,13 +1,22 @@
 
 
 import coverage  # pragma: no cover
+import contextlib  # pragma: no cover
+import functools  # pragma: no cover
+import io  # pragma: no cover
+import itertools  # pragma: no cover
+import json  # pragma: no cover
 import unittest  # pragma: no cover
+from types import MappingProxyType  # pragma: no cover
 
 cov = coverage.Coverage(branch=True)  # pragma: no cover
 cov.start()  # pragma: no cover
 
 from mumulib.shaped import is_shaped, make_shape, would_retain_shape  # pragma: no cover
 from mumulib.shaped import anything, HeterogenousList, AmbiguousShape  # pragma: no cover
+from mumulib.shaped import compile_shape, KeyMismatch, MalformedShape  # pragma: no cover
+from mumulib.shaped import infer_shape, iter_ndjson, ShapeBuilder  # pragma: no cover
+from mumulib.shaped import retain_shape_error, ShapeMismatch, SizeMismatch, TypeMismatch  # pragma: no cover
 
 
 class TestShapedScalars(unittest.TestCase):
@@ -460,6 +469,267 @@ class TestWouldRetainShape(unittest.TestCase):
             "Custom class bad shape match should fail")
 
 
+class TestCompileShape(unittest.TestCase):
+    SHAPES = [
+        int, float, str, bool, "str", [int], (int, str), {"a": int, "b": str},
+        [{"a": int, "b": [str]}], {"a": (int, [float]), "b": {"c": bool}}]
+    THINGS = [
+        1, 1.5, "a", True, None, [], [1, 2], [1, "a"], (1, "a"), (1,), {"a": 1}, {"a": 1, "b": "x"},
+        {"a": (1, [1.0]), "b": {"c": True}}, {"a": (1, [1]), "b": {"c": True}},
+        [{"a": 1, "b": ["x"]}], [{"a": 1, "b": [1]}], [{"b": []}]]
+
+    def test_agrees_with_is_shaped(self):
+        for shape in self.SHAPES:
+            compiled = compile_shape(shape)
+            for thing in self.THINGS:
+                try:
+                    expected = is_shaped(thing, shape)
+                except TypeError:
+                    # Things that are not containers, where the shape wants one
+                    expected = False
+                self.assertEqual(compiled(thing), expected, (shape, thing))
+                self.assertEqual(is_shaped(thing, compiled), expected, (shape, thing))
+
+    def test_check(self):
+        compiled = compile_shape({"a": int, "b": (int, str), "c": [float]})
+        compiled.check({"a": 1, "b": (1, "x"), "c": [1.0]})
+        with self.assertRaisesRegex(KeyMismatch, "key 'a'"):
+            compiled.check({})
+        with self.assertRaises(SizeMismatch):
+            compiled.check({"a": 1, "b": (1,), "c": []})
+        with self.assertRaisesRegex(TypeMismatch, "wrong type for shape <class 'float'>: 1"):
+            compiled.check({"a": 1, "b": (1, "x"), "c": [1.0, 1]})
+        with self.assertRaisesRegex(TypeMismatch, "wrong type for shape"):
+            compiled.check(42)
+        with self.assertRaises(ShapeMismatch):
+            compile_shape("str").check("str")
+
+    def test_nested_compiled(self):
+        point = compile_shape({"x": float, "y": float})
+        self.assertIs(compile_shape(point), point)
+        shape = compile_shape({"points": [point]})
+        self.assertTrue(shape({"points": [{"x": 1.0, "y": 2.0}]}))
+        self.assertFalse(shape({"points": [{"x": 1.0}]}))
+        self.assertTrue(is_shaped({"points": [{"x": 1.0, "y": 2.0}]}, {"points": [point]}))
+        with self.assertRaisesRegex(KeyMismatch, "key 'y'"):
+            shape.check({"points": [{"x": 1.0}]})
+
+    def test_many_records(self):
+        shape = [{"x": float, "y": float, "name": str, "tags": [str]}]
+        data = [{"x": 1.0, "y": 2.0, "name": "n", "tags": ["a", "b"]} for _ in range(1000)]
+        compiled = compile_shape(shape)
+        self.assertTrue(compiled(data))
+        self.assertTrue(is_shaped(data, shape))
+        for bad in (data[:-1] + [{"x": 1.0}], [data[0], {"x": 1.0, "y": 2.0, "name": "n", "tags": [1]}] + data):
+            self.assertFalse(compiled(bad))
+            self.assertFalse(is_shaped(bad, shape))
+
+
+class TestCompileRecords(unittest.TestCase):
+    SHAPE = [{"x": float, "y": float, "tags": [str]}]
+
+    def record(self, x=1.0, y=2.0, tags=("a",)):
+        return {"x": x, "y": y, "tags": list(tags)}
+
+    def test_agrees_with_is_shaped(self):
+        class Record(dict):
+            pass
+
+        compiled = compile_shape(self.SHAPE)
+        things = [
+            [], [self.record()], [self.record(), self.record(x=1)], [self.record(), {"x": 1.0, "y": 2.0}],
+            [self.record(y=True)], [self.record(tags=[1])], [self.record(), "xyz"], [self.record(), Record(x=1.0)],
+            [Record(self.record())], (self.record(),), [{"x": 1.0, "y": 2.0, "tags": [], "extra": None}]]
+        for thing in things:
+            try:
+                expected = is_shaped(thing, self.SHAPE)
+            except TypeError:
+                expected = False
+            self.assertEqual(compiled(thing), expected, thing)
+        self.assertFalse(compiled(None))
+        self.assertFalse(compiled(0))
+
+    def test_first_mismatch(self):
+        compiled = compile_shape(self.SHAPE)
+        records = [self.record() for _ in range(10)]
+        self.assertIsNone(compiled.first_mismatch(records))
+        records[7]["tags"].append(7)
+        records[3]["x"] = 3
+        self.assertEqual(compiled.first_mismatch(records), 3)
+        del records[3]
+        self.assertEqual(compiled.first_mismatch(records), 6)
+        self.assertEqual(compile_shape([int]).first_mismatch([1, 2, "3"]), 2)
+        with self.assertRaises(MalformedShape):
+            compile_shape({"a": int}).first_mismatch({"a": 1})
+
+    def test_many_records(self):
+        shape = [{"x": float, "y": float}]
+        data = [{"x": float(i), "y": float(i)} for i in range(1000)]
+        compiled = compile_shape(shape)
+        per_record = compile_shape(shape[0])
+        self.assertTrue(is_shaped(data, shape))
+        self.assertTrue(all(map(per_record, data)))
+        self.assertTrue(compiled(data))
+        data[999] = {"x": 1.0, "y": 1}
+        self.assertFalse(is_shaped(data, shape))
+        self.assertFalse(compiled(data))
+        self.assertEqual(compiled.first_mismatch(data), 999)
+
+
+class TestCompiledWouldRetain(unittest.TestCase):
+    SHAPES = [
+        {"a": int}, {"config": {"foo": int, str: str}}, [int], (int, str), [int, str], {"a": {"b": int}},
+        {"config": {"servers": [{"host": str, "port": int}]}}, {"a": [(int, str)]}]
+    DATA = [
+        {"a": 42}, {"config": {"foo": 42, "bar": "hello"}}, [1, 2, 3], (42, "hello"), {"a": "hello"},
+        {"config": {"servers": [{"host": "x", "port": 1}]}}, {"a": [(1, "x")]}, None, (1,),
+        MappingProxyType({"a": 42}), MappingProxyType({"config": MappingProxyType({"foo": 42, "bar": "hello"})}),
+        (1, 2, 3), [42, "hello"], "hello", {"a": [[1, "x"]]}]
+    SEGS = [
+        [], ["a"], ["a", "b"], ["config", "bar"], ["config", "foo"], ["0"], ["1"], ["-1"], ["-4"], ["5"],
+        ["hello"], [0], [None], ["config", "servers", "0", "port"], ["a", "0", "1"]]
+    LEAVES = [1, "x", None, {"b": 1}, {"port": 1, "host": "h"}, (1, "x")]
+
+    def test_agrees_with_would_retain_shape(self):
+        for shape in self.SHAPES:
+            compiled = compile_shape(shape)
+            for data, segs, leaf in itertools.product(self.DATA, self.SEGS, self.LEAVES):
+                expected = would_retain_shape(shape, data, segs, leaf)
+                self.assertEqual(compiled.would_retain(data, segs, leaf), expected, (shape, data, segs, leaf))
+                self.assertEqual(would_retain_shape(compiled, data, segs, leaf), expected)
+                self.assertEqual(retain_shape_error(shape, data, segs, leaf) is None, expected)
+
+    def test_step(self):
+        compiled = compile_shape({"config": {"servers": [{"host": str, "port": int}]}})
+        data = {"config": {"servers": [{"host": "x", "port": 1}]}}
+        shape, child = compiled.step(data, "config")
+        self.assertIs(child, data["config"])
+        self.assertIs(compiled.step(data, "config")[0], shape)
+        self.assertEqual(shape.shape, {"servers": [{"host": str, "port": int}]})
+        self.assertIsNone(compiled.step(data, "other"))
+        self.assertIsNone(compile_shape(int).step(1, "0"))
+
+    def test_immutable_containers(self):
+        shape = {"items": {str: {"x": int}}, "pairs": [(str, int)]}
+        data = MappingProxyType({"items": MappingProxyType({"a": {"x": 1}}), "pairs": (["p", 1],)})
+        for retain in (compile_shape(shape).would_retain, functools.partial(would_retain_shape, shape)):
+            self.assertTrue(retain(data, ["items", "c"], {"x": 2}))
+            self.assertFalse(retain(data, ["items", "c"], {"x": "2"}))
+            self.assertTrue(retain(data, ["pairs", "0", "1"], 2))
+            self.assertFalse(retain(data, ["pairs", "0", "1"], "2"))
+            self.assertFalse(retain({"items": "abc", "pairs": "abc"}, ["pairs", "0"], ("a", 1)))
+
+
+class TestRetainShapeError(unittest.TestCase):
+    def test_error(self):
+        shape = {"config": {"servers": [{"host": str, "port": int}]}}
+        data = {"config": {"servers": [{"host": "localhost", "port": 8080}]}}
+        self.assertIsNone(retain_shape_error(shape, data, ["config", "servers", "0", "port"], 1))
+        error = retain_shape_error(shape, data, ["config", "servers", "0", "port"], "x")
+        self.assertIsInstance(error, TypeMismatch)
+        error = retain_shape_error(shape, data, ["config", "servers", "5"], {})
+        self.assertEqual(str(error), f"List index out of range: 5 ({data['config']['servers']})")
+        self.assertIsInstance(retain_shape_error(shape, data, ["other"], 1), KeyMismatch)
+
+        server = compile_shape({"host": str, "port": int})
+        shape = {"servers": [server]}
+        data = {"servers": [{"host": "localhost", "port": 8080}]}
+        self.assertTrue(would_retain_shape(shape, data, ["servers", "0", "port"], 1))
+        self.assertFalse(would_retain_shape(shape, data, ["servers", "0", "port"], "1"))
+        self.assertIsInstance(retain_shape_error(shape, data, ["servers", "0", "port"], "1"), TypeMismatch)
+
+    def test_debug(self):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            self.assertFalse(would_retain_shape({"a": int}, {"a": 1}, ["b"], 1, debug=True))
+            self.assertFalse(would_retain_shape(compile_shape({"a": int}), {"a": 1}, ["a"], "x", debug=True))
+            self.assertTrue(would_retain_shape({"a": int}, {"a": 1}, ["a"], 2, debug=True))
+        self.assertIn("KeyMismatch: Segment 'b' not found", stderr.getvalue())
+        self.assertIn("TypeMismatch: wrong type for shape <class 'int'>: x", stderr.getvalue())
+
+    def test_long_list(self):
+        shape = {"points": [{"x": float, "y": float}]}
+        data = {"points": [{"x": float(i), "y": 2.0} for i in range(1000)]}
+        cases = [
+            (["points", "999", "x"], 1.0, None),
+            (["points", "999", "x"], "1.0", TypeMismatch),
+            (["points", "1000"], {"x": 1.0, "y": 1.0}, ShapeMismatch),
+        ]
+        for segs, leaf, error_type in cases:
+            error = retain_shape_error(shape, data, segs, leaf)
+            self.assertEqual(would_retain_shape(shape, data, segs, leaf), error is None)
+            if error_type is not None:
+                self.assertIsInstance(error, error_type)
+
+
+class TestInferShape(unittest.TestCase):
+    def test_merge(self):
+        samples = [
+            {"a": 1, "b": [], "c": ([], 1), "e": {"f": 1, "g": "x", "h": "y"}},
+            {"a": 2, "b": [1.0], "c": (["x"], 2), "d": 1, "e": {"f": 2}},
+            {"a": 3, "b": [2.0, 3.0], "c": ([], 3), "e": {"f": 3, "i": 1}},
+        ]
+        builder = ShapeBuilder()
+        self.assertEqual([builder.add(sample) for sample in samples], [True, True, False])
+        shape = builder.shape()
+        self.assertEqual(shape, {"a": int, "b": [float], "c": ([str], int), "e": {"f": int}})
+        self.assertEqual(builder.samples, 3)
+        self.assertEqual(builder.unchanged, 1)
+        for sample in samples:
+            self.assertTrue(is_shaped(sample, shape))
+
+    def test_agrees_with_make_shape(self):
+        data = {
+            "config": {
+                "servers": [{"host": "localhost", "port": 8080}, {"host": "example.com", "port": 80}],
+                "features": ("enable_logging", True, 3.14),
+            },
+            "metadata": {"count": 2, "desc": "two servers"},
+        }
+        self.assertEqual(infer_shape([data, data]), make_shape(data))
+        self.assertEqual(infer_shape([[[1, 2], [3, 4]]]), make_shape([[1, 2], [3, 4]]))
+
+    def test_errors(self):
+        for samples in ([1, "a"], [{"a": 1}, [1]], [[1], [1, "a"]], [(1,), (1, 2)], [(1,), [1]], [[1], (1,)]):
+            with self.assertRaises(HeterogenousList, msg=samples):
+                infer_shape(samples)
+        with self.assertRaises(AmbiguousShape):
+            infer_shape([])
+        with self.assertRaises(AmbiguousShape):
+            infer_shape([{"a": []}, {"a": []}])
+
+    def test_early_stop(self):
+        consumed = []
+
+        def samples():
+            for i in range(1000):
+                consumed.append(i)
+                yield {"id": i, "tags": ["a"] if i >= 5 else []}
+
+        self.assertEqual(infer_shape(samples(), stable_after=10), {"id": int, "tags": [str]})
+        self.assertEqual(len(consumed), 16)
+        consumed.clear()
+        with self.assertRaises(AmbiguousShape):
+            infer_shape(samples(), max_samples=3)
+        self.assertEqual(len(consumed), 3)
+
+    def test_ndjson(self):
+        lines = io.StringIO("".join(json.dumps({"x": float(i), "y": [i]}) + "\n\n" for i in range(10)))
+        self.assertEqual(infer_shape(iter_ndjson(lines)), {"x": float, "y": [int]})
+        lines = [b'{"a": "x"}\n', b'  \n', b'{"a": "y", "b": null}']
+        self.assertEqual(list(iter_ndjson(lines)), [{"a": "x"}, {"a": "y", "b": None}])
+
+    def test_ndjson_stable_after(self):
+        text = "".join(
+            json.dumps({"id": i, "point": {"x": float(i), "y": 1.0}, "tags": ["a", "b"]}) + "\n"
+            for i in range(1000))
+        lines = io.StringIO(text)
+        shape = infer_shape(iter_ndjson(lines), stable_after=100)
+        self.assertEqual(shape, infer_shape(iter_ndjson(io.StringIO(text))))
+        # The rest of the stream is left unread
+        self.assertEqual(len(lines.readlines()), 1000 - 101)
+
+
 if __name__ == "__main__":  # pragma: no cover
     unittest.main(exit=False)  # pragma: no cover
     cov.stop()  # pragma: no cover
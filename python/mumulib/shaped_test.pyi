@@ -1,6 +1,6 @@
 import unittest
 from _typeshed import Incomplete
-from mumulib.shaped import AmbiguousShape as AmbiguousShape, HeterogenousList as HeterogenousList, anything as anything, is_shaped as is_shaped, make_shape as make_shape, would_retain_shape as would_retain_shape
+from mumulib.shaped import AmbiguousShape as AmbiguousShape, HeterogenousList as HeterogenousList, KeyMismatch as KeyMismatch, MalformedShape as MalformedShape, retain_shape_error as retain_shape_error, ShapeMismatch as ShapeMismatch, SizeMismatch as SizeMismatch, TypeMismatch as TypeMismatch, anything as anything, compile_shape as compile_shape, infer_shape as infer_shape, iter_ndjson as iter_ndjson, ShapeBuilder as ShapeBuilder, is_shaped as is_shaped, make_shape as make_shape, would_retain_shape as would_retain_shape
 
 cov: Incomplete
 
@@ -46,3 +46,40 @@ class TestWouldRetainShape(unittest.TestCase):
     def test_bad_tuple(self) -> None: ...
     def test_extra_segments(self) -> None: ...
     def test_custom_class_bad_shape(self) -> None: ...
+
+class TestCompileShape(unittest.TestCase):
+    SHAPES: Incomplete
+    THINGS: Incomplete
+    def test_agrees_with_is_shaped(self) -> None: ...
+    def test_check(self) -> None: ...
+    def test_nested_compiled(self) -> None: ...
+    def test_many_records(self) -> None: ...
+
+class TestCompileRecords(unittest.TestCase):
+    SHAPE: Incomplete
+    def record(self, x: float = 1.0, y: float = 2.0, tags=('a',)): ...
+    def test_agrees_with_is_shaped(self) -> None: ...
+    def test_first_mismatch(self) -> None: ...
+    def test_many_records(self) -> None: ...
+
+class TestCompiledWouldRetain(unittest.TestCase):
+    SHAPES: Incomplete
+    DATA: Incomplete
+    SEGS: Incomplete
+    LEAVES: Incomplete
+    def test_agrees_with_would_retain_shape(self) -> None: ...
+    def test_step(self) -> None: ...
+    def test_immutable_containers(self) -> None: ...
+
+class TestRetainShapeError(unittest.TestCase):
+    def test_error(self) -> None: ...
+    def test_debug(self) -> None: ...
+    def test_long_list(self) -> None: ...
+
+class TestInferShape(unittest.TestCase):
+    def test_merge(self) -> None: ...
+    def test_agrees_with_make_shape(self) -> None: ...
+    def test_errors(self) -> None: ...
+    def test_early_stop(self) -> None: ...
+    def test_ndjson(self) -> None: ...
+    def test_ndjson_stable_after(self) -> None: ...
@@ -1,9 +1,15 @@
-from typing import Any, AsyncIterator, IO
+import hashlib
+import io
+import itertools
+import marshal
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, IO
 
 from mumulib import producers
 
-from lxml import etree
-
 
 # From MDN reference
 VOID_ELEMENTS: list[str] = [
@@ -217,63 +223,265 @@ ALL_ELEMENTS.extend(DEMARCATING_EDITS + TABLE_CONTENT)
 ALL_ELEMENTS.extend(FORMS + INTERACTIVE_ELEMENTS + WEB_COMPONENTS)
 
 
+# Orders writes to node indents and layouts, so a layout that is applied
+# lazily can tell which descendants were given an indent after it. Nodes
+# start at 0, older than any layout. Writes only need to be ordered against
+# layouts, so all writes between two layouts share _write_stamp.
+_stamps = itertools.count(1)
+_write_stamp = next(_stamps)
+
+
+def _new_layout_stamp() -> int:
+    global _write_stamp
+    stamp = next(_stamps)
+    _write_stamp = next(_stamps)
+    return stamp
+
+
+class _Writes(object):
+    """Counts the writes to the nodes of a tree a Template keeps a SlotIndex
+    of, made other than through its slot methods. Reading children or
+    attributes counts, since the caller may change what it gets."""
+
+    __slots__ = ('count',)
+
+    def __init__(self) -> None:
+        self.count: int = 0
+
+
+# Where a node sits in a tree: (indent, stamp, layout, layout_stamp). The
+# layout is None, or the indent reindent_tree gave the node, when the
+# indents below follow their depth from there, whatever the descendants'
+# own indents say. Later writes to an indent change only that node.
+_Place = tuple[int, int, int | None, int]
+
+
 def reindent_tree(node: 'Stan', indent: int) -> None:
-    node.indent = indent
-    for child in node.children:
-        if isinstance(child, Stan):
-            reindent_tree(child, indent + 1)
+    """Give node `indent` and each descendant one more than its parent.
+
+    The descendants are reindented lazily, when they are next rendered or
+    read through `children`, so this does not walk the tree.
+    """
+    stamp = _new_layout_stamp()
+    node._indent = indent
+    node._stamp = stamp
+    node._layout = indent
+    node._layout_stamp = stamp
+
+
+def _place(node: 'Stan') -> _Place:
+    return node._indent, node._stamp, node._layout, node._layout_stamp
+
+
+def _child_place(child: 'Stan', parent: _Place) -> _Place:
+    """Return the place of child below a parent at `parent`. The newest of
+    the child's own indent and layout and the parent's layout wins."""
+    _, _, layout, layout_stamp = parent
+    if layout is None:
+        return child._indent, child._stamp, child._layout, child._layout_stamp
+    if child._stamp > layout_stamp:
+        child_indent, child_stamp = child._indent, child._stamp
+    else:
+        child_indent, child_stamp = layout + 1, layout_stamp
+    if child._layout is not None and child._layout_stamp > layout_stamp:
+        return child_indent, child_stamp, child._layout, child._layout_stamp
+    return child_indent, child_stamp, layout + 1, layout_stamp
+
+
+# Shared by every node without attributes or children until it gets some.
+# Never written to.
+_NO_ATTRIBUTES: dict[str, Any] = {}
+_NO_CHILDREN: list[Any] = []
 
 
 class Stan(object):
+    """An HTML element.
+
+    `copy` is deep, but Template roots and PatternFactory clones share the
+    nodes they leave unchanged, and their slot methods copy only the nodes
+    on the path to a change. Indents set by `reindent_tree` are
+    recorded as a layout and applied to the descendants as they are
+    rendered or read through `children`, which gives the reader nodes of
+    its own.
+
+    Nodes use slots, and tag names are interned, to keep large trees small.
+    """
+
+    __slots__ = (
+        'clone', 'tagname', '_indent', '_stamp', '_layout', '_layout_stamp',
+        '_attributes', '_children', '_shared', '_shared_children', '_writes')
+
     def __init__(self, tagname: str, indent: int, *args: Any, **kwargs: Any) -> None:
         self.clone: bool = False
-        self.tagname: str = tagname
-        self.indent: int = indent
-        self.attributes: dict[str, Any] = dict(kwargs)
-        self.children: list[Any] = list(args)
+        self.tagname: str = sys.intern(tagname)
+        self._indent: int = indent
+        self._stamp: int = 0
+        self._layout: int | None = None
+        self._layout_stamp: int = 0
+        self._attributes: dict[str, Any] = dict(kwargs) if kwargs else _NO_ATTRIBUTES
+        self._children: list[Any] = list(args) if args else _NO_CHILDREN
+        # Whether _attributes and _children may belong to another node too
+        self._shared: bool = False
+        # Whether the child nodes may belong to another tree too
+        self._shared_children: bool = False
+        # Where writes to this node are counted, if anywhere
+        self._writes: _Writes | None = None
+
+    @property
+    def indent(self) -> int:
+        return self._indent
+
+    @indent.setter
+    def indent(self, value: int) -> None:
+        self._indent = value
+        self._stamp = _write_stamp
+
+    @property
+    def attributes(self) -> dict[str, Any]:
+        self._write()
+        self._own()
+        if self._attributes is _NO_ATTRIBUTES:
+            self._attributes = {}
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, value: dict[str, Any]) -> None:
+        self._write()
+        self._own()
+        self._attributes = value
+
+    @property
+    def children(self) -> list[Any]:
+        self._write()
+        self._own()
+        if self._shared_children or self._layout is not None:
+            place = _place(self)
+            self._children = [
+                child._share(_child_place(child, place), self._writes) if isinstance(child, Stan) else child
+                for child in self._children]
+            self._shared_children = False
+            self._layout = None
+            self._layout_stamp = 0
+        elif self._children is _NO_CHILDREN:
+            self._children = []
+        return self._children
+
+    @children.setter
+    def children(self, value: list[Any]) -> None:
+        self._write()
+        self._own()
+        self._children = value
+        self._shared_children = False
+        self._layout = None
+        self._layout_stamp = 0
+
+    def _write(self) -> None:
+        if self._writes is not None:
+            self._writes.count += 1
+
+    def _share(self, place: _Place, writes: _Writes | None = None) -> 'Stan':
+        """Return a copy at `place` that shares this node's attributes and
+        children, and counts its writes in `writes`."""
+        node = Stan.__new__(Stan)
+        node.clone = False
+        node.tagname = self.tagname
+        node._indent, node._stamp, node._layout, node._layout_stamp = place
+        node._attributes = self._attributes
+        node._children = self._children
+        node._shared = True
+        node._shared_children = True
+        node._writes = writes
+        self._shared = True
+        self._shared_children = True
+        return node
+
+    def _own(self) -> None:
+        """Copy the attributes and children lists if they are shared."""
+        if self._shared:
+            if self._attributes is not _NO_ATTRIBUTES:
+                self._attributes = dict(self._attributes)
+            if self._children is not _NO_CHILDREN:
+                self._children = list(self._children)
+            self._shared = False
+
+    def _owned_copy(self, place: _Place) -> 'Stan':
+        node = self._share(place)
+        node._own()
+        return node
+
+    def _adopt(self, node: 'Stan') -> None:
+        """Take over the attributes and children of an owned copy."""
+        self._write()
+        self._attributes = node._attributes
+        self._children = node._children
+        self._shared = False
+        self._shared_children = True
 
     def __call__(self, **kwargs: Any) -> 'Stan':
         if self.clone:
             self = self.copy()
         if 'indent' in kwargs:
             self.indent = kwargs.pop('indent')
-        self.attributes = self.attributes | kwargs
+        if kwargs:
+            self.attributes = self._attributes | kwargs
         return self
 
     def __getitem__(self, item: Any) -> 'Stan':
         if self.clone:
             self = self.copy()
-        if isinstance(item, list):
-            for child in item:
-                if isinstance(child, Stan):
-                    child.indent = self.indent + 1
-            self.children.extend(item)
+        items = item if isinstance(item, list) else [item]
+        for child in items:
+            if isinstance(child, Stan):
+                child.indent = self._indent + 1
+        if self._children is _NO_CHILDREN:
+            self._write()
+            self._children = list(items)
+            self._layout = None
+            self._layout_stamp = 0
         else:
-            if isinstance(item, Stan):
-                item.indent = self.indent + 1
-            self.children.append(item)
+            # Apply any pending layout first, so it does not reach the new
+            # children
+            self.children.extend(items)
         return self
 
     def copy(self) -> 'Stan':
-        children = [
-            getattr(child, 'copy', lambda: child)()
-            for child in self.children]
-        attributes = {
-            k: getattr(v, 'copy', lambda: v)()
-            for k, v in self.attributes.items()}
-        result = Stan(
-            self.tagname, 0, *children, **attributes)
-        return result
+        """Return a deep copy. Nothing is shared with the original, whose
+        nodes and attribute dicts the caller may hold and change; the
+        copies that share unchanged nodes are the roots of Template and
+        the clones of PatternFactory, which never hand out what they
+        share."""
+        node = Stan.__new__(Stan)
+        node.clone = False
+        node.tagname = self.tagname
+        node._indent = 0
+        # Newer than any layout already waiting above where it is put
+        node._stamp = _write_stamp
+        node._layout = None
+        node._layout_stamp = 0
+        node._shared = False
+        node._shared_children = False
+        node._writes = None
+        attributes = self._attributes
+        if attributes is not _NO_ATTRIBUTES:
+            attributes = {k: getattr(v, 'copy', lambda: v)() for k, v in attributes.items()}
+        node._attributes = attributes
+        if self._children is _NO_CHILDREN:
+            node._children = _NO_CHILDREN
+        else:
+            node._children = [
+                getattr(child, 'copy', lambda: child)()
+                for child in self._children]
+        return node
 
     def clone_pat(self, patname: str, **slots: Any) -> 'Stan | None':
-        if self.attributes.get("data-pat") == patname:
+        if self._attributes.get("data-pat") == patname:
             copy = self.copy()
             reindent_tree(copy, 0)
 
             for k, v in slots.items():
                 copy.fill_slots(k, v)
             return copy
-        for child in self.children:
+        for child in self._children:
             if isinstance(child, Stan):
                 result = child.clone_pat(patname, **slots)
                 if result:
@@ -281,73 +489,16 @@ class Stan(object):
         return None
 
     def clear_slots(self, slotname: str) -> None:
-        for child in self.children:
-            if not isinstance(child, Stan):
-                continue
-            if child.attributes.get("data-slot") != slotname:
-                child.clear_slots(slotname)
-                continue
-            child.children = []
+        _clear_slots(self, SlotIndex(self, slotname), slotname)
 
     def fill_slots(self, slotname: str, value: Any) -> None:
-        for i, child in enumerate(self.children):
-            if not isinstance(child, Stan):
-                continue
-            attrslots = child.attributes.get("data-attr")
-            if attrslots:
-                attrslots = attrslots.split(",")
-                attrslots = [
-                    (k, v) for k, v in (x.split("=") for x in attrslots)]
-                for attrname, attrslotname in attrslots:
-                    if attrslotname == slotname:
-                        child.attributes[attrname] = value
-            if child.attributes.get("data-slot") != slotname:
-                if isinstance(value, Stan):
-                    reindent_tree(value, self.indent + 1)
-                child.fill_slots(slotname, value)
-                continue
-            if isinstance(value, Stan):
-                node = value.copy()
-                reindent_tree(node, self.indent + 1)
-                self.children[i] = node
-            elif isinstance(value, list):
-                child.children = []
-                for node in value:
-                    if isinstance(node, Stan):
-                        newnode = node.copy()
-                        reindent_tree(newnode, self.indent + 1)
-                        child.children.append(newnode)
-                    else:
-                        child.children.append(node)
-            else:
-                child.children = [value]
+        _fill_slots(self, SlotIndex(self, slotname), slotname, value)
 
     def append_slots(self, slotname: str, value: Any) -> None:
-        for child in self.children:
-            if not isinstance(child, Stan):
-                continue
-            attrslots = child.attributes.get("data-attr")
-            if attrslots:
-                attrslots = attrslots.split(",")
-                attrslots = [
-                    (k, v) for k, v in (x.split("=") for x in attrslots)]
-                for attrname, attrslotname in attrslots:
-                    if attrslotname == slotname:
-                        child.attributes[attrname] = value
-            if child.attributes.get("data-slot") != slotname:
-                child.append_slots(slotname, value)
-                continue
-            if isinstance(value, Stan):
-                node = value.copy()
-                child.children.append(node)
-            elif isinstance(value, list):
-                for node in value:
-                    if isinstance(node, Stan):
-                        child.children.append(node.copy())
-                    else:
-                        child.children.append(node)
-            else:
-                child.children.append(value)
+        _append_slots(self, SlotIndex(self, slotname), slotname, value)
+
+    def compile(self) -> 'RenderPlan':
+        return RenderPlan(_compile_node(self), compact_parts=_compile_node(self, compact=True))
 
     def __repr__(self) -> str:
         result = f"all.{self.tagname}"
@@ -368,6 +519,324 @@ class Stan(object):
         return result
 
 
+def _reindented(node: Stan, indent: int) -> Stan:
+    """Copy node and reindent_tree the copy."""
+    copy = node.copy()
+    reindent_tree(copy, indent)
+    return copy
+
+
+def _shared_reindented(node: Stan, indent: int) -> Stan:
+    """Like _reindented, but sharing the nodes below node, for trees the
+    caller holds no nodes of."""
+    stamp = _new_layout_stamp()
+    return node._share((indent, stamp, indent, stamp))
+
+
+class _StaleIndex(Exception):
+    """A SlotIndex no longer matches its tree."""
+
+
+# A node that references a slot: (path, is_slot, attrnames). path holds the
+# indices into _children from the root down to the node, is_slot whether its
+# data-slot names the slot, and attrnames the attributes its data-attr binds
+# to the slot.
+_SlotRef = tuple[tuple[int, ...], bool, tuple[str, ...]]
+
+# The refs a slot method changes, as a trie: child index -> [ref at that
+# child or None, the same for its children]
+_Targets = dict[int, list[Any]]
+
+
+class SlotIndex(object):
+    """The nodes below a root that reference each slot, by slot name.
+
+    Template builds one when it loads, so filling a slot copies and visits
+    only the nodes on the paths to it, and data-attr is parsed once. The
+    index follows changes made through the slot methods of Template. With
+    writes, the nodes it indexes and copies count their writes there, so
+    Template can tell when its root was changed some other way and
+    reindex. The node each ref was found at is kept too, and a slot method
+    that finds another node there raises _StaleIndex rather than change it.
+    With slotname, only that slot is indexed.
+    """
+
+    def __init__(self, node: Stan | None = None, slotname: str | None = None, writes: _Writes | None = None) -> None:
+        self.slotname: str | None = slotname
+        self.writes: _Writes | None = writes
+        self.refs: dict[str, list[_SlotRef]] = {}
+        # The node at the path of each ref
+        self.nodes: dict[tuple[int, ...], Stan] = {}
+        # targets() by slot name, until the slot's refs change
+        self._targets: dict[str, _Targets] = {}
+        if node is not None:
+            self.add(node, ())
+
+    def copy(self) -> 'SlotIndex':
+        index = SlotIndex(slotname=self.slotname, writes=self.writes)
+        index.refs = {k: list(v) for k, v in self.refs.items()}
+        index.nodes = dict(self.nodes)
+        index._targets = dict(self._targets)
+        return index
+
+    def bind(self, node: Stan) -> None:
+        """Take the nodes of the refs from node, for refs indexed from
+        another copy of it, such as a cached parse."""
+        self.nodes = {}
+        for refs in self.refs.values():
+            for ref in refs:
+                child: Any = node
+                for i in ref[0]:
+                    if not isinstance(child, Stan) or i >= len(child._children):
+                        break
+                    child = child._children[i]
+                else:
+                    if isinstance(child, Stan):
+                        self.nodes[ref[0]] = child
+
+    def below(self, path: tuple[int, ...]) -> 'SlotIndex':
+        """Return the index of the node at path, without walking it."""
+        index = SlotIndex(slotname=self.slotname)
+        depth = len(path)
+        for name, refs in self.refs.items():
+            kept = [
+                (ref[0][depth:], ref[1], ref[2]) for ref in refs
+                if len(ref[0]) > depth and ref[0][:depth] == path]
+            if kept:
+                index.refs[name] = kept
+        index.nodes = {
+            p[depth:]: node for p, node in self.nodes.items()
+            if len(p) > depth and p[:depth] == path}
+        return index
+
+    def add(self, node: Stan, path: tuple[int, ...]) -> None:
+        """Index node, found at path, and its descendants. The root, at (),
+        is not a slot itself."""
+        if self.writes is not None:
+            node._writes = self.writes
+        if path and node._attributes:
+            self._add_refs(node, path)
+        for i, child in enumerate(node._children):
+            if isinstance(child, Stan):
+                self.add(child, path + (i,))
+
+    def _add_refs(self, node: Stan, path: tuple[int, ...]) -> None:
+        bound: dict[str, list[str]] = {}
+        data_attr = node._attributes.get("data-attr")
+        if data_attr:
+            for attrname, attrslotname in parse_data_attr(data_attr):
+                bound.setdefault(attrslotname, []).append(attrname)
+        slotname = node._attributes.get("data-slot")
+        if slotname is not None:
+            bound.setdefault(slotname, [])
+        for name, attrnames in bound.items():
+            if self.slotname is None or name == self.slotname:
+                self.refs.setdefault(name, []).append((path, name == slotname, tuple(attrnames)))
+                self.nodes[path] = node
+                self._targets.pop(name, None)
+
+    def remove(self, path: tuple[int, ...], inclusive: bool) -> None:
+        """Forget the nodes below path, and the node at path if inclusive."""
+        depth = len(path)
+        for name, refs in self.refs.items():
+            kept = [
+                ref for ref in refs
+                if ref[0][:depth] != path or (len(ref[0]) == depth and not inclusive)]
+            if len(kept) != len(refs):
+                self.refs[name] = kept
+                self._targets.pop(name, None)
+        for p in [
+                p for p in self.nodes
+                if p[:depth] == path and (len(p) > depth or inclusive)]:
+            del self.nodes[p]
+
+    def targets(self, slotname: str) -> _Targets:
+        """The nodes a slot method changes for slotname: all that reference
+        it, except those inside a node whose data-slot names it, which is
+        replaced."""
+        targets = self._targets.get(slotname)
+        if targets is not None:
+            return targets
+        refs = self.refs.get(slotname, [])
+        slots = {ref[0] for ref in refs if ref[1]}
+        targets = {}
+        for ref in refs:
+            path = ref[0]
+            if any(path[:i] in slots for i in range(1, len(path))):
+                continue
+            level = targets
+            for i in path[:-1]:
+                level = level.setdefault(i, [None, {}])[1]
+            level.setdefault(path[-1], [None, {}])[0] = ref
+        self._targets[slotname] = targets
+        return targets
+
+
+# update(child, copy, place, parent_indent, ref) for _rewrite, where copy
+# is child with the changes below it made, or None if there were none
+_Update = Callable[[Stan, Stan | None, _Place, int, _SlotRef], Stan | None]
+
+
+def _rewrite(node: Stan, index: SlotIndex, targets: _Targets, update: _Update) -> None:
+    """Replace the nodes at targets below node with what update returns.
+
+    Only the nodes on the paths to changes are copied, and node takes over
+    the copy of itself at the end, so the tree is left alone if update or a
+    stale path raises. The copies replace the nodes they were made from in
+    index.nodes.
+    """
+    changed = _rewrite_targets(node, (), _place(node), index, targets, update)
+    if changed is not None:
+        node._adopt(changed)
+
+
+def _rewrite_targets(
+        node: Stan, path: tuple[int, ...], place: _Place, index: SlotIndex, targets: _Targets,
+        update: _Update) -> Stan | None:
+    result = None
+    for i, (ref, below) in targets.items():
+        if i >= len(node._children) or not isinstance(node._children[i], Stan):
+            raise _StaleIndex()
+        child = node._children[i]
+        child_path = path + (i,)
+        if ref is not None and index.nodes.get(child_path) is not child:
+            raise _StaleIndex()
+        child_place = _child_place(child, place)
+        replacement = None
+        if below:
+            replacement = _rewrite_targets(child, child_path, child_place, index, below, update)
+        if ref is not None:
+            replacement = update(child, replacement, child_place, place[0], ref)
+        if replacement is not None:
+            if index.nodes.get(child_path) is child:
+                index.nodes[child_path] = replacement
+            if index.writes is not None:
+                replacement._writes = index.writes
+            if result is None:
+                result = node._owned_copy(place)
+            result._children[i] = replacement
+    return result
+
+
+def _slot_node(child: Stan, slotname: str, place: _Place) -> Stan:
+    if child._attributes.get("data-slot") != slotname:
+        raise _StaleIndex()
+    return child._owned_copy(place)
+
+
+def _clear_slots(root: Stan, index: SlotIndex, slotname: str) -> None:
+    def update(child: Stan, copy: Stan | None, place: _Place, parent_indent: int, ref: _SlotRef) -> Stan | None:
+        if not ref[1]:
+            return copy
+        node = _slot_node(child, slotname, place)
+        node._children = []
+        index.remove(ref[0], False)
+        return node
+    _rewrite(root, index, index.targets(slotname), update)
+
+
+def _fill_slots(root: Stan, index: SlotIndex, slotname: str, value: Any) -> None:
+    def update(child: Stan, copy: Stan | None, place: _Place, parent_indent: int, ref: _SlotRef) -> Stan | None:
+        path, is_slot, attrnames = ref
+        if not is_slot:
+            node = copy or child._owned_copy(place)
+        elif isinstance(value, Stan):
+            _slot_node(child, slotname, place)
+            replacement = _reindented(value, parent_indent + 1)
+            index.remove(path, True)
+            index.add(replacement, path)
+            return replacement
+        else:
+            node = _slot_node(child, slotname, place)
+            index.remove(path, False)
+            if isinstance(value, list):
+                node._children = [
+                    _reindented(item, parent_indent + 1) if isinstance(item, Stan) else item
+                    for item in value]
+                for i, item in enumerate(node._children):
+                    if isinstance(item, Stan):
+                        index.add(item, path + (i,))
+            else:
+                node._children = [value]
+        for attrname in attrnames:
+            node._attributes[attrname] = value
+        return node
+    _rewrite(root, index, index.targets(slotname), update)
+
+
+def _append_slots(root: Stan, index: SlotIndex, slotname: str, value: Any) -> None:
+    def update(child: Stan, copy: Stan | None, place: _Place, parent_indent: int, ref: _SlotRef) -> Stan | None:
+        path, is_slot, attrnames = ref
+        if not is_slot:
+            node = copy or child._owned_copy(place)
+        else:
+            node = _slot_node(child, slotname, place)
+            start = len(node._children)
+            values = value if isinstance(value, list) else [value]
+            node._children = node._children + [
+                item.copy() if isinstance(item, Stan) else item
+                for item in values]
+            for i, item in enumerate(node._children[start:], start):
+                if isinstance(item, Stan):
+                    index.add(item, path + (i,))
+        for attrname in attrnames:
+            node._attributes[attrname] = value
+        return node
+    _rewrite(root, index, index.targets(slotname), update)
+
+
+class PatternFactory(object):
+    """Makes filled copies of a data-pat node, as Template.clone_pat does.
+
+    The slots of the pattern are indexed and its own data-attr is parsed
+    once, so each call copies only what the slots change.
+    """
+
+    def __init__(self, node: Stan, slots: SlotIndex | None = None) -> None:
+        # A copy, so the calls can share its nodes
+        self.node: Stan = node.copy()
+        if slots is None:
+            slots = SlotIndex(self.node)
+        else:
+            slots.bind(self.node)
+        self.slots: SlotIndex = slots
+        self.attrslots: list[tuple[str, str]] = parse_data_attr(node._attributes.get("data-attr", ""))
+
+    def __call__(self, **slots: Any) -> Stan:
+        result = _shared_reindented(self.node, 0)
+        index = self.slots.copy()
+        for k, v in slots.items():
+            _fill_slots(result, index, k, v)
+        # Slots and data-attr bindings on the pattern node itself
+        for k, v in slots.items():
+            if result._attributes.get("data-slot") == k:
+                if isinstance(v, Stan):
+                    result = v
+                else:
+                    result.children = [v]
+            for attrname, attrslotname in self.attrslots:
+                if attrslotname == k:
+                    result.attributes[attrname] = v
+        return result
+
+
+def _find_patterns(node: Stan, path: tuple[int, ...], patterns: dict[str, tuple[int, ...]]) -> None:
+    """Add the path of each data-pat node below node, in the order
+    Stan.clone_pat searches, keeping the first of each name."""
+    for i, child in enumerate(node._children):
+        if isinstance(child, Stan):
+            patname = child._attributes.get("data-pat")
+            if patname is not None and patname not in patterns:
+                patterns[patname] = path + (i,)
+            _find_patterns(child, path + (i,), patterns)
+
+
+def _node_at(node: Stan, path: tuple[int, ...]) -> Stan:
+    for i in path:
+        node = node._children[i]
+    return node
+
+
 class TagGroup(object):
     def __init__(self, *tags: str) -> None:
         for tag in tags:
@@ -395,6 +864,9 @@ all = TagGroup(*ALL_ELEMENTS)
 
 
 def parse_template(source: IO[bytes]) -> Stan | None:
+    # lxml is only needed to parse, not to build or render Stan, or to load
+    # a template from the cache, so it is imported on first use
+    from lxml import etree
     context = etree.iterparse(
         source, events=("start", "end"), html=True, encoding="UTF-8")
 
@@ -433,65 +905,288 @@ def parse_template(source: IO[bytes]) -> Stan | None:
     return root
 
 
+# Where cached parses are kept, next to the templates, and the version of
+# their format. Cache files written by another version are ignored.
+TEMPLATE_CACHE_DIR = '__templatecache__'
+TEMPLATE_CACHE_VERSION = 1
+
+
+def _flatten(node: Stan) -> tuple[Any, ...]:
+    return (
+        node.tagname, node._indent, dict(node._attributes),
+        [_flatten(child) if isinstance(child, Stan) else child for child in node._children])
+
+
+def _unflatten(flat: tuple[Any, ...]) -> Stan:
+    tagname, indent, attributes, children = flat
+    return Stan(
+        tagname, indent,
+        *[_unflatten(child) if isinstance(child, tuple) else child for child in children],
+        **attributes)
+
+
+def _flatten_indents(node: Stan) -> None:
+    node._indent = 0
+    for child in node._children:
+        if isinstance(child, Stan):
+            _flatten_indents(child)
+
+
+def template_cache_path(filename: str) -> str:
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, TEMPLATE_CACHE_DIR, name + '.stan')
+
+
+def _cache_header(digest: str) -> tuple[Any, ...]:
+    # marshal's format may change between Python versions
+    return (TEMPLATE_CACHE_VERSION, sys.implementation.cache_tag, digest)
+
+
+# What load needs from a parse: the tree, the refs of its SlotIndex, and the
+# paths of its patterns by name
+_Parse = tuple[Stan | None, dict[str, list[_SlotRef]], dict[str, tuple[int, ...]]]
+
+
+def _read_template_cache(filename: str, digest: str) -> _Parse | None:
+    """Return the cached parse of filename if it was made from a source
+    with this digest."""
+    try:
+        with open(template_cache_path(filename), 'rb') as f:
+            header, flat, refs, patterns = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if header != _cache_header(digest):
+        return None
+    return (None if flat is None else _unflatten(flat)), refs, patterns
+
+
+def _write_template_cache(filename: str, digest: str, parse: _Parse) -> None:
+    """Cache the parse of filename. Failures, such as a read-only template
+    directory, are ignored."""
+    root, refs, patterns = parse
+    path = template_cache_path(filename)
+    data = marshal.dumps((_cache_header(digest), None if root is None else _flatten(root), refs, patterns))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name, so other processes never read a
+        # partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        pass
+
+
+def _parse(source: IO[bytes]) -> _Parse:
+    root = parse_template(source)
+    if root is None:
+        return None, {}, {}
+    patterns: dict[str, tuple[int, ...]] = {}
+    _find_patterns(root, (), patterns)
+    return root, SlotIndex(root).refs, patterns
+
+
 class Template(object):
-    def __init__(self, filename: str) -> None:
+    """An HTML file parsed into Stan.
+
+    With cache=True, the parse is kept in TEMPLATE_CACHE_DIR next to the
+    file, keyed by a hash of its contents, and later loads of the same
+    contents, in any process, skip parsing.
+    """
+
+    def __init__(self, filename: str, cache: bool = False) -> None:
         self.filename: str = filename
+        self.cache: bool = cache
         self.loaded: bool = False
         self.template: Stan | None = None
         self.root: Stan | None = None
+        self.plan: RenderPlan | None = None
+        # Clone factories for the data-pat nodes of template, by name
+        self.patterns: dict[str, PatternFactory] = {}
+        # Where the slots of template are, and of root as it is filled
+        self.template_slots: SlotIndex | None = None
+        self.slots: SlotIndex | None = None
+        self._slots_root: Stan | None = None
+        # Counts the writes to root, and what the count was when slots last
+        # matched it
+        self._writes: _Writes = _Writes()
+        self._slots_writes: int = 0
+        # Bumped by every load, so caches can tell versions of the file apart
+        self.generation: int = 0
+        self.mtime: int | None = None
 
     def load(self) -> 'Template':
         self.loaded = True
-        self.template = parse_template(open(self.filename, 'rb'))
+        self.generation += 1
+        self.mtime = self._stat_mtime()
+        if self.cache:
+            with open(self.filename, 'rb') as f:
+                source = f.read()
+            digest = hashlib.blake2b(source, digest_size=16).hexdigest()
+            parse = _read_template_cache(self.filename, digest)
+            if parse is None:
+                parse = _parse(io.BytesIO(source))
+                _write_template_cache(self.filename, digest, parse)
+        else:
+            with open(self.filename, 'rb') as f:
+                parse = _parse(f)
+        self.template, refs, patterns = parse
         if self.template:
-            self.root = self.template.copy()
+            # Copies of the root start with every indent 0
+            _flatten_indents(self.template)
+        self.plan = None
+        self.patterns = {}
+        if self.template:
+            self.template_slots = SlotIndex()
+            self.template_slots.refs = refs
+            self.template_slots.bind(self.template)
+            for patname, path in patterns.items():
+                self.patterns[patname] = PatternFactory(
+                    _node_at(self.template, path), self.template_slots.below(path))
+            self._reset_root()
         return self
 
-    def clone_pat(self, patname: str, **slots: Any) -> Stan:
+    def _reset_root(self) -> None:
+        assert self.template is not None and self.template_slots is not None
+        # template is never handed out to be changed in place, so root can
+        # share its nodes, and the paths are the same
+        self.root = self.template._share((0, _write_stamp, None, 0), self._writes)
+        self.slots = self.template_slots.copy()
+        self.slots.writes = self._writes
+        self._slots_root = self.root
+        self._slots_writes = self._writes.count
+
+    def copy(self) -> 'Template':
+        """Return a Template with a root of its own to fill, sharing the
+        parsed tree, patterns, slot index and plan of this one."""
         if not self.loaded:
             self.load()
-        current = self.template
-        if not current:
-            raise ValueError("Template failed to load")
-        for child in current.children:
-            if not isinstance(child, Stan):
-                continue
-            result = child.clone_pat(patname, **slots)
-            if result:
-                attrslots = result.attributes.get("data-attr", "")
-                attrslots = attrslots.split(",")
-                attrslots = [
-                    (k, v) for k, v in (x.split("=") for x in attrslots if x)]
-                for k, v in slots.items():
-                    if result.attributes.get("data-slot") == k:
-                        if isinstance(v, Stan):
-                            result = v
-                        else:
-                            result.children = [v]
-                    for attrname, attrslotname in attrslots:
-                        if attrslotname == k:
-                            result.attributes[attrname] = v
-                return result
-        else:
-            raise ValueError(f"Pattern {patname} not found in template.")
+        other = Template(self.filename, self.cache)
+        other.loaded = True
+        other.generation = self.generation
+        other.mtime = self.mtime
+        other.template = self.template
+        other.plan = self.plan
+        other.patterns = self.patterns
+        other.template_slots = self.template_slots
+        if self.template:
+            other._reset_root()
+        return other
 
-    def fill_slots(self, slotname: str, value: Any) -> None:
-        if not self.loaded:
-            self.load()
+    def reindex(self) -> None:
+        """Rebuild the slot index. The slot methods do this themselves when
+        root was changed other than through them."""
         if self.root:
-            self.root.fill_slots(slotname, value)
+            self.slots = SlotIndex(self.root, writes=self._writes)
+            self._slots_root = self.root
+            self._slots_writes = self._writes.count
 
-    def clear_slots(self, slotname: str) -> None:
+    def _update_slots(self, update: Callable[..., None], slotname: str, *args: Any) -> None:
         if not self.loaded:
             self.load()
-        if self.root:
-            self.root.clear_slots(slotname)
+        if not self.root:
+            return
+        if self.slots is None or self._slots_root is not self.root or self._slots_writes != self._writes.count:
+            self.reindex()
+        assert self.slots is not None
+        try:
+            update(self.root, self.slots, slotname, *args)
+        except _StaleIndex:
+            self.reindex()
+            update(self.root, self.slots, slotname, *args)
+        self._slots_writes = self._writes.count
+
+    def _stat_mtime(self) -> int | None:
+        try:
+            return os.stat(self.filename).st_mtime_ns
+        except OSError:
+            return None
+
+    def changed(self) -> bool:
+        """Whether the file was modified since it was loaded."""
+        return self.loaded and self._stat_mtime() != self.mtime
+
+    def compile(self) -> 'RenderPlan':
+        if not self.loaded:
+            self.load()
+        if not self.template:
+            raise ValueError("Template failed to load")
+        if self.plan is None:
+            self.plan = self.template.copy().compile()
+        return self.plan
 
-    def append_slots(self, slotname: str, value: Any) -> None:
+    def pattern(self, patname: str) -> PatternFactory:
+        """Return the clone factory for the first data-pat node named
+        patname."""
         if not self.loaded:
             self.load()
-        if self.root:
-            self.root.append_slots(slotname, value)
+        if not self.template:
+            raise ValueError("Template failed to load")
+        if patname not in self.patterns:
+            raise ValueError(f"Pattern {patname} not found in template.")
+        return self.patterns[patname]
+
+    def clone_pat(self, patname: str, **slots: Any) -> Stan:
+        return self.pattern(patname)(**slots)
+
+    def fill_slots(self, slotname: str, value: Any) -> None:
+        self._update_slots(_fill_slots, slotname, value)
+
+    def clear_slots(self, slotname: str) -> None:
+        self._update_slots(_clear_slots, slotname)
+
+    def append_slots(self, slotname: str, value: Any) -> None:
+        self._update_slots(_append_slots, slotname, value)
+
+
+class TemplateRegistry(object):
+    """Parsed templates shared by the whole process, by file name.
+
+    Each file is parsed once, on first use or by `preload`, and parsed
+    again only when its modification time changes, if check_mtime is set.
+    With cache=True, parses are cached on disk as with Template(cache=True).
+    `get` returns the shared Template, for clone_pat, compile and
+    RenderCache; `instance` returns a copy of it to fill for one request.
+    """
+
+    def __init__(self, check_mtime: bool = True, cache: bool = False) -> None:
+        self.check_mtime: bool = check_mtime
+        self.cache: bool = cache
+        self.templates: dict[str, Template] = {}
+
+    def get(self, filename: str) -> Template:
+        key = os.path.abspath(filename)
+        template = self.templates.get(key)
+        if template is None:
+            template = self.templates[key] = Template(key, self.cache).load()
+        elif self.check_mtime and template.changed():
+            template.load()
+        return template
+
+    def instance(self, filename: str) -> Template:
+        return self.get(filename).copy()
+
+    def preload(self, directory: str, suffix: str = '.html') -> list[Template]:
+        """Load every file below directory whose name ends with suffix."""
+        loaded = []
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(suffix):
+                    loaded.append(self.get(os.path.join(dirpath, filename)))
+        return loaded
+
+    def clear(self) -> None:
+        self.templates.clear()
+
+
+# The registry for the process
+templates = TemplateRegistry()
 
 
 def clear_slots(node: Stan, slotname: str) -> None:
@@ -506,30 +1201,429 @@ def append_slots(node: Stan, slotname: str, value: Any) -> None:
     return node.append_slots(slotname, value)
 
 
+def parse_data_attr(value: str) -> list[tuple[str, str]]:
+    """Parse a data-attr value like "href=link,title=name" into pairs."""
+    return [
+        (k, v) for k, v in (x.split("=") for x in value.split(",") if x)]
+
+
+_MISSING = object()
+
+
+def is_compact(state: Any) -> bool:
+    """Whether state asks for HTML without indentation, with
+    state["compact_html"] set by consumers_app(compact_html=True) or by the
+    application for one request."""
+    return bool(state.get("compact_html"))
+
+
+async def _produce_text(thing: Any, state: Any) -> str:
+    chunks = []
+    async for chunk in producers.produce(thing, state):
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('utf8')
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+class _AttrHole(object):
+    def __init__(self, name: str, slotname: str | None, default: Any) -> None:
+        self.name: str = name
+        self.slotname: str | None = slotname
+        self.default: Any = default
+
+    async def render(self, slots: dict[str, Any], state: Any, out: list[bytes]) -> None:
+        value = self.default
+        if self.slotname is not None and self.slotname in slots:
+            value = slots[self.slotname]
+        elif value is _MISSING:
+            return
+        if not isinstance(value, str):
+            value = await _produce_text(value, state)
+        value = value.replace('"', '&quot;')
+        out.append(f' {self.name}="{value}"'.encode('utf8'))
+
+
+class _ValueHole(object):
+    def __init__(self, value: Any) -> None:
+        self.value: Any = value
+
+    async def render(self, slots: dict[str, Any], state: Any, out: list[bytes]) -> None:
+        _append_child(self.value, out)
+
+
+_NO_SLOTS: dict[str, Any] = {}
+
+
+class _SlotHole(object):
+    def __init__(
+        self, slotname: str, indent: int, head: list[Any],
+        children: list[Any], tail: bytes, compact: bool = False
+    ) -> None:
+        self.slotname: str = slotname
+        self.indent: int = indent
+        self.head: list[Any] = head
+        self.children: list[Any] = children
+        self.tail: bytes = tail
+        self.compact: bool = compact
+
+    async def render(self, slots: dict[str, Any], state: Any, out: list[bytes]) -> None:
+        if self.slotname not in slots:
+            await _render_parts(self.head, slots, state, out)
+            await _render_parts(self.children, slots, state, out)
+            out.append(self.tail)
+            return
+        value = slots[self.slotname]
+        # Inserted values render as they are, as fill_slots would leave
+        # them, without the slots of the page applied to them again
+        if isinstance(value, Stan):
+            await _render_parts(
+                _compile_node(value, self.indent, self.compact), _NO_SLOTS, state, out)
+            return
+        await _render_parts(self.head, slots, state, out)
+        if isinstance(value, list):
+            for node in value:
+                if isinstance(node, Stan):
+                    await _render_parts(
+                        _compile_node(node, self.indent, self.compact), _NO_SLOTS, state, out)
+                else:
+                    _append_child(node, out)
+        else:
+            _append_child(value, out)
+        out.append(self.tail)
+
+
+def _append_child(child: Any, out: list[bytes]) -> None:
+    if isinstance(child, bytes):
+        out.append(child)
+    else:
+        out.append(str(child).encode('utf8'))
+
+
+class _PartsBuilder(object):
+    """Accumulates static text and holes, merging adjacent static text.
+
+    A compact builder leaves out indentation and the newlines around tags.
+    """
+
+    def __init__(self, compact: bool = False) -> None:
+        self.parts: list[Any] = []
+        self.text: list[str] = []
+        self.compact: bool = compact
+        self.newline: str = "" if compact else "\n"
+
+    def indent(self, indent: int) -> str:
+        return "" if self.compact else "    " * indent
+
+    def static(self, text: str) -> None:
+        self.text.append(text)
+
+    def hole(self, hole: Any) -> None:
+        self.flush()
+        self.parts.append(hole)
+
+    def flush(self) -> None:
+        if self.text:
+            self.parts.append("".join(self.text).encode('utf8'))
+            self.text = []
+
+    def build(self) -> list[Any]:
+        self.flush()
+        return self.parts
+
+
+def _compile_head(node: Stan, indent: int, builder: _PartsBuilder) -> None:
+    builder.static(f"{builder.indent(indent)}<{node.tagname}")
+    bindings: dict[str, str] = {}
+    data_attr = node._attributes.get("data-attr")
+    if isinstance(data_attr, str):
+        for attrname, attrslotname in parse_data_attr(data_attr):
+            bindings.setdefault(attrname, attrslotname)
+    for k, v in node._attributes.items():
+        if k in bindings:
+            builder.hole(_AttrHole(k, bindings.pop(k), v))
+        elif isinstance(v, str):
+            builder.static(f' {k}="{v.replace('"', '&quot;')}"')
+        else:
+            builder.hole(_AttrHole(k, None, v))
+    for k, slotname in bindings.items():
+        builder.hole(_AttrHole(k, slotname, _MISSING))
+
+
+def _compile_children(node: Stan, place: _Place, builder: _PartsBuilder) -> None:
+    for child in node._children:
+        if isinstance(child, Stan):
+            child_place = _child_place(child, place)
+            slotname = child._attributes.get("data-slot")
+            if slotname is None:
+                _compile_into(child, child_place, builder)
+                continue
+            # Stan values replace the slot node at the parent's indent + 1,
+            # matching Stan.fill_slots.
+            fill_indent = place[0] + 1
+            child_indent = child_place[0]
+            compact = builder.compact
+            head = _PartsBuilder(compact)
+            _compile_head(child, child_indent, head)
+            if child.tagname in VOID_ELEMENTS_SET:
+                head.static(">" if compact else " />\n")
+                builder.hole(_SlotHole(
+                    slotname, fill_indent, head.build(), [], b'', compact))
+                continue
+            head.static(f">{head.newline}")
+            body = _PartsBuilder(compact)
+            _compile_children(child, child_place, body)
+            tail = f"{head.newline}{head.indent(child_indent)}</{child.tagname}>{head.newline}"
+            builder.hole(_SlotHole(
+                slotname, fill_indent, head.build(), body.build(),
+                tail.encode('utf8'), compact))
+        elif isinstance(child, str):
+            builder.static(child)
+        else:
+            builder.hole(_ValueHole(child))
+
+
+def _compile_into(node: Stan, place: _Place, builder: _PartsBuilder) -> None:
+    indent = place[0]
+    _compile_head(node, indent, builder)
+    if node.tagname in VOID_ELEMENTS_SET:
+        builder.static(">" if builder.compact else " />\n")
+        return
+    builder.static(f">{builder.newline}")
+    _compile_children(node, place, builder)
+    builder.static(f"{builder.newline}{builder.indent(indent)}</{node.tagname}>{builder.newline}")
+
+
+def _compile_node(node: Stan, indent: int | None = None, compact: bool = False) -> list[Any]:
+    """Compile node where it is, or at `indent` with each descendant one
+    deeper than its parent."""
+    builder = _PartsBuilder(compact)
+    if indent is None:
+        place = _place(node)
+    else:
+        stamp = _new_layout_stamp()
+        place = (indent, stamp, indent, stamp)
+    _compile_into(node, place, builder)
+    return builder.build()
+
+
+async def _render_parts(parts: list[Any], slots: dict[str, Any], state: Any, out: list[bytes]) -> None:
+    for part in parts:
+        if type(part) is bytes:
+            out.append(part)
+        else:
+            await part.render(slots, state, out)
+
+
+class RenderPlan(object):
+    """A Stan tree flattened into pre-encoded static bytes and dynamic holes.
+
+    Holes are left for data-slot elements and data-attr bindings below the
+    root, and for any attribute value or child that is not a str. Rendering
+    walks the flat list once, so compiling a template once and rendering it
+    with different slot values avoids copying and re-walking the tree.
+
+    compact_parts, if given, are rendered instead of parts when the state
+    asks for compact HTML.
+    """
+
+    def __init__(
+        self, parts: list[Any], slots: dict[str, Any] | None = None,
+        compact_parts: list[Any] | None = None
+    ) -> None:
+        self.parts: list[Any] = parts
+        self.slots: dict[str, Any] = slots or {}
+        self.compact_parts: list[Any] | None = compact_parts
+
+    def fill(self, **slots: Any) -> 'RenderPlan':
+        return RenderPlan(self.parts, self.slots | slots, self.compact_parts)
+
+    async def render(self, state: Any) -> bytes:
+        parts = self.parts
+        if self.compact_parts is not None and is_compact(state):
+            parts = self.compact_parts
+        out: list[bytes] = []
+        await _render_parts(parts, self.slots, state, out)
+        return b"".join(out)
+
+
+# Default RenderCache bound on the total size of cached output
+RENDER_CACHE_SIZE = 16 * 1024 * 1024
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+def _hash_slot(value: Any, digest: Any) -> None:
+    """Feed a canonical encoding of a slot value into digest.
+
+    Raises _Uncacheable for values whose rendering may change between
+    requests, such as functions or objects with their own producers.
+    """
+    if isinstance(value, Stan):
+        digest.update(f"<{len(value.tagname)}:{value.tagname}".encode('utf8'))
+        for k, v in value._attributes.items():
+            digest.update(f"@{len(k)}:{k}".encode('utf8'))
+            _hash_slot(v, digest)
+        for child in value._children:
+            _hash_slot(child, digest)
+        digest.update(b">")
+    elif isinstance(value, (list, tuple)):
+        digest.update(b"[")
+        for item in value:
+            _hash_slot(item, digest)
+        digest.update(b"]")
+    elif type(value) in (str, bytes, int, float, bool) or value is None:
+        data = value if isinstance(value, bytes) else str(value).encode('utf8')
+        digest.update(f"{type(value).__name__}{len(data)}:".encode('utf8'))
+        digest.update(data)
+    else:
+        raise _Uncacheable(type(value).__name__)
+
+
+def slots_key(slots: dict[str, Any]) -> str | None:
+    """Return a hash of slot names and values, or None if any value cannot
+    be cached."""
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        for name in sorted(slots):
+            digest.update(f"{len(name)}:{name}".encode('utf8'))
+            _hash_slot(slots[name], digest)
+    except _Uncacheable:
+        return None
+    return digest.hexdigest()
+
+
+class RenderCache(object):
+    """An opt-in LRU cache of rendered template output.
+
+    Entries are keyed by the template's filename and load generation and a
+    hash of the slot values, and the cache holds at most `max_bytes` of
+    output. When `check_mtime` is set, a template whose file changed is
+    reloaded and its entries dropped before rendering. Slot values other
+    than Stan trees, lists, tuples, str, bytes, numbers and None are
+    rendered without the cache.
+    """
+
+    def __init__(self, max_bytes: int = RENDER_CACHE_SIZE, check_mtime: bool = True) -> None:
+        self.max_bytes: int = max_bytes
+        self.check_mtime: bool = check_mtime
+        self.entries: OrderedDict[tuple[str, int, str], bytes] = OrderedDict()
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: tuple[str, int, str]) -> bytes | None:
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: tuple[str, int, str], value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self.entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def invalidate(self, template: 'Template | None' = None) -> None:
+        """Drop the entries for template, or every entry."""
+        if template is None:
+            self.entries.clear()
+            self.size = 0
+            return
+        for key in [key for key in self.entries if key[0] == template.filename]:
+            self.size -= len(self.entries.pop(key))
+
+    async def render(self, template: Template, state: Any, **slots: Any) -> bytes:
+        """Render template with slots filled, reusing cached output."""
+        if self.check_mtime and template.changed():
+            template.load()
+            self.invalidate(template)
+        plan = template.compile()
+        slot_hash = slots_key(slots)
+        if slot_hash is None:
+            return await plan.fill(**slots).render(state)
+        if is_compact(state):
+            slot_hash += ":compact"
+        key = (template.filename, template.generation, slot_hash)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        result = await plan.fill(**slots).render(state)
+        self.put(key, result)
+        return result
+
+
 async def produce_html(thing: Stan, state: Any) -> AsyncIterator[str]:
-    indent = "    " * thing.indent
+    if is_compact(state):
+        out: list[str] = []
+        await _compact_html(thing, state, out)
+        yield "".join(out)
+        return
+    async for chunk in _produce_html(thing, _place(thing), state):
+        yield chunk
+
+
+async def _produce_html(thing: Stan, place: _Place, state: Any) -> AsyncIterator[str]:
+    indent = "    " * place[0]
     yield f"{indent}<{thing.tagname}"
-    if thing.attributes:
-        for k, v in thing.attributes.items():
-            attrpartchunks = []
-            async for chunk in producers.produce(v, state):
-                attrpartchunks.append(chunk)
-            attrpartval = "".join(
-                attrpartchunks).replace('"', '&quot;')
+    if thing._attributes:
+        for k, v in thing._attributes.items():
+            attrpartval = (await _produce_text(v, state)).replace('"', '&quot;')
             attrpart = f' {k}="{attrpartval}"'
             yield attrpart
     if thing.tagname in VOID_ELEMENTS_SET:
         yield " />\n"
         return
     yield ">\n"
-    if thing.children:
-        for child in thing.children:
+    if thing._children:
+        for child in thing._children:
             if isinstance(child, Stan):
-                async for chunk in produce_html(child, state):
+                async for chunk in _produce_html(child, _child_place(child, place), state):
                     yield chunk
             else:
                 yield child
     yield f"\n{indent}</{thing.tagname}>\n"
 
 
+async def _compact_html(thing: Stan, state: Any, out: list[str]) -> None:
+    """Render thing without indentation or newlines around tags, ignoring
+    the indents of the tree."""
+    out.append(f"<{thing.tagname}")
+    for k, v in thing._attributes.items():
+        if not isinstance(v, str):
+            v = await _produce_text(v, state)
+        out.append(f' {k}="{v.replace('"', '&quot;')}"')
+    if thing.tagname in VOID_ELEMENTS_SET:
+        out.append(">")
+        return
+    out.append(">")
+    for child in thing._children:
+        if isinstance(child, Stan):
+            await _compact_html(child, state, out)
+        elif isinstance(child, str):
+            out.append(child)
+        elif isinstance(child, bytes):
+            out.append(child.decode('utf8'))
+        else:
+            out.append(str(child))
+    out.append(f"</{thing.tagname}>")
+
+
+async def produce_plan(thing: RenderPlan, state: Any) -> AsyncIterator[bytes]:
+    yield await thing.render(state)
+
+
 producers.add_producer(Stan, produce_html)
+producers.add_producer(RenderPlan, produce_plan)
+producers.add_validator(Stan, producers.validate_version)
+producers.add_validator(RenderPlan, producers.validate_version)
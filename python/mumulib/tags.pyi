@@ -1,5 +1,6 @@
 from _typeshed import Incomplete
 from mumulib import producers as producers
+from collections import OrderedDict
 from typing import Any, AsyncIterator, IO
 
 VOID_ELEMENTS: list[str]
@@ -26,10 +27,19 @@ def reindent_tree(node: Stan, indent: int) -> None: ...
 class Stan:
     clone: bool
     tagname: str
-    indent: int
-    attributes: dict[str, Any]
-    children: list[Any]
     def __init__(self, tagname: str, indent: int, *args: Any, **kwargs: Any) -> None: ...
+    @property
+    def indent(self) -> int: ...
+    @indent.setter
+    def indent(self, value: int) -> None: ...
+    @property
+    def attributes(self) -> dict[str, Any]: ...
+    @attributes.setter
+    def attributes(self, value: dict[str, Any]) -> None: ...
+    @property
+    def children(self) -> list[Any]: ...
+    @children.setter
+    def children(self, value: list[Any]) -> None: ...
     def __call__(self, **kwargs: Any) -> Stan: ...
     def __getitem__(self, item: Any) -> Stan: ...
     def copy(self) -> Stan: ...
@@ -37,6 +47,27 @@ class Stan:
     def clear_slots(self, slotname: str) -> None: ...
     def fill_slots(self, slotname: str, value: Any) -> None: ...
     def append_slots(self, slotname: str, value: Any) -> None: ...
+    def compile(self) -> RenderPlan: ...
+
+class SlotIndex:
+    slotname: str | None
+    writes: Any
+    refs: dict[str, list[tuple[tuple[int, ...], bool, tuple[str, ...]]]]
+    nodes: dict[tuple[int, ...], Stan]
+    def __init__(self, node: Stan | None = None, slotname: str | None = None, writes: Any = None) -> None: ...
+    def copy(self) -> SlotIndex: ...
+    def bind(self, node: Stan) -> None: ...
+    def below(self, path: tuple[int, ...]) -> SlotIndex: ...
+    def add(self, node: Stan, path: tuple[int, ...]) -> None: ...
+    def remove(self, path: tuple[int, ...], inclusive: bool) -> None: ...
+    def targets(self, slotname: str) -> dict[int, list[Any]]: ...
+
+class PatternFactory:
+    node: Stan
+    slots: SlotIndex
+    attrslots: list[tuple[str, str]]
+    def __init__(self, node: Stan, slots: SlotIndex | None = None) -> None: ...
+    def __call__(self, **slots: Any) -> Stan: ...
 
 class TagGroup:
     def __init__(self, *tags: str) -> None: ...
@@ -60,19 +91,77 @@ all: Incomplete
 
 def parse_template(source: IO[bytes]) -> Stan | None: ...
 
+TEMPLATE_CACHE_DIR: str
+TEMPLATE_CACHE_VERSION: int
+
+def template_cache_path(filename: str) -> str: ...
+
 class Template:
     filename: str
+    cache: bool
     loaded: bool
     template: Stan | None
     root: Stan | None
-    def __init__(self, filename: str) -> None: ...
+    plan: RenderPlan | None
+    patterns: dict[str, PatternFactory]
+    template_slots: SlotIndex | None
+    slots: SlotIndex | None
+    generation: int
+    mtime: int | None
+    def __init__(self, filename: str, cache: bool = False) -> None: ...
     def load(self) -> Template: ...
+    def copy(self) -> Template: ...
+    def changed(self) -> bool: ...
+    def reindex(self) -> None: ...
+    def compile(self) -> RenderPlan: ...
+    def pattern(self, patname: str) -> PatternFactory: ...
     def clone_pat(self, patname: str, **slots: Any) -> Stan: ...
     def fill_slots(self, slotname: str, value: Any) -> None: ...
     def clear_slots(self, slotname: str) -> None: ...
     def append_slots(self, slotname: str, value: Any) -> None: ...
 
+class TemplateRegistry:
+    check_mtime: bool
+    cache: bool
+    templates: dict[str, Template]
+    def __init__(self, check_mtime: bool = True, cache: bool = False) -> None: ...
+    def get(self, filename: str) -> Template: ...
+    def instance(self, filename: str) -> Template: ...
+    def preload(self, directory: str, suffix: str = '.html') -> list[Template]: ...
+    def clear(self) -> None: ...
+
+templates: TemplateRegistry
+
 def clear_slots(node: Stan, slotname: str) -> None: ...
 def fill_slots(node: Stan, slotname: str, value: Any) -> None: ...
 def append_slots(node: Stan, slotname: str, value: Any) -> None: ...
+def parse_data_attr(value: str) -> list[tuple[str, str]]: ...
+def is_compact(state: Any) -> bool: ...
+
+class RenderPlan:
+    parts: list[Any]
+    slots: dict[str, Any]
+    compact_parts: list[Any] | None
+    def __init__(self, parts: list[Any], slots: dict[str, Any] | None = None, compact_parts: list[Any] | None = None) -> None: ...
+    def fill(self, **slots: Any) -> RenderPlan: ...
+    async def render(self, state: Any) -> bytes: ...
+
+RENDER_CACHE_SIZE: int
+
+def slots_key(slots: dict[str, Any]) -> str | None: ...
+
+class RenderCache:
+    max_bytes: int
+    check_mtime: bool
+    entries: OrderedDict[tuple[str, int, str], bytes]
+    size: int
+    hits: int
+    misses: int
+    def __init__(self, max_bytes: int = ..., check_mtime: bool = True) -> None: ...
+    def get(self, key: tuple[str, int, str]) -> bytes | None: ...
+    def put(self, key: tuple[str, int, str], value: bytes) -> None: ...
+    def invalidate(self, template: Template | None = None) -> None: ...
+    async def render(self, template: Template, state: Any, **slots: Any) -> bytes: ...
+
 async def produce_html(thing: Stan, state: Any) -> AsyncIterator[str]: ...
+async def produce_plan(thing: RenderPlan, state: Any) -> AsyncIterator[bytes]: ...
@@ -0,0 +1,890 @@
+import coverage  # pragma: no cover
+
+cov = coverage.Coverage(branch=True)  # pragma: no cover
+cov.start()  # pragma: no cover
+
+import asyncio  # pragma: no cover
+import os  # pragma: no cover
+import shutil  # pragma: no cover
+import sys  # pragma: no cover
+import tempfile  # pragma: no cover
+import tracemalloc  # pragma: no cover
+import unittest  # pragma: no cover
+
+from mumulib import producers, tags  # pragma: no cover
+from mumulib.server import consumers_app  # pragma: no cover
+from mumulib.tags import (  # pragma: no cover
+    all,
+    parse_data_attr,
+    PatternFactory,
+    produce_html,
+    reindent_tree,
+    RenderCache,
+    SlotIndex,
+    RenderPlan,
+    slots_key,
+    template_cache_path,
+    Template,
+    TemplateRegistry,
+)
+
+
+TEMPLATE_FILE = os.path.join(os.path.dirname(__file__), 'templates.html')  # pragma: no cover
+
+
+def build_tree(depth, width):  # pragma: no cover
+    node = all.span(**{"data-slot": "leaf"})["x"]
+    for i in range(depth):
+        attrs = {"data-pat": "item"} if i == depth - 1 else {}
+        node = all.div(**attrs)[[node] + [all.p[f"filler {j}"] for j in range(width)]]
+    return all.body[all.section[node]]
+
+
+def write_page(directory, slots, width):  # pragma: no cover
+    """Write a page with `slots` slots among `width` paragraphs each, and a
+    "row" pattern at the end."""
+    fillers = "".join(f"<p>filler {j}</p>" for j in range(width))
+    sections = "".join(
+        f'<section><h2 data-slot="title{i}" data-attr="id=anchor{i}">t</h2>{fillers}</section>'
+        for i in range(slots))
+    filename = os.path.join(directory, 'page.html')
+    with open(filename, 'w') as f:
+        f.write(
+            f"<html><body>{sections}"
+            '<ul data-slot="rows"><li data-pat="row"><span data-slot="cell">c</span></li></ul>'
+            "</body></html>")
+    return filename
+
+
+async def render_html(node, state):  # pragma: no cover
+    chunks = []
+    async for chunk in produce_html(node, state):
+        chunks.append(str(chunk))
+    return "".join(chunks).encode('utf8')
+
+
+class TestParseDataAttr(unittest.TestCase):
+    """Test parse_data_attr function"""
+
+    def test_pairs(self):
+        self.assertEqual(
+            parse_data_attr("href=link,title=name"),
+            [("href", "link"), ("title", "name")])
+
+    def test_empty_entries_skipped(self):
+        self.assertEqual(parse_data_attr(""), [])
+        self.assertEqual(parse_data_attr("href=link,"), [("href", "link")])
+
+
+class TestRenderPlan(unittest.TestCase):
+    """Test compiled render plans against produce_html"""
+
+    def setUp(self):
+        self.state = {'accept': ['*/*']}
+
+    async def async_test_unfilled_template(self):
+        """Test that an unfilled plan matches rendering the template root"""
+        template = Template(TEMPLATE_FILE).load()
+        plan = template.compile()
+        self.assertIs(plan, template.compile())
+        expected = await render_html(template.root, self.state)
+        self.assertEqual(await plan.render(self.state), expected)
+
+    def test_unfilled_template(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_unfilled_template())
+
+    async def async_test_filled_slots(self):
+        """Test that filling a plan matches fill_slots on the tree"""
+        plan = Template(TEMPLATE_FILE).compile()
+        person = Template(TEMPLATE_FILE).clone_pat("person", name="Alice", age="3")
+        cases = [
+            {"people": "Nobody"},
+            {"people": [person, "and friends"]},
+            {"people": all.li["Bob"]},
+            {"name": "Carol", "age": "40"},
+        ]
+        for slots in cases:
+            template = Template(TEMPLATE_FILE).load()
+            for k, v in slots.items():
+                template.fill_slots(k, v)
+            expected = await render_html(template.root, self.state)
+            self.assertEqual(await plan.fill(**slots).render(self.state), expected)
+
+    def test_filled_slots(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_filled_slots())
+
+    async def async_test_data_attr_and_dynamic_values(self):
+        """Test data-attr holes, non-str attributes and non-str children"""
+        def build():
+            return all.section[
+                all.div(**{"data-attr": "href=link,title=name", "title": "t"})[[
+                    all.span(width=10)[["hi", 3]],
+                    all.img(src="a.png"),
+                ]]
+            ]
+
+        node = build()
+        plan = node.compile()
+        node.fill_slots("link", "/x")
+        node.fill_slots("name", 'say "hi"')
+        expected = await render_html(node, self.state)
+        result = await plan.fill(link="/x").fill(name='say "hi"').render(self.state)
+        self.assertEqual(result, expected)
+        self.assertIn(b'title="say &quot;hi&quot;"', result)
+
+        unfilled = await build().compile().render(self.state)
+        self.assertEqual(unfilled, await render_html(build(), self.state))
+        self.assertNotIn(b' href=', unfilled)
+
+    def test_data_attr_and_dynamic_values(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_data_attr_and_dynamic_values())
+
+    async def async_test_void_slot(self):
+        """Test that a void element used as a slot can be replaced"""
+        node = all.div[all.br(**{"data-slot": "sep"})]
+        plan = node.compile()
+        self.assertEqual(await plan.render(self.state), await render_html(node, self.state))
+        node.fill_slots("sep", all.hr)
+        self.assertEqual(
+            await plan.fill(sep=all.hr).render(self.state),
+            await render_html(node, self.state))
+
+    def test_void_slot(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_void_slot())
+
+    async def async_test_inserted_slots_not_refilled(self):
+        """Test that slots inside an inserted value are left as fill_slots leaves them"""
+        def page():
+            return all.html[all.body[all.div(**{"data-slot": "content"})]]
+
+        def card():
+            return all.section[all.div(**{"data-slot": "content"})["default"]]
+
+        node = page()
+        node.fill_slots("content", card())
+        expected = await render_html(node, self.state)
+        self.assertEqual(await page().compile().fill(content=card()).render(self.state), expected)
+        self.assertIn(b"default", expected)
+
+        node = page()
+        node.fill_slots("content", [card(), "after"])
+        self.assertEqual(
+            await page().compile().fill(content=[card(), "after"]).render(self.state),
+            await render_html(node, self.state))
+
+        template = Template(TEMPLATE_FILE)
+        person = all.li(**{"data-slot": "people"})["nested"]
+        cached = await RenderCache().render(template, self.state, people=person)
+        self.assertEqual(cached, await template.compile().fill(people=person).render(self.state))
+        self.assertIn(b"nested", cached)
+
+    def test_inserted_slots_not_refilled(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_inserted_slots_not_refilled())
+
+    async def async_test_produce(self):
+        """Test that plans are registered as a producer"""
+        plan = all.p["hello"].compile()
+        self.assertIsInstance(plan, RenderPlan)
+        chunks = []
+        async for chunk in producers.produce(plan, self.state):
+            chunks.append(chunk)
+        self.assertEqual(chunks, [b'<p>\nhello\n</p>\n'])
+
+    def test_produce(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_produce())
+
+
+class TestRenderCache(unittest.TestCase):
+    """Test RenderCache"""
+
+    def setUp(self):
+        self.state = {'accept': ['*/*']}
+
+    async def async_test_hits(self):
+        """Test that equal slot values hit the cache and render the same bytes"""
+        cache = RenderCache()
+        template = Template(TEMPLATE_FILE)
+        first = await cache.render(template, self.state, people=[all.li["Bob"], "and friends"])
+        second = await cache.render(template, self.state, people=[all.li["Bob"], "and friends"])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(first, second)
+        expected = await template.compile().fill(people=[all.li["Bob"], "and friends"]).render(self.state)
+        self.assertEqual(first, expected)
+
+        await cache.render(template, self.state, people=[all.li["Carol"], "and friends"])
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(cache.size, sum(len(v) for v in cache.entries.values()))
+
+    def test_hits(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_hits())
+
+    async def async_test_uncacheable(self):
+        """Test that slot values without a canonical hash bypass the cache"""
+        class Dynamic(object):
+            def __str__(self):
+                return "dynamic"
+
+        cache = RenderCache()
+        result = await cache.render(Template(TEMPLATE_FILE), self.state, name=Dynamic())
+        self.assertIn(b"dynamic", result)
+        self.assertEqual(len(cache.entries), 0)
+        self.assertIsNone(slots_key({"name": Dynamic()}))
+
+    def test_uncacheable(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_uncacheable())
+
+    def test_slots_key(self):
+        self.assertEqual(slots_key({"a": 1, "b": "x"}), slots_key({"b": "x", "a": 1}))
+        self.assertNotEqual(slots_key({"a": 1}), slots_key({"a": "1"}))
+        self.assertNotEqual(slots_key({"a": ["bc"]}), slots_key({"a": ["b", "c"]}))
+        self.assertNotEqual(slots_key({"a": all.p(id="x")}), slots_key({"a": all.p(id="y")}))
+        self.assertEqual(slots_key({"a": (None, b"x")}), slots_key({"a": (None, b"x")}))
+
+    def test_lru_bound(self):
+        cache = RenderCache(max_bytes=10)
+        cache.put(("f", 1, "a"), b"12345")
+        cache.put(("f", 1, "b"), b"12345")
+        cache.get(("f", 1, "a"))
+        cache.put(("f", 1, "c"), b"123")
+        self.assertEqual(list(cache.entries), [("f", 1, "a"), ("f", 1, "c")])
+        self.assertEqual(cache.size, 8)
+        cache.put(("f", 1, "a"), b"1")
+        self.assertEqual(cache.size, 4)
+        cache.put(("f", 1, "d"), b"x" * 11)
+        self.assertNotIn(("f", 1, "d"), cache.entries)
+        cache.put(("g", 1, "a"), b"1")
+        cache.invalidate(Template("f"))
+        self.assertEqual(list(cache.entries), [("g", 1, "a")])
+        cache.invalidate()
+        self.assertEqual((len(cache.entries), cache.size), (0, 0))
+
+    async def async_test_file_change(self):
+        """Test that a changed template file is reloaded and its entries dropped"""
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'page.html')
+            shutil.copy(TEMPLATE_FILE, filename)
+            template = Template(filename)
+            cache = RenderCache()
+            before = await cache.render(template, self.state, name="Alice")
+            self.assertFalse(template.changed())
+
+            with open(filename, 'r') as f:
+                source = f.read()
+            with open(filename, 'w') as f:
+                f.write(source.replace("Hello, World!", "Goodbye!"))
+            stat = os.stat(filename)
+            os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            self.assertTrue(template.changed())
+
+            after = await cache.render(template, self.state, name="Alice")
+            self.assertNotEqual(before, after)
+            self.assertIn(b"Goodbye!", after)
+            self.assertEqual(len(cache.entries), 1)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_file_change(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_file_change())
+
+
+class TestCopyOnWrite(unittest.TestCase):
+    """Test that copies share unchanged subtrees"""
+
+    def setUp(self):
+        self.state = {'accept': ['*/*']}
+
+    async def async_test_copies_are_independent(self):
+        """Test that changing a copy or its original leaves the other alone"""
+        original = all.div[[all.p(**{"data-slot": "x"})["a"], all.p["b"]]]
+        expected = await render_html(all.div[[all.p(**{"data-slot": "x"})["a"], all.p["b"]]], self.state)
+        copy = original.copy()
+        original.fill_slots("x", "changed")
+        original.children[1].children.append("more")
+        original(title="t")
+        self.assertEqual(await render_html(copy, self.state), expected.replace(b"    ", b""))
+        self.assertEqual(copy.attributes, {})
+
+        copy.fill_slots("x", all.b["bold"])
+        self.assertIn(b"changed", await render_html(original, self.state))
+        self.assertNotIn(b"bold", await render_html(original, self.state))
+
+    def test_copies_are_independent(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_copies_are_independent())
+
+    async def async_test_held_nodes_are_not_shared(self):
+        """Test that nodes the caller holds are not shared with copies"""
+        inner = all.i(lang="fr")["x"]
+        held = all.span[inner]
+        attributes = inner.attributes
+        original = all.div[held]
+        copy = original.copy()
+        expected = await render_html(copy, self.state)
+        attributes["lang"] = "en"
+        held["y"]
+        held(id="changed")
+        inner(title="t")
+        inner.children.append("z")
+        self.assertEqual(await render_html(copy, self.state), expected)
+
+        value = all.b[inner]
+        filled = all.div[all.p(**{"data-slot": "x"})]
+        filled.fill_slots("x", value)
+        expected = await render_html(filled, self.state)
+        inner(id="later")
+        inner.children.append("later")
+        self.assertEqual(await render_html(filled, self.state), expected)
+
+    def test_held_nodes_are_not_shared(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_held_nodes_are_not_shared())
+
+    async def async_test_layouts(self):
+        """Test that copy and reindent_tree indent descendants lazily"""
+        node = all.div[all.section[all.p["x"]]]
+        copy = node.copy()
+        self.assertEqual(
+            await render_html(copy, self.state),
+            b"<div>\n<section>\n<p>\nx\n</p>\n\n</section>\n\n</div>\n")
+        reindent_tree(copy, 1)
+        self.assertEqual([copy.indent, copy.children[0].indent, copy.children[0].children[0].indent], [1, 2, 3])
+        self.assertEqual(node.children[0].children[0].indent, 1)
+
+        # A later indent changes only its own node, as it would have after
+        # reindenting each descendant
+        item = all.li[all.ul[all.li["x"]]]
+        reindent_tree(item, 0)
+        item.indent = 2
+        self.assertEqual([item.indent, item.children[0].indent, item.children[0].children[0].indent], [2, 1, 2])
+        item = all.li[all.ul[all.li["x"]]]
+        reindent_tree(item, 0)
+        item.children[0].indent = 5
+        self.assertEqual([item.children[0].indent, item.children[0].children[0].indent], [5, 2])
+
+    def test_layouts(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_layouts())
+
+    def test_fill_copies_only_changed_path(self):
+        tree = build_tree(5, 3)
+        level = tree._children[0]._children[0]
+        tree.fill_slots("leaf", "y")
+        filled_level = tree._children[0]._children[0]
+        while level.tagname == "div":
+            # The fillers beside the path are kept, the path is copied
+            self.assertIsNot(level._children, filled_level._children)
+            self.assertIs(level._children[1], filled_level._children[1])
+            level = level._children[0]
+            filled_level = filled_level._children[0]
+        self.assertEqual(level._children, ["x"])
+        self.assertEqual(filled_level._children, ["y"])
+
+    def test_pattern_copies_share_unchanged_nodes(self):
+        tree = build_tree(5, 3)
+        factory = PatternFactory(tree._children[0]._children[0])
+        first = factory(leaf="y")
+        second = factory(leaf="z")
+        self.assertIsNot(first._children[0], second._children[0])
+        self.assertIs(first._children[1], second._children[1])
+
+
+class TestCompactStan(unittest.TestCase):
+    """Test the memory layout of Stan nodes"""
+
+    def setUp(self):
+        self.state = {'accept': ['*/*']}
+
+    def test_slots(self):
+        node = all.td["x"]
+        self.assertFalse(hasattr(node, '__dict__'))
+        with self.assertRaises(AttributeError):
+            node.colspan = 2
+
+    def test_interned_tag_names(self):
+        template = Template(TEMPLATE_FILE).load()
+        self.assertIs(template.root.tagname, sys.intern("html"))
+
+    async def async_test_empty_shared(self):
+        """Test that empty attributes and children are shared until written"""
+        first = all.td["x"]
+        second = all.td["y"]
+        self.assertIs(first._attributes, second._attributes)
+        first.attributes["class"] = "a"
+        self.assertEqual(second.attributes, {})
+        empty = all.br.copy()
+        empty.children.append("z")
+        self.assertEqual(all.br.children, [])
+        self.assertEqual(await render_html(first, self.state), b'<td class="a">\nx\n</td>\n')
+
+    def test_empty_shared(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_empty_shared())
+
+    def test_memory_per_node(self):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            table = all.table[[all.tr[[all.td["cell"] for _ in range(10)]] for _ in range(2000)]]
+            used = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        nodes = 1 + len(table.children) * 11
+        self.assertLess(used / nodes, 250)
+
+
+class TestCompactHtml(unittest.TestCase):
+    """Test the compact render mode"""
+
+    def setUp(self):
+        self.state = {'accept': ['*/*'], 'compact_html': True}
+
+    async def async_test_produce_html(self):
+        node = all.div(id="main", width=3)[[all.p[["hi ", all.b["there"]]], all.br, 7]]
+        self.assertEqual(
+            await render_html(node, self.state),
+            b'<div id="main" width="3"><p>hi <b>there</b></p><br>7</div>')
+
+    def test_produce_html(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_produce_html())
+
+    async def async_test_plan_matches_produce_html(self):
+        """Test that compact plans render what compact produce_html does"""
+        plan = Template(TEMPLATE_FILE).compile()
+        person = Template(TEMPLATE_FILE).clone_pat("person", name="Alice", age="3")
+        cases = [
+            {},
+            {"people": [person, "and friends"]},
+            {"people": all.li["Bob"]},
+            {"name": "Carol", "age": "40"},
+        ]
+        for slots in cases:
+            template = Template(TEMPLATE_FILE).load()
+            for k, v in slots.items():
+                template.fill_slots(k, v)
+            expected = await render_html(template.root, self.state)
+            self.assertNotIn(b"\n    <", expected)
+            self.assertEqual(await plan.fill(**slots).render(self.state), expected)
+        pretty = await plan.render({'accept': ['*/*']})
+        self.assertLess(len(await plan.render(self.state)), len(pretty))
+
+    def test_plan_matches_produce_html(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_plan_matches_produce_html())
+
+    async def async_test_render_cache(self):
+        """Test that compact and indented output are cached apart"""
+        cache = RenderCache()
+        template = Template(TEMPLATE_FILE)
+        compact = await cache.render(template, self.state, name="Alice")
+        pretty = await cache.render(template, {'accept': ['*/*']}, name="Alice")
+        self.assertNotEqual(compact, pretty)
+        self.assertEqual(len(cache.entries), 2)
+
+    def test_render_cache(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_render_cache())
+
+    async def async_test_consumers_app(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}  # pragma: no cover
+
+        app = consumers_app({"page.html": all.p["hello"]}, compact_html=True)
+        scope = {'type': 'http', 'method': 'GET', 'path': '/page.html', 'headers': [], 'state': {}}
+        await app(scope, receive, send)
+        body = b''.join(m['body'] for m in sent if m['type'] == 'http.response.body')
+        self.assertEqual(body, b'<p>hello</p>\n')
+
+    def test_consumers_app(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_consumers_app())
+
+    async def async_test_smaller_output(self):
+        """Test that compact output is smaller and differs only in
+        whitespace"""
+        tree = build_tree(10, 50)
+        pretty = await render_html(tree, {'accept': ['*/*']})
+        compact = await render_html(tree, self.state)
+        self.assertLess(len(compact), len(pretty))
+        self.assertEqual(b"".join(compact.split()), b"".join(pretty.split()))
+
+    def test_smaller_output(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_smaller_output())
+
+
+class TestSlotIndex(unittest.TestCase):
+    """Test that Template fills slots through its index"""
+
+    def setUp(self):
+        self.state = {'accept': ['*/*']}
+
+    def test_index(self):
+        template = Template(TEMPLATE_FILE).load()
+        self.assertEqual(set(template.slots.refs), {"people", "name", "age", "color"})
+        [(path, is_slot, attrnames)] = template.slots.refs["people"]
+        self.assertTrue(is_slot)
+        self.assertEqual(attrnames, ())
+        node = template.root
+        for i in path:
+            node = node._children[i]
+        self.assertEqual(node.tagname, "ol")
+
+        index = SlotIndex(all.div[all.a(**{"data-attr": "href=link,title=link", "data-slot": "x"})], "link")
+        self.assertEqual(index.refs, {"link": [((0,), False, ("href", "title"))]})
+
+    async def async_test_matches_walking(self):
+        """Test that indexed fills render what walking the tree does"""
+        def person():
+            return Template(TEMPLATE_FILE).clone_pat("person", age="3")
+
+        indexed = Template(TEMPLATE_FILE).load()
+        walked = Template(TEMPLATE_FILE).load().root
+        steps = [
+            ("fill_slots", "people", [person(), "and", person()]),
+            ("fill_slots", "name", "Zed"),
+            ("append_slots", "people", person()),
+            ("fill_slots", "name", all.b["Bold"]),
+            ("clear_slots", "age"),
+            ("fill_slots", "people", "nobody"),
+            ("fill_slots", "name", "unused"),
+        ]
+        for method, *args in steps:
+            getattr(indexed, method)(*args)
+            getattr(walked, method)(*args)
+            self.assertEqual(await render_html(indexed.root, self.state), await render_html(walked, self.state))
+        self.assertEqual(set(indexed.slots.refs["name"]), set())
+
+    def test_matches_walking(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_matches_walking())
+
+    async def async_test_stale_index(self):
+        """Test that a root changed behind the index's back is reindexed"""
+        template = Template(TEMPLATE_FILE).load()
+        body = template.root.children[1]
+        body.children.insert(0, all.p(**{"data-slot": "people"})["first"])
+        template.fill_slots("people", "filled")
+        html = await render_html(template.root, self.state)
+        self.assertEqual(html.count(b"filled"), 2)
+
+        template.root = all.div[all.span(**{"data-slot": "name"})]
+        template.fill_slots("name", "replaced")
+        self.assertIn(b"replaced", await render_html(template.root, self.state))
+
+    def test_stale_index(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_stale_index())
+
+    async def async_test_new_slot_nodes(self):
+        """Test that slots added to root directly are filled, cleared and
+        appended to"""
+        template = Template(TEMPLATE_FILE).load()
+        template.root[all.p(**{"data-slot": "x"})["old x"]]
+        template.fill_slots("x", "new x")
+        template.append_slots("x", " and more")
+        html = await render_html(template.root, self.state)
+        self.assertNotIn(b"old x", html)
+        self.assertIn(b"new x and more", html)
+
+        body = template.root.children[1]
+        body.children.append(all.div[all.span(**{"data-slot": "y"})["old y"]])
+        template.clear_slots("y")
+        self.assertNotIn(b"old y", await render_html(template.root, self.state))
+
+        # The fills replaced the nodes on the paths to their slots
+        body = template.root.children[1]
+        [h1] = [child for child in body.children if getattr(child, "tagname", None) == "h1"]
+        h1.attributes["data-attr"] = "title=z"
+        template.fill_slots("z", "zed")
+        self.assertIn(b'title="zed"', await render_html(template.root, self.state))
+
+    def test_new_slot_nodes(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_new_slot_nodes())
+
+    async def async_test_moved_attr_node(self):
+        """Test that data-attr nodes moved by editing children directly are
+        found again"""
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'links.html')
+            with open(filename, 'w') as f:
+                f.write('<html><body><a data-attr="href=link">home</a><a data-attr="href=link">away</a></body></html>')
+            template = Template(filename).load()
+            walked = Template(filename).load().root
+        finally:
+            shutil.rmtree(directory)
+        slots = template.slots
+        for root in (template.root, walked):
+            root.children[0].children.insert(0, all.a["plain"])
+        template.fill_slots("link", "/x")
+        walked.fill_slots("link", "/x")
+        self.assertIsNot(template.slots, slots)
+        html = await render_html(template.root, self.state)
+        self.assertEqual(html, await render_html(walked, self.state))
+        self.assertEqual(html.count(b'href="/x"'), 2)
+        self.assertNotIn(b'<a href="/x">plain', html)
+
+    def test_moved_attr_node(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_moved_attr_node())
+
+    async def async_test_fills_keep_index(self):
+        """Test that fills through the index keep it, and the nodes off the
+        paths to the slots"""
+        directory = tempfile.mkdtemp()
+        try:
+            filename = write_page(directory, 5, 3)
+            template = Template(filename).load()
+            walked = Template(filename).load().root
+        finally:
+            shutil.rmtree(directory)
+        slots = template.slots
+        other = template.copy()
+        for i in range(5):
+            template.fill_slots(f"title{i}", str(i))
+            walked.fill_slots(f"title{i}", str(i))
+            other.fill_slots(f"title{i}", "other")
+        self.assertIs(template.slots, slots)
+        self.assertEqual(await render_html(template.root, self.state), await render_html(walked, self.state))
+        for path, node in slots.nodes.items():
+            self.assertIs(tags._node_at(template.root, path), node)
+        [body], [parsed_body] = template.root._children, template.template._children
+        for section, parsed_section in zip(body._children, parsed_body._children):
+            self.assertEqual(section._children[1:], parsed_section._children[1:])
+            for filler, parsed_filler in zip(section._children[1:], parsed_section._children[1:]):
+                self.assertIs(filler, parsed_filler)
+
+    def test_fills_keep_index(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_fills_keep_index())
+
+
+class TestPatterns(unittest.TestCase):
+    """Test pattern factories"""
+
+    def setUp(self):
+        self.state = {'accept': ['*/*']}
+
+    async def async_test_matches_search(self):
+        """Test that factories clone what searching the template does"""
+        template = Template(TEMPLATE_FILE).load()
+        self.assertEqual(list(template.patterns), ["person"])
+        self.assertIs(template.pattern("person"), template.pattern("person"))
+        cases = [{}, {"name": "Alice", "age": "3"}, {"name": all.b["Bob"], "color": ["x", all.i["y"]]}]
+        for slots in cases:
+            searched = template.template.clone_pat("person", **slots)
+            self.assertEqual(
+                await render_html(template.clone_pat("person", **slots), self.state),
+                await render_html(searched, self.state))
+
+        first = template.clone_pat("person", name="First")
+        template.clone_pat("person", name="Second")
+        self.assertIn(b"First", await render_html(first, self.state))
+        self.assertNotIn(b"First", await render_html(template.root, self.state))
+        with self.assertRaises(ValueError):
+            template.clone_pat("nothing")
+
+    def test_matches_search(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_matches_search())
+
+    def test_pattern_node_slots(self):
+        """Test slots and data-attr bound on the pattern node itself"""
+        factory = PatternFactory(all.li(**{"data-pat": "row", "data-attr": "class=kind"})[
+            all.span(**{"data-slot": "cell"})["empty"]])
+        row = factory(kind="odd", cell="x")
+        self.assertEqual(row.attributes["class"], "odd")
+        self.assertEqual(row.children[0].children, ["x"])
+        self.assertNotIn("class", factory.node.attributes)
+
+        cell = PatternFactory(all.td(**{"data-pat": "cell", "data-slot": "value"})["-"])
+        self.assertEqual(cell(value="1").children, ["1"])
+        self.assertIs(cell(value=all.th["h"]).tagname, "th")
+
+    async def async_test_clones_without_search(self):
+        """Test that clones come from the factory made at load, not from
+        searching the template"""
+        directory = tempfile.mkdtemp()
+        try:
+            template = Template(write_page(directory, 20, 10)).load()
+        finally:
+            shutil.rmtree(directory)
+        searched = [template.template.clone_pat("row", cell=str(i)) for i in range(3)]
+        # Nothing left to search
+        template.template._children = []
+        rows = [template.clone_pat("row", cell=str(i)) for i in range(3)]
+        for row, expected in zip(rows, searched):
+            self.assertEqual(await render_html(row, self.state), await render_html(expected, self.state))
+        self.assertEqual(template.pattern("row").node._children[0]._children, ["c"])
+
+    def test_clones_without_search(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_clones_without_search())
+
+
+class TestTemplateRegistry(unittest.TestCase):
+    """Test TemplateRegistry"""
+
+    def setUp(self):
+        self.state = {'accept': ['*/*']}
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, 'sub'))
+        self.filename = os.path.join(self.directory, 'page.html')
+        shutil.copy(TEMPLATE_FILE, self.filename)
+        shutil.copy(TEMPLATE_FILE, os.path.join(self.directory, 'sub', 'other.html'))
+        with open(os.path.join(self.directory, 'notes.txt'), 'w') as f:
+            f.write("not a template")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    async def async_test_shared(self):
+        """Test that instances share the parsed tree but fill their own root"""
+        registry = TemplateRegistry()
+        shared = registry.get(self.filename)
+        self.assertIs(registry.get(os.path.relpath(self.filename)), shared)
+        first = registry.instance(self.filename)
+        second = registry.instance(self.filename)
+        self.assertIs(first.template, shared.template)
+        self.assertIs(first.patterns, shared.patterns)
+        first.fill_slots("people", [first.clone_pat("person", name="Alice")])
+        second.fill_slots("name", "Bob")
+        self.assertIn(b"Alice", await render_html(first.root, self.state))
+        self.assertNotIn(b"Alice", await render_html(second.root, self.state))
+        self.assertNotIn(b"Alice", await render_html(shared.root, self.state))
+
+    def test_shared(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_shared())
+
+    def test_reload_on_change(self):
+        registry = TemplateRegistry()
+        template = registry.get(self.filename)
+        generation = template.generation
+        registry.get(self.filename)
+        self.assertEqual(template.generation, generation)
+
+        stat = os.stat(self.filename)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertIs(registry.get(self.filename), template)
+        self.assertEqual(template.generation, generation + 1)
+
+        unchecked = TemplateRegistry(check_mtime=False)
+        template = unchecked.get(self.filename)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+        unchecked.get(self.filename)
+        self.assertEqual(template.generation, 1)
+
+    def test_preload(self):
+        registry = TemplateRegistry()
+        loaded = registry.preload(self.directory)
+        self.assertEqual(
+            [t.filename for t in loaded],
+            [self.filename, os.path.join(self.directory, 'sub', 'other.html')])
+        self.assertEqual([t.loaded for t in loaded], [True, True])
+        self.assertIs(registry.get(self.filename), loaded[0])
+        registry.clear()
+        self.assertEqual(registry.templates, {})
+
+
+class TestTemplateCache(unittest.TestCase):
+    """Test the on-disk cache of parsed templates"""
+
+    def setUp(self):
+        self.state = {'accept': ['*/*']}
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'page.html')
+        shutil.copy(TEMPLATE_FILE, self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def digest(self):
+        with open(self.filename, 'rb') as f:
+            return tags.hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+    async def async_test_round_trip(self):
+        """Test that a cached template renders and fills like a parsed one"""
+        parsed = Template(self.filename).load()
+        Template(self.filename, cache=True).load()
+        path = template_cache_path(self.filename)
+        self.assertEqual(path, os.path.join(self.directory, '__templatecache__', 'page.html.stan'))
+        self.assertTrue(os.path.exists(path))
+        cached = Template(self.filename, cache=True).load()
+        self.assertEqual(repr(cached.template), repr(parsed.template))
+        self.assertEqual(cached.template_slots.refs, parsed.template_slots.refs)
+        self.assertEqual(list(cached.patterns), ["person"])
+        for template in (parsed, cached):
+            template.fill_slots("people", [template.clone_pat("person", name="Alice", age="3")])
+        self.assertEqual(
+            await render_html(cached.root, self.state), await render_html(parsed.root, self.state))
+
+    def test_round_trip(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_round_trip())
+
+    def test_hit_skips_parsing(self):
+        Template(self.filename, cache=True).load()
+        tags._write_template_cache(self.filename, self.digest(), (all.p["cached"], {}, {}))
+        self.assertEqual(Template(self.filename, cache=True).load().template.children, ["cached"])
+
+    def test_changed_source_is_parsed(self):
+        Template(self.filename, cache=True).load()
+        with open(self.filename, 'w') as f:
+            f.write("<html><body><p>changed</p></body></html>")
+        template = Template(self.filename, cache=True).load()
+        self.assertIn("changed", repr(template.template))
+        with open(template_cache_path(self.filename), 'wb') as f:
+            f.write(b"not marshal")
+        self.assertIn("changed", repr(Template(self.filename, cache=True).load().template))
+
+    def test_unwritable_cache(self):
+        with open(os.path.join(self.directory, '__templatecache__'), 'w') as f:
+            f.write("a file in the way")
+        template = Template(self.filename, cache=True).load()
+        self.assertEqual(list(template.patterns), ["person"])
+
+    async def async_test_cached_page(self):
+        """Test that a page loaded from the cache fills through its index,
+        without parsing or reindexing"""
+        filename = write_page(self.directory, 5, 3)
+        parsed = Template(filename, cache=True).load()
+        cached = Template(filename, cache=True).load()
+        self.assertIsNot(cached.template, parsed.template)
+        slots = cached.slots
+        for template in (parsed, cached):
+            template.fill_slots("title2", "two")
+            template.fill_slots("rows", [template.clone_pat("row", cell="x")])
+        self.assertIs(cached.slots, slots)
+        self.assertEqual(
+            await render_html(cached.root, self.state), await render_html(parsed.root, self.state))
+
+    def test_cached_page(self):
+        """Wrapper to run async test"""
+        asyncio.run(self.async_test_cached_page())
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main(exit=False)  # pragma: no cover
+    cov.stop()  # pragma: no cover
+    cov.save()  # pragma: no cover
+
+    # Print coverage report to the terminal
+    cov.report(show_missing=True)  # pragma: no cover
@@ -0,0 +1,130 @@
+import unittest
+from _typeshed import Incomplete
+from mumulib import producers as producers, tags as tags
+from mumulib.server import consumers_app as consumers_app
+from mumulib.tags import RenderCache as RenderCache, SlotIndex as SlotIndex, RenderPlan as RenderPlan, Template as Template, TemplateRegistry as TemplateRegistry, slots_key as slots_key, template_cache_path as template_cache_path, all as all, parse_data_attr as parse_data_attr, PatternFactory as PatternFactory, produce_html as produce_html, reindent_tree as reindent_tree
+
+cov: Incomplete
+TEMPLATE_FILE: Incomplete
+
+def build_tree(depth, width): ...
+def write_page(directory, slots, width): ...
+
+async def render_html(node, state): ...
+
+class TestParseDataAttr(unittest.TestCase):
+    def test_pairs(self) -> None: ...
+    def test_empty_entries_skipped(self) -> None: ...
+
+class TestRenderPlan(unittest.TestCase):
+    state: Incomplete
+    def setUp(self) -> None: ...
+    async def async_test_unfilled_template(self) -> None: ...
+    def test_unfilled_template(self) -> None: ...
+    async def async_test_filled_slots(self) -> None: ...
+    def test_filled_slots(self) -> None: ...
+    async def async_test_data_attr_and_dynamic_values(self): ...
+    def test_data_attr_and_dynamic_values(self) -> None: ...
+    async def async_test_void_slot(self) -> None: ...
+    def test_void_slot(self) -> None: ...
+    async def async_test_inserted_slots_not_refilled(self) -> None: ...
+    def test_inserted_slots_not_refilled(self) -> None: ...
+    async def async_test_produce(self) -> None: ...
+    def test_produce(self) -> None: ...
+
+class TestRenderCache(unittest.TestCase):
+    state: Incomplete
+    def setUp(self) -> None: ...
+    async def async_test_hits(self) -> None: ...
+    def test_hits(self) -> None: ...
+    async def async_test_uncacheable(self): ...
+    def test_uncacheable(self) -> None: ...
+    def test_slots_key(self) -> None: ...
+    def test_lru_bound(self) -> None: ...
+    async def async_test_file_change(self) -> None: ...
+    def test_file_change(self) -> None: ...
+
+class TestCopyOnWrite(unittest.TestCase):
+    state: Incomplete
+    def setUp(self) -> None: ...
+    async def async_test_copies_are_independent(self) -> None: ...
+    def test_copies_are_independent(self) -> None: ...
+    async def async_test_held_nodes_are_not_shared(self) -> None: ...
+    def test_held_nodes_are_not_shared(self) -> None: ...
+    async def async_test_layouts(self) -> None: ...
+    def test_layouts(self) -> None: ...
+    def test_fill_copies_only_changed_path(self) -> None: ...
+    def test_pattern_copies_share_unchanged_nodes(self) -> None: ...
+
+class TestCompactStan(unittest.TestCase):
+    state: Incomplete
+    def setUp(self) -> None: ...
+    def test_slots(self) -> None: ...
+    def test_interned_tag_names(self) -> None: ...
+    async def async_test_empty_shared(self) -> None: ...
+    def test_empty_shared(self) -> None: ...
+    def test_memory_per_node(self) -> None: ...
+
+class TestCompactHtml(unittest.TestCase):
+    state: Incomplete
+    def setUp(self) -> None: ...
+    async def async_test_produce_html(self) -> None: ...
+    def test_produce_html(self) -> None: ...
+    async def async_test_plan_matches_produce_html(self) -> None: ...
+    def test_plan_matches_produce_html(self) -> None: ...
+    async def async_test_render_cache(self) -> None: ...
+    def test_render_cache(self) -> None: ...
+    async def async_test_consumers_app(self): ...
+    def test_consumers_app(self) -> None: ...
+    async def async_test_smaller_output(self) -> None: ...
+    def test_smaller_output(self) -> None: ...
+
+class TestSlotIndex(unittest.TestCase):
+    state: Incomplete
+    def setUp(self) -> None: ...
+    def test_index(self) -> None: ...
+    async def async_test_matches_walking(self) -> None: ...
+    def test_matches_walking(self) -> None: ...
+    async def async_test_stale_index(self) -> None: ...
+    def test_stale_index(self) -> None: ...
+    async def async_test_new_slot_nodes(self) -> None: ...
+    def test_new_slot_nodes(self) -> None: ...
+    async def async_test_moved_attr_node(self) -> None: ...
+    def test_moved_attr_node(self) -> None: ...
+    async def async_test_fills_keep_index(self) -> None: ...
+    def test_fills_keep_index(self) -> None: ...
+
+class TestPatterns(unittest.TestCase):
+    state: Incomplete
+    def setUp(self) -> None: ...
+    async def async_test_matches_search(self) -> None: ...
+    def test_matches_search(self) -> None: ...
+    def test_pattern_node_slots(self) -> None: ...
+    async def async_test_clones_without_search(self) -> None: ...
+    def test_clones_without_search(self) -> None: ...
+
+class TestTemplateRegistry(unittest.TestCase):
+    state: Incomplete
+    directory: Incomplete
+    filename: Incomplete
+    def setUp(self) -> None: ...
+    def tearDown(self) -> None: ...
+    async def async_test_shared(self) -> None: ...
+    def test_shared(self) -> None: ...
+    def test_reload_on_change(self) -> None: ...
+    def test_preload(self) -> None: ...
+
+class TestTemplateCache(unittest.TestCase):
+    state: Incomplete
+    directory: Incomplete
+    filename: Incomplete
+    def setUp(self) -> None: ...
+    def tearDown(self) -> None: ...
+    def digest(self): ...
+    async def async_test_round_trip(self) -> None: ...
+    def test_round_trip(self) -> None: ...
+    def test_hit_skips_parsing(self) -> None: ...
+    def test_changed_source_is_parsed(self) -> None: ...
+    def test_unwritable_cache(self) -> None: ...
+    async def async_test_cached_page(self) -> None: ...
+    def test_cached_page(self) -> None: ...